@@ -0,0 +1,234 @@
+# census_helper_functions.py
+# AUTHOR: Jeff Brown
+#
+# A collection of functions used to retrieve Census data
+# (via the census library: https://github.com/CommerceDataService/census-wrapper)
+# in support of Demographic Data Analysis with Project 1
+
+# Dependencies
+import os
+import json
+import sqlite3
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+# Default location of the local cache of Census API results
+CENSUS_CACHE_FILE = "../Data/census_cache.sqlite"
+
+# Location of the library of Census variable aliases ('census_aliases')
+CENSUS_FIELD_LIBRARY_FILE = "../Raw Data/Census_Field_Library.py"
+
+# Seconds a connection to the cache waits for another process's write to finish
+CENSUS_CACHE_TIMEOUT = 60
+
+# Maximum number of variables the Census API accepts in a single request
+CENSUS_MAX_VARIABLES = 50
+
+# Census client (dataset) used for each 'api' in census_aliases
+CENSUS_API_DATASETS = { 'acs': 'acs5' }
+
+# Locks serializing the writes to each cache file within this process
+# (the requests of fetch_census_aliases() run on several threads at the same time)
+census_cache_locks = {}
+census_cache_locks_lock = threading.Lock()
+
+# Function to get the lock for writing to a cache file
+def census_cache_lock(a_cache_file):
+    with census_cache_locks_lock:
+        return census_cache_locks.setdefault( os.path.abspath(a_cache_file), threading.Lock() )
+
+# Function to open (and create if needed) the local cache of Census API results
+# The cache stores, for each (dataset, year, geography):
+#  - the list of geography ids ('census_geographies'), and
+#  - one row per variable ('census_columns') with the values of every geography in that order,
+#    so reading a variable for all ~33k ZCTAs is a single row read
+# Variables that have been fetched have a row (even with no data), so they are not fetched again
+# The cache uses write-ahead logging, so readers don't wait for writers
+def open_census_cache(a_cache_file=CENSUS_CACHE_FILE):
+    conn = sqlite3.connect(a_cache_file, timeout=CENSUS_CACHE_TIMEOUT)
+
+    conn.execute("PRAGMA journal_mode=WAL")
+
+    conn.execute("""CREATE TABLE IF NOT EXISTS census_geographies (
+                        dataset TEXT, year INTEGER, geography TEXT, geo_ids TEXT,
+                        PRIMARY KEY (dataset, year, geography) )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS census_columns (
+                        dataset TEXT, year INTEGER, geography TEXT, variable TEXT, vals TEXT,
+                        PRIMARY KEY (dataset, year, geography, variable) )""")
+    conn.commit()
+
+    return conn
+
+# Function to get the name of the field(s) the Census API uses to identify each row
+#  for a 'for' geography, e.g. 'zip code tabulation area:*' => ['zip code tabulation area']
+def geography_fields(a_geography):
+    return [ g.split(':')[0].strip() for g in a_geography.split(' in ')[0].split('&') ]
+
+# Function to add the API rows for newly fetched variables to the cache
+# The geography ids of the rows are lined up with the cached list (new geographies are added to the end)
+def store_census_columns(a_conn, a_key, a_variables, a_rows, a_geo_fields):
+    cached = a_conn.execute( "SELECT geo_ids FROM census_geographies WHERE dataset=? AND year=? AND geography=?",
+                             a_key ).fetchone()
+    geo_ids = json.loads(cached[0]) if cached is not None else []
+    position = { g: i for (i, g) in enumerate(geo_ids) }
+
+    row_pos = []
+    for r in a_rows:
+        geo_id = json.dumps( [ r.get(g) for g in a_geo_fields ] )
+        if geo_id not in position:
+            position[geo_id] = len(geo_ids)
+            geo_ids.append(geo_id)
+        row_pos.append( position[geo_id] )
+
+    columns = []
+    for v in a_variables:
+        vals = [None] * len(geo_ids)
+        for (pos, r) in zip(row_pos, a_rows):
+            vals[pos] = r.get(v)
+        columns.append( a_key + (v, json.dumps(vals)) )
+
+    a_conn.execute( "INSERT OR REPLACE INTO census_geographies VALUES (?,?,?,?)", a_key + (json.dumps(geo_ids),) )
+    a_conn.executemany( "INSERT OR REPLACE INTO census_columns VALUES (?,?,?,?,?)", columns )
+
+# Function to retrieve Census data, using the local cache where possible
+# This is a drop-in replacement for c.acs5.get(fields, {'for': geography}):
+#  only variables that are not already in the cache are requested from the Census API
+# Arguments:
+#    a_census: Census object, e.g. Census(api_key, year=2017)
+#    a_fields: list (or tuple) of Census variables, e.g. ("NAME", "B19013_001E")
+#    a_geography: 'for' geography, e.g. 'zip code tabulation area:*'
+#    dataset: Census dataset/client name on a_census, e.g. 'acs5'
+#    year: Census year (default: the year a_census was created with)
+#    cache_file: location of the cache
+# Returns: a list of dictionaries (one per geography) in the same format as c.acs5.get()
+def cached_census_get(a_census, a_fields, a_geography='zip code tabulation area:*',
+                      dataset='acs5', year=None, cache_file=CENSUS_CACHE_FILE):
+    client = getattr(a_census, dataset)
+    if year is None:
+        year = client.default_year
+
+    fields = list(dict.fromkeys(a_fields))
+    key = (dataset, int(year), a_geography)
+    geo_fields = geography_fields(a_geography)
+
+    conn = open_census_cache(cache_file)
+    try:
+        # Find the variables that have not been fetched yet
+        fetched = { v for (v,) in conn.execute(
+            "SELECT variable FROM census_columns WHERE dataset=? AND year=? AND geography=?", key ) }
+        missing = [ f for f in fields if f not in fetched ]
+
+        # Fetch only the missing variables and add them to the cache
+        # (one writer at a time: the list of geography ids is read, extended and written back)
+        if len(missing) > 0:
+            rows = client.get( tuple(missing), {'for': a_geography}, year=year )
+
+            with census_cache_lock(cache_file):
+                conn.execute("BEGIN IMMEDIATE")
+                store_census_columns(conn, key, missing, rows, geo_fields)
+                conn.commit()
+
+        # Read the requested variables back out of the cache
+        cached = conn.execute( "SELECT geo_ids FROM census_geographies WHERE dataset=? AND year=? AND geography=?",
+                               key ).fetchone()
+        marks = ",".join("?" * len(fields))
+        columns = { v: json.loads(vals) for (v, vals) in conn.execute(
+            f"""SELECT variable, vals FROM census_columns
+                WHERE dataset=? AND year=? AND geography=? AND variable IN ({marks})""", key + tuple(fields) ) }
+
+    finally:
+        conn.close()
+
+    if cached is None:
+        return []
+
+    # Variables first, then the geography field(s) - the same layout as the Census API rows
+    # (in order of the geography ids; values of geographies added after a variable was fetched are None)
+    geo_ids = json.loads(cached[0])
+    results = []
+    for i in sorted( range(len(geo_ids)), key=geo_ids.__getitem__ ):
+        row = { f: (columns[f][i] if i < len(columns[f]) else None) for f in fields }
+        row.update( zip(geo_fields, json.loads(geo_ids[i])) )
+        results.append(row)
+
+    return results
+
+# Function to load the 'census_aliases' dictionary
+#  (alias => {'api', 'variable', 'description', 'unit', ...}) from the field library
+def load_census_aliases(a_library_file=CENSUS_FIELD_LIBRARY_FILE):
+    spec = importlib.util.spec_from_file_location("Census_Field_Library", a_library_file)
+    library = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(library)
+
+    return library.census_aliases
+
+# Function to plan the Census API requests needed to retrieve a list of aliases
+# The variables are resolved through census_aliases, grouped by dataset,
+#  and packed into as few requests as the per-request variable limit allows
+# Arguments:
+#    a_alias_names: list of alias names, e.g. ['income', 'employment_unemployed']
+#    a_census_aliases: the census_aliases dictionary (see load_census_aliases)
+#    max_variables: maximum number of variables per request
+# Returns: a list of (dataset, tuple of variables) - one entry per request
+def plan_census_requests(a_alias_names, a_census_aliases, max_variables=CENSUS_MAX_VARIABLES):
+    # Resolve the aliases (raises KeyError for an unknown alias), dropping duplicate variables
+    dataset_vars = {}
+    for alias in a_alias_names:
+        a = a_census_aliases[alias]
+        variables = dataset_vars.setdefault( CENSUS_API_DATASETS[a['api']], [] )
+        if a['variable'] not in variables:
+            variables.append(a['variable'])
+
+    # Pack the variables for each dataset into requests
+    return [ (dataset, tuple(variables[i:i+max_variables]))
+             for (dataset, variables) in dataset_vars.items()
+             for i in range(0, len(variables), max_variables) ]
+
+# Function to retrieve a list of census_aliases for a geography as one wide dataframe
+# The planned requests (see plan_census_requests) are run concurrently,
+#  going through the local cache unless cache_file is None
+# Arguments:
+#    a_census: Census object, e.g. Census(api_key, year=2017)
+#    a_alias_names: list of alias names
+#    a_geography: 'for' geography, e.g. 'zip code tabulation area:*'
+#    year: Census year (default: the year a_census was created with)
+#    census_aliases: the census_aliases dictionary (default: loaded from the field library)
+#    max_workers: maximum number of requests in flight at the same time
+#    cache_file: location of the cache (None = don't use the cache)
+# Returns: a dataframe with the geography field(s) and one column per alias
+def fetch_census_aliases(a_census, a_alias_names, a_geography='zip code tabulation area:*', year=None,
+                         census_aliases=None, max_workers=4, cache_file=CENSUS_CACHE_FILE):
+    if census_aliases is None:
+        census_aliases = load_census_aliases()
+
+    requests_plan = plan_census_requests(a_alias_names, census_aliases)
+    geo_fields = geography_fields(a_geography)
+
+    # Function to run one planned request
+    def run_request(a_request):
+        (dataset, variables) = a_request
+
+        if cache_file is None:
+            client = getattr(a_census, dataset)
+            return client.get( variables, {'for': a_geography}, year=(client.default_year if year is None else year) )
+
+        return cached_census_get( a_census, variables, a_geography, dataset=dataset, year=year, cache_file=cache_file )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        responses = list( executor.map(run_request, requests_plan) )
+
+    # Join the responses on the geography field(s)
+    census_df = None
+    for rows in responses:
+        response_df = pd.DataFrame(rows)
+        census_df = response_df if census_df is None else census_df.merge(response_df, on=geo_fields, how='outer')
+
+    if census_df is None:
+        return pd.DataFrame(columns=geo_fields + list(a_alias_names))
+
+    # Name the columns with the aliases
+    alias_columns = { alias: census_df[census_aliases[alias]['variable']] for alias in a_alias_names }
+
+    return pd.concat( [census_df[geo_fields], pd.DataFrame(alias_columns)], axis=1 )
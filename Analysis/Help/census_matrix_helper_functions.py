@@ -0,0 +1,268 @@
+# census_matrix_helper_functions.py
+# AUTHOR: Jeff Brown
+#
+# A collection of functions used to store the Census data of the Demographic Data Analysis
+# as one table of Chicago zipcode x feature (float32, missing values are NaN),
+# instead of the eight census_<topic>.csv files (each with its own copy of 'Area' and 'success_count')
+#
+# Feature columns are named f"{topic} {column}" (e.g. 'education_level Grad_Degree_P');
+# the rows are the zipcodes of the Chicago zipcode table, in zip_key order (see geography_helper_functions)
+
+# Dependencies
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scipy import stats
+
+from Help.census_helper_functions import CENSUS_MAX_VARIABLES, cached_census_get
+from Help.geography_helper_functions import (ZIP_KEY_COLUMN, MISSING_ZIP_KEY, load_geography, zip_keys,
+                                             add_geography, count_by_zip_key)
+
+# Location of the zipcode x feature table
+CENSUS_MATRIX_FILE = "../Data/Census_Matrix.parquet"
+
+# Name of the column with the number of successful restaurants in each zipcode,
+# where a successful restaurant is rated SUCCESS_RATING or better
+SUCCESS_COLUMN = 'success_count'
+SUCCESS_RATING = 4
+
+# Census topics (2017 ACS5), with
+#    'variables': column => Census variable
+#    'total': column each of the other columns is a share of ('_P' columns are added as percentages of it);
+#             if the column is not a Census variable, it is the sum of the other columns
+#    'rates': (optional) column => (numerator column, denominator column), added as percentages
+CENSUS_TOPICS = {
+    'general': {
+        'variables': { 'Population': 'B01003_001E', 'Median Age': 'B01002_001E',
+                       'Median Household Income': 'B19013_001E', 'Per Capita Income': 'B19301_001E',
+                       'Poverty Count': 'B17001_002E' },
+        'total': None,
+        'rates': { 'Poverty Rate': ('Poverty Count', 'Population') } },
+    'race': {
+        'variables': { 'Total': 'B02001_001E', 'White': 'B02001_002E', 'Black': 'B02001_003E',
+                       'Native American': 'B02001_004E', 'Asian': 'B02001_005E',
+                       'Pacific Islander': 'B02001_006E', 'Other': 'B02001_007E' },
+        'total': 'Total' },
+    'education_level': {
+        'variables': { 'Total': 'B06009_001E', 'Less_than_HS': 'B06009_002E', 'High_School': 'B06009_003E',
+                       'Some_College': 'B06009_004E', 'Bachelor_Degree': 'B06009_005E',
+                       'Grad_Degree': 'B06009_006E' },
+        'total': 'Total' },
+    'marital_status': {
+        'variables': { 'Total': 'B06008_001E', 'Never Married': 'B06008_002E', 'Married': 'B06008_003E',
+                       'Divorced': 'B06008_004E', 'Separated': 'B06008_005E', 'Widowed': 'B06008_006E' },
+        'total': 'Total' },
+    'mortgage': {
+        'variables': { 'Total': 'B25098_002E', '< 10K': 'B25098_003E', '< 25K': 'B25098_004E',
+                       '< 35K': 'B25098_005E', '< 50K': 'B25098_006E', '< 75K': 'B25098_007E',
+                       '< 100K': 'B25098_008E', '< 150K': 'B25098_009E', '> 150K': 'B25098_010E' },
+        'total': 'Total' },
+    'household_size': {
+        'variables': { '1 Person': 'B08201_007E', '2 People': 'B08201_013E', '3 People': 'B08201_019E',
+                       '4 or More People': 'B08201_025E' },
+        'total': 'Total' },
+    'under_18': {
+        'variables': { 'Total': 'B09001_001E', 'In Households': 'B09001_002E', 'Under 3': 'B09001_003E',
+                       '3-4': 'B09001_004E', '5': 'B09001_005E', '6-8': 'B09001_006E', '9-11': 'B09001_007E',
+                       '12-14': 'B09001_008E', '15-17': 'B09001_009E', 'In Group Homes': 'B09001_010E' },
+        'total': 'Total' },
+    'work_transport': {
+        'variables': { 'Total': 'B08006_001E', 'Car Truck Van': 'B08006_002E', 'Drove Alone': 'B08006_003E',
+                       'Carpool': 'B08006_004E', 'Carpool 2 People': 'B08006_005E',
+                       'Carpool 3 People': 'B08006_006E', 'Carpool 4 or more': 'B08006_007E',
+                       'Public Transportation': 'B08006_008E', 'Bus': 'B08006_009E', 'Streetcar': 'B08006_010E',
+                       'Subway or El': 'B08006_011E', 'Railroad': 'B08006_012E', 'Ferryboat': 'B08006_013E',
+                       'Bicycle': 'B08006_014E', 'Walk': 'B08006_015E', 'Taxi Motorcycle Other': 'B08006_016E',
+                       'Work from Home': 'B08006_017E' },
+        'total': 'Total' },
+}
+
+# Location of the per-topic files written by demographic_data_analysis.ipynb
+CENSUS_TOPIC_FILES = { topic: f"../Data/census_{topic}.csv" for topic in CENSUS_TOPICS }
+
+# Function to get the name of a feature column
+def feature_column(a_topic, a_column):
+    return f"{a_topic} {a_column}"
+
+# Function to list the count columns of every topic (the Census variables, plus the summed totals)
+# Returns: list of (topic, column) in table order
+def census_count_columns(a_topics=CENSUS_TOPICS):
+    columns = []
+    for (topic, spec) in a_topics.items():
+        columns.extend( (topic, c) for c in spec['variables'] )
+        if spec['total'] is not None and spec['total'] not in spec['variables']:
+            columns.append( (topic, spec['total']) )
+
+    return columns
+
+# Function to list the percentage columns of every topic
+# Returns: list of (topic, column, numerator column, denominator column) in table order
+def census_percent_columns(a_topics=CENSUS_TOPICS):
+    columns = []
+    for (topic, spec) in a_topics.items():
+        columns.extend( (topic, c, num, den) for (c, (num, den)) in spec.get('rates', {}).items() )
+        if spec['total'] is not None:
+            columns.extend( (topic, f"{c}_P", c, spec['total']) for c in spec['variables'] if c != spec['total'] )
+
+    return columns
+
+# Function to build the zipcode x feature table from the counts of every topic
+# The summed totals and every percentage column (of every topic) are computed with single array operations
+# Arguments:
+#    a_counts: float array (zipcodes x census_count_columns()) of counts, NaN where missing
+#              (the summed total columns are filled in here)
+#    a_success_counts: number of successful restaurants in each zipcode
+#    a_geography_df: the Chicago zipcode table (rows of a_counts are in its zip_key order)
+# Returns: dataframe of 'zip_key', 'success_count' and the feature columns (float32)
+def build_census_matrix(a_counts, a_success_counts, a_geography_df, a_topics=CENSUS_TOPICS):
+    count_columns = census_count_columns(a_topics)
+    position = { c: i for (i, c) in enumerate(count_columns) }
+    counts = np.asarray(a_counts, dtype=np.float64)
+
+    # Summed totals (NaN if any of the parts is missing)
+    for (topic, spec) in a_topics.items():
+        if spec['total'] is not None and spec['total'] not in spec['variables']:
+            parts = [ position[(topic, c)] for c in spec['variables'] ]
+            counts[:, position[(topic, spec['total'])]] = counts[:, parts].sum(axis=1)
+
+    # Percentages of every topic at once (NaN where the denominator is missing or 0)
+    percent_columns = census_percent_columns(a_topics)
+    num = [ position[(topic, n)] for (topic, _, n, _) in percent_columns ]
+    den = [ position[(topic, d)] for (topic, _, _, d) in percent_columns ]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percents = 100 * counts[:, num] / counts[:, den]
+    percents[ ~np.isfinite(percents) ] = np.nan
+
+    names = [ feature_column(t, c) for (t, c) in count_columns ] + \
+            [ feature_column(t, c) for (t, c, _, _) in percent_columns ]
+    features = np.hstack( (counts, percents) ).astype(np.float32)
+
+    matrix_df = pd.DataFrame( features, columns=names )
+    matrix_df.insert( 0, SUCCESS_COLUMN, np.asarray(a_success_counts, dtype=np.float32) )
+    matrix_df.insert( 0, ZIP_KEY_COLUMN, a_geography_df[ZIP_KEY_COLUMN].to_numpy() )
+
+    return matrix_df
+
+# Function to get the number of successful restaurants in each zipcode (in zip_key order)
+# a_yelp_df: Yelp restaurants with 'zip_key' and 'rating' columns (e.g. load_dataset('yelp_chicago'))
+def success_counts(a_yelp_df, a_geography_df, success_rating=SUCCESS_RATING):
+    return count_by_zip_key( a_yelp_df.loc[ a_yelp_df['rating'] >= success_rating ], a_geography_df ).to_numpy()
+
+# Function to get the counts of every topic from the per-topic files written by demographic_data_analysis.ipynb
+# Each file's rows are placed by zip_key (zipcodes missing from a file are NaN)
+# Returns: float array (zipcodes x census_count_columns())
+def counts_from_topic_files(a_geography_df, a_topic_files=CENSUS_TOPIC_FILES, a_topics=CENSUS_TOPICS):
+    count_columns = census_count_columns(a_topics)
+    counts = np.full( (len(a_geography_df), len(count_columns)), np.nan )
+
+    for (topic, file) in a_topic_files.items():
+        topic_df = pd.read_csv(file, dtype={'Zipcode': str})
+        keys = zip_keys(topic_df['Zipcode'], a_geography_df)
+        in_table = keys != MISSING_ZIP_KEY
+
+        for (i, (t, c)) in enumerate(count_columns):
+            if t == topic and c in topic_df.columns:
+                counts[keys[in_table], i] = topic_df[c].to_numpy(dtype=np.float64)[in_table]
+
+    return counts
+
+# Function to get the counts of every topic from the Census API in one pass
+# Every topic's variables are requested together (CENSUS_MAX_VARIABLES per request, through the local cache)
+# Arguments:
+#    a_census: Census object, e.g. Census(api_key, year=2017)
+#    a_geography_df: the Chicago zipcode table
+#    cache_file: location of the cache (see cached_census_get)
+# Returns: float array (zipcodes x census_count_columns())
+def counts_from_census(a_census, a_geography_df, a_topics=CENSUS_TOPICS, **kwargs):
+    count_columns = census_count_columns(a_topics)
+    variables = list(dict.fromkeys( v for spec in a_topics.values() for v in spec['variables'].values() ))
+    counts = np.full( (len(a_geography_df), len(count_columns)), np.nan )
+
+    for i in range(0, len(variables), CENSUS_MAX_VARIABLES):
+        rows_df = pd.DataFrame( cached_census_get( a_census, variables[i:i+CENSUS_MAX_VARIABLES],
+                                                   'zip code tabulation area:*', **kwargs ) )
+        keys = zip_keys(rows_df['zip code tabulation area'], a_geography_df)
+        in_table = keys != MISSING_ZIP_KEY
+
+        for (j, (topic, c)) in enumerate(count_columns):
+            v = a_topics[topic]['variables'].get(c)
+            if v in rows_df.columns:
+                # The Census API uses large negative values for missing estimates
+                values = pd.to_numeric(rows_df[v], errors='coerce').to_numpy(dtype=np.float64)
+                counts[keys[in_table], j] = np.where( values[in_table] < 0, np.nan, values[in_table] )
+
+    return counts
+
+# Function to save the zipcode x feature table as a Parquet file
+def save_census_matrix(a_matrix_df, a_matrix_file=CENSUS_MATRIX_FILE):
+    pq.write_table( pa.Table.from_pandas(a_matrix_df, preserve_index=False), a_matrix_file )
+
+    return a_matrix_file
+
+# Function to load the zipcode x feature table
+# Only the columns requested are read from the Parquet file
+# Arguments:
+#    columns: list of feature columns to load (e.g. ['education_level Grad_Degree_P'])
+#    topics: list of topics whose feature columns are loaded (e.g. ['race', 'general'])
+#            (default, with no columns or topics: every column)
+#    geography_columns: columns of the Chicago zipcode table to add (e.g. ['Zipcode', 'Area'])
+# Returns: dataframe of 'zip_key', 'success_count', the geography columns and the feature columns
+def load_census_matrix(columns=None, topics=None, geography_columns=['Zipcode', 'Area'],
+                       matrix_file=CENSUS_MATRIX_FILE):
+    read_columns = None
+    if columns is not None or topics is not None:
+        names = pq.read_schema(matrix_file).names
+        selected = list(columns or []) + [ c for t in (topics or []) for c in names
+                                           if c.startswith(f"{t} ") and c not in (columns or []) ]
+        read_columns = [ZIP_KEY_COLUMN, SUCCESS_COLUMN] + selected
+
+    matrix_df = pq.read_table(matrix_file, columns=read_columns, memory_map=True).to_pandas()
+
+    if len(geography_columns) == 0:
+        return matrix_df
+
+    geo_df = add_geography( matrix_df[[ZIP_KEY_COLUMN]], load_geography(), columns=geography_columns )
+
+    return pd.concat( [ matrix_df[[ZIP_KEY_COLUMN, SUCCESS_COLUMN]], geo_df[geography_columns],
+                        matrix_df.drop(columns=[ZIP_KEY_COLUMN, SUCCESS_COLUMN]) ], axis=1 )
+
+# Function to correlate every feature column with one column (by default, the success count)
+# Computed for all of the columns at once; each column uses the zipcodes where both values are present
+# Arguments:
+#    a_matrix_df: zipcode x feature table (see load_census_matrix)
+#    columns: feature columns to correlate (default: every float column other than x_column)
+#    x_column: column the features are correlated with
+# Returns: dataframe with one row per column: 'Slope', 'Intercept', 'R-Value', 'p-Value', 'Count'
+#          (the same values as scipy.stats.linregress(x, column))
+def census_correlations(a_matrix_df, columns=None, x_column=SUCCESS_COLUMN):
+    if columns is None:
+        columns = [ c for c in a_matrix_df.select_dtypes('floating').columns if c != x_column ]
+
+    x = a_matrix_df[x_column].to_numpy(dtype=np.float64)[:, None]
+    y = a_matrix_df[columns].to_numpy(dtype=np.float64)
+    present = ~np.isnan(y) & ~np.isnan(x)
+
+    n = present.sum(axis=0)
+    xm = np.where(present, x, 0.0)
+    ym = np.where(present, y, 0.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_dev = np.where( present, xm - xm.sum(axis=0) / n, 0.0 )
+        y_dev = np.where( present, ym - ym.sum(axis=0) / n, 0.0 )
+        sxx = (x_dev ** 2).sum(axis=0)
+        syy = (y_dev ** 2).sum(axis=0)
+        sxy = (x_dev * y_dev).sum(axis=0)
+
+        slope = sxy / sxx
+        intercept = ym.sum(axis=0) / n - slope * xm.sum(axis=0) / n
+        r = np.clip( sxy / np.sqrt(sxx * syy), -1.0, 1.0 )
+
+        # Two-sided p-value of the t statistic with n - 2 degrees of freedom
+        df = n - 2
+        t = r * np.sqrt( df / ((1.0 - r) * (1.0 + r)) )
+        p = 2 * stats.t.sf( np.abs(t), np.maximum(df, 1) )
+    p[ df < 1 ] = np.nan
+
+    return pd.DataFrame({ 'Slope': slope, 'Intercept': intercept, 'R-Value': r, 'p-Value': p, 'Count': n },
+                        index=pd.Index(columns, name='Feature'))
@@ -0,0 +1,159 @@
+# chart_helper_functions.py
+# AUTHOR: Jeff Brown
+#
+# A batch renderer for the Project 1 charts:
+# renders a manifest of chart specs (gen_bar_plot / gen_scatter_plot 'plot_dict's)
+# without displaying them, across a pool of processes, re-rendering only the charts
+# whose data or spec has changed since they were last saved
+#
+# Usage (from the Analysis directory):
+#    python -m Help.chart_helper_functions chart_manifest.py
+#    python -m Help.chart_helper_functions chart_manifest.py --force --workers 8
+#  where chart_manifest.py defines a list 'chart_manifest' (see render_charts)
+
+# Dependencies
+import os
+import sys
+import json
+import hashlib
+import argparse
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from Help.transport_helper_functions import (gen_bar_plot, gen_bar_template, gen_scatter_plot)
+from Help.file_helper_functions import file_hash
+
+# Default location of the file recording the spec hash of each chart that was rendered
+CHART_STATE_FILE = "../Chart/.render_state.json"
+
+# Function used to render each type of chart
+CHART_FUNCTIONS = { 'bar': gen_bar_plot,
+                    'scatter': gen_scatter_plot }
+
+# Function to add a value from a plot_dict to a hash
+# Dataframes, Series and arrays are hashed by content, everything else by its repr()
+def update_spec_hash(a_hash, a_value):
+    if isinstance(a_value, (pd.DataFrame, pd.Series)):
+        columns = list(a_value.columns) if isinstance(a_value, pd.DataFrame) else [a_value.name]
+        a_hash.update( repr( (type(a_value).__name__, a_value.shape, columns) ).encode() )
+        a_hash.update( pd.util.hash_pandas_object(a_value, index=True).to_numpy().tobytes() )
+    elif isinstance(a_value, np.ndarray):
+        a_hash.update( repr( (a_value.dtype.str, a_value.shape) ).encode() )
+        a_hash.update( np.ascontiguousarray(a_value).tobytes() )
+    elif isinstance(a_value, dict):
+        for key in sorted(a_value):
+            a_hash.update( repr(key).encode() )
+            update_spec_hash(a_hash, a_value[key])
+    elif isinstance(a_value, (list, tuple)):
+        a_hash.update( f"{type(a_value).__name__}:{len(a_value)}".encode() )
+        for v in a_value:
+            update_spec_hash(a_hash, v)
+    else:
+        a_hash.update( repr(a_value).encode() )
+
+# Function to calculate the hash of a chart spec:
+#  the chart type, the plot_dict (including its data) and the contents of its input files
+def chart_spec_hash(a_spec, a_hash_cache=None):
+    h = hashlib.sha256()
+    h.update( a_spec['plot'].encode() )
+    update_spec_hash( h, a_spec['plot_dict'] )
+    for i in a_spec.get('inputs', []):
+        h.update( file_hash(i, a_hash_cache).encode() )
+
+    return h.hexdigest()
+
+# Bar chart template of each rendering process (see gen_bar_template)
+worker_bar_template = None
+
+# Function to set up each rendering process: draw with the (headless) Agg backend
+def init_render_worker():
+    plt.switch_backend('Agg')
+
+# Function to render one chart spec, without displaying it
+# Bar charts are all drawn on the process's bar chart template (gen_bar_plot clears the previous chart,
+#  so each saves the same image as a fresh figure); other charts are closed once saved
+# Returns: the file the chart was saved to
+def render_chart(a_spec):
+    global worker_bar_template
+
+    plot_dict = dict(a_spec['plot_dict'], show=False)
+
+    if a_spec['plot'] == 'bar':
+        if worker_bar_template is None:
+            worker_bar_template = gen_bar_template()
+        gen_bar_plot(plot_dict, worker_bar_template)
+    else:
+        plt.close( CHART_FUNCTIONS[a_spec['plot']](plot_dict) )
+
+    return plot_dict['save_file']
+
+# Function to render a manifest of charts, re-rendering only the charts that are out of date
+# Arguments:
+#    a_manifest: list of chart specs, each a dictionary with
+#       'plot': type of chart ('bar' or 'scatter')
+#       'plot_dict': the argument for gen_bar_plot() / gen_scatter_plot() (including 'save_file')
+#       'inputs': (optional) list of files the chart's data was read from
+#    state_file: file recording the spec hash of each chart from the last render
+#    max_workers: number of processes used to render the charts (default: number of CPUs)
+#    force: if True, re-render every chart
+# Returns: dictionary of save file => 'rendered' or 'up to date'
+def render_charts(a_manifest, state_file=CHART_STATE_FILE, max_workers=None, force=False):
+    state = {'charts': {}, 'files': {}}
+    if os.path.exists(state_file):
+        with open(state_file) as f:
+            state = json.load(f)
+
+    results = {}
+    todo = []
+    for spec in a_manifest:
+        save_file = spec['plot_dict']['save_file']
+        spec_hash = chart_spec_hash(spec, state['files'])
+
+        if not force and state['charts'].get(save_file) == spec_hash and os.path.exists(save_file):
+            results[save_file] = 'up to date'
+        else:
+            todo.append( (spec, spec_hash) )
+
+    # Render the out of date charts in parallel
+    if len(todo) > 0:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_render_worker) as executor:
+            for ((spec, spec_hash), save_file) in zip(todo, executor.map(render_chart, [ s for (s, _) in todo ])):
+                state['charts'][save_file] = spec_hash
+                results[save_file] = 'rendered'
+
+        with open(state_file, "w") as f:
+            json.dump(state, f, indent=1)
+
+    return results
+
+# Function to load the list 'chart_manifest' from a Python file
+def load_chart_manifest(a_manifest_file):
+    spec = importlib.util.spec_from_file_location("chart_manifest", a_manifest_file)
+    manifest = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(manifest)
+
+    return manifest.chart_manifest
+
+# Command line entry point
+def main(a_argv=None):
+    parser = argparse.ArgumentParser(description="Render Project 1 charts (run from the Analysis directory)")
+    parser.add_argument("manifests", nargs="+", help="Python files that define a list 'chart_manifest'")
+    parser.add_argument("--force", action="store_true", help="re-render charts even if they are up to date")
+    parser.add_argument("--workers", type=int, default=None, help="number of rendering processes")
+    parser.add_argument("--state-file", default=CHART_STATE_FILE)
+    args = parser.parse_args(a_argv)
+
+    plt.switch_backend('Agg')
+
+    manifest = [ spec for m in args.manifests for spec in load_chart_manifest(m) ]
+    results = render_charts(manifest, state_file=args.state_file, max_workers=args.workers, force=args.force)
+    for (save_file, result) in sorted(results.items()):
+        print(f"{save_file}: {result}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+# dataset_helper_functions.py
+# AUTHOR: Jeff Brown
+#
+# A collection of functions used to store and load the Project 1 datasets
+# as typed, columnar Parquet files (via pyarrow) instead of re-parsing the CSVs in Data/
+
+# Dependencies
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from Help.grid_helper_functions import stamp_grid_cells
+from Help.geography_helper_functions import load_geography, stamp_zip_keys
+
+# Location of the datasets
+DATA_DIR = "../Data"
+
+# Schema used for the census topic tables (every other column is float32)
+CENSUS_SCHEMA = { 'Zipcode': 'zip', 'Area': 'category', '*': 'float32' }
+
+# Schema used for the Yelp restaurant tables
+YELP_SCHEMA = { 'zip': 'zip', 'city': 'category', 'state': 'category', 'name': 'string',
+                'price': 'price', 'rating': 'float32', 'review_count': 'int32', 'type': 'category',
+                'latitude': 'float64', 'longitude': 'float64' }
+
+# Location columns of the Yelp restaurant tables
+YELP_GRID = ('latitude', 'longitude')
+
+# Datasets that can be loaded with load_dataset(), with
+#    'csv': CSV file (in DATA_DIR) the dataset was originally saved as
+#    'schema': column => type, where the types are:
+#       'zip': zipcode (5 character string) stored as a category
+#       'price': Yelp price tier ("$" to "$$$$") stored as a small int (1 to 4)
+#       'date': date (mm/dd/yyyy)
+#       'int8', 'int16', 'int32': integer (stored as nullable 'Int..' if the column has missing values)
+#       or any numpy/pandas dtype ('float32', 'int8', 'category', 'string', ...)
+#      The '*' entry (if any) is used for columns not listed in the schema
+#    'grid': (optional) (latitude column, longitude column) of datasets with a location per row;
+#            the grid cell id of each row is stored in the column GRID_CELL_COLUMN (see grid_helper_functions)
+#    'zip_key': (optional) zipcode column of datasets with a zipcode per row; the key of the zipcode in the
+#               Chicago zipcode table is stored in the column ZIP_KEY_COLUMN (see geography_helper_functions)
+DATASETS = {
+    'cta_stops': {
+        'csv': 'chicago_cta_stops.csv',
+        'schema': { 'stop_id': 'int32', 'stop_code': 'Int32', 'stop_name': 'string', 'stop_desc': 'string',
+                    'stop_lat': 'float32', 'stop_lon': 'float32', 'location_type': 'int8',
+                    'parent_station': 'Int32', 'wheelchair_boarding': 'int8', 'postal_code': 'zip' },
+        'grid': ('stop_lat', 'stop_lon'), 'zip_key': 'postal_code' },
+    'yelp_chicago': { 'csv': 'Yelp_Restaurants_Chicago.csv', 'schema': YELP_SCHEMA, 'grid': YELP_GRID,
+                      'zip_key': 'zip' },
+    'yelp_new_york': { 'csv': 'Yelp_Restaurants_New_York.csv', 'schema': YELP_SCHEMA, 'grid': YELP_GRID },
+    'yelp_license_merge': {
+        'csv': 'Yelp_License_Merge.csv',
+        'schema': dict( YELP_SCHEMA, Select_Dist='float32', Select_Name='string', Name_Corr='float32',
+                        Year_Issued='int16', First_Date_Issued='date', Last_Date_Issued='date' ),
+        'grid': YELP_GRID, 'zip_key': 'zip' },
+    'merged_restaurants_and_cta_stops': {
+        'csv': 'merged_restaurants_and_CTA_stops.csv',
+        'schema': { 'zip': 'zip', 'Total Restaurants': 'int32', 'Total Reviews': 'int32',
+                    'Latitude': 'float32', 'Longitude': 'float32', '*': 'float32' },
+        'zip_key': 'zip' },
+    'zipcode_to_area_map': { 'csv': 'zipcode_to_area_map.csv', 'schema': { 'Zipcode': 'zip', 'Area': 'category' },
+                             'zip_key': 'Zipcode' },
+    'zip_income': {
+        'csv': 'chicago_zip_income_1.csv',
+        'schema': { 'ZIP CODE': 'zip', 'LICENSES 2015': 'int32', 'LICENSES 2002-18': 'int32',
+                    'HOUSEHOLD INCOME': 'int32' },
+        'zip_key': 'ZIP CODE' },
+    'census_general': { 'csv': 'census_general.csv', 'schema': CENSUS_SCHEMA, 'zip_key': 'Zipcode' },
+    'census_race': { 'csv': 'census_race.csv', 'schema': CENSUS_SCHEMA, 'zip_key': 'Zipcode' },
+    'census_education_level': { 'csv': 'census_education_level.csv', 'schema': CENSUS_SCHEMA, 'zip_key': 'Zipcode' },
+    'census_marital_status': { 'csv': 'census_marital_status.csv', 'schema': CENSUS_SCHEMA, 'zip_key': 'Zipcode' },
+    'census_mortgage': { 'csv': 'census_mortgage.csv', 'schema': CENSUS_SCHEMA, 'zip_key': 'Zipcode' },
+    'census_household_size': { 'csv': 'census_household_size.csv', 'schema': CENSUS_SCHEMA, 'zip_key': 'Zipcode' },
+    'census_under_18': { 'csv': 'census_under_18.csv', 'schema': CENSUS_SCHEMA, 'zip_key': 'Zipcode' },
+    'census_work_transport': { 'csv': 'census_work_transport.csv', 'schema': CENSUS_SCHEMA, 'zip_key': 'Zipcode' },
+}
+
+# Function to get the location of the CSV and Parquet files for a dataset
+def dataset_files(a_name, data_dir=DATA_DIR):
+    csv_file = os.path.join(data_dir, DATASETS[a_name]['csv'])
+
+    return csv_file, os.path.splitext(csv_file)[0] + ".parquet"
+
+# Function to convert one column of a dataframe to a schema type (see DATASETS)
+def convert_column(a_series, a_type):
+    if a_type == 'zip':
+        # e.g. 60601, 60601.0 and "60601" are all the same zipcode
+        zips = a_series.astype(str).str.replace(r"\.0$", "", regex=True).str.zfill(5)
+        return zips.where( a_series.notna() ).astype('category')
+
+    if a_type == 'price':
+        # Already converted (e.g. a dataframe loaded from the dataset)
+        if pd.api.types.is_integer_dtype(a_series):
+            return a_series.astype('int8')
+        return a_series.fillna("").astype(str).str.count(r"\$").astype('int8')
+
+    if a_type == 'date':
+        return pd.to_datetime(a_series, format="%m/%d/%Y", errors='coerce')
+
+    # Integer columns with missing values use the nullable integer type (e.g. 'int32' => 'Int32')
+    if a_type.startswith('int') and a_series.isna().any():
+        a_type = a_type.capitalize()
+
+    return a_series.astype(a_type)
+
+# Function to convert the columns of a dataframe to the types in a schema (see DATASETS)
+def apply_schema(a_df, a_schema):
+    typed_df = a_df.copy()
+
+    for c in typed_df.columns:
+        c_type = a_schema.get(c, a_schema.get('*'))
+        if c_type is not None:
+            typed_df[c] = convert_column(typed_df[c], c_type)
+
+    return typed_df
+
+# Function to convert a dataframe to a dataset's schema, adding the grid cell ids if the dataset has a location
+# and the zipcode keys if the dataset has a zipcode
+def apply_dataset_schema(a_df, a_name):
+    typed_df = apply_schema(a_df, DATASETS[a_name]['schema'])
+
+    if 'grid' in DATASETS[a_name]:
+        stamp_grid_cells(typed_df, *DATASETS[a_name]['grid'])
+
+    if 'zip_key' in DATASETS[a_name]:
+        stamp_zip_keys(typed_df, DATASETS[a_name]['zip_key'], load_geography())
+
+    return typed_df
+
+# Function to read the original CSV file for a dataset, as is (no schema applied)
+# Note: Some of the CSVs have a byte order mark (BOM) before the header, which is removed
+def read_csv_file(a_name, data_dir=DATA_DIR):
+    csv_file, _ = dataset_files(a_name, data_dir)
+
+    return pd.read_csv(csv_file, encoding="utf-8-sig")
+
+# Function to read the original CSV file for a dataset and apply its schema
+def read_csv_dataset(a_name, data_dir=DATA_DIR):
+    return apply_dataset_schema( read_csv_file(a_name, data_dir), a_name )
+
+# Function to save a dataframe as a dataset (Parquet file) using the dataset's schema
+def save_dataset(a_df, a_name, data_dir=DATA_DIR):
+    _, parquet_file = dataset_files(a_name, data_dir)
+
+    table = pa.Table.from_pandas( apply_dataset_schema(a_df, a_name), preserve_index=False )
+    pq.write_table(table, parquet_file)
+
+    return parquet_file
+
+# Function to (re)build the Parquet file for each dataset from its CSV file
+# a_names: list of datasets to convert (default: all of the datasets in DATASETS)
+def convert_csv_datasets(a_names=None, data_dir=DATA_DIR):
+    if a_names is None:
+        a_names = list(DATASETS.keys())
+
+    # save_dataset() applies the schema (once)
+    return [ save_dataset( read_csv_file(n, data_dir), n, data_dir ) for n in a_names ]
+
+# Function to load a dataset
+# The Parquet file is memory-mapped and only the columns requested are read
+# If the Parquet file doesn't exist yet (or is older than the CSV), it is built from the CSV first
+# Arguments:
+#    a_name: name of the dataset (see DATASETS)
+#    columns: list of columns to load (default: all columns)
+#    as_arrow: if True, return the pyarrow Table instead of a dataframe
+def load_dataset(a_name, columns=None, as_arrow=False, data_dir=DATA_DIR):
+    csv_file, parquet_file = dataset_files(a_name, data_dir)
+
+    if ( not os.path.exists(parquet_file) or
+         (os.path.exists(csv_file) and os.path.getmtime(csv_file) > os.path.getmtime(parquet_file)) ):
+        convert_csv_datasets([a_name], data_dir)
+
+    table = pq.read_table(parquet_file, columns=columns, memory_map=True)
+
+    if as_arrow:
+        return table
+
+    return table.to_pandas()
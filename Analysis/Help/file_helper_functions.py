@@ -0,0 +1,29 @@
+# file_helper_functions.py
+# AUTHOR: Jeff Brown
+#
+# Small file utilities shared by the pipeline runner, the chart renderer and the ward map builder
+# (kept free of the analysis modules, so importing it doesn't pull in the whole pipeline)
+
+# Dependencies
+import os
+import hashlib
+
+# Function to calculate the SHA-256 hash of a file's contents
+# a_hash_cache: dictionary of path => [size, mtime, hash] from the last build,
+#                used to avoid re-reading files that haven't been touched
+def file_hash(a_path, a_hash_cache=None):
+    stat = os.stat(a_path)
+    if a_hash_cache is not None:
+        cached = a_hash_cache.get(a_path)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+    h = hashlib.sha256()
+    with open(a_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+
+    if a_hash_cache is not None:
+        a_hash_cache[a_path] = [stat.st_size, stat.st_mtime_ns, h.hexdigest()]
+
+    return h.hexdigest()
@@ -0,0 +1,204 @@
+# geography_helper_functions.py
+# AUTHOR: Jeff Brown
+#
+# A collection of functions used to build and use a single table of the Chicago zipcodes
+# (zipcode => city area, centroid and ward overlap), where each zipcode has an int32 key ('zip_key')
+# Datasets store the zip_key of each row, so adding zipcode attributes to a dataset is an
+# array lookup by key, instead of string merges on 'Zipcode' / 'zip' / 'ZIP CODE' / 'postal_code'
+# (e.g. the census merges in demographic_data_analysis.ipynb)
+
+# Dependencies
+import os
+import numpy as np
+import pandas as pd
+
+from Help.polygon_helper_functions import (WARDS_GEOJSON_FILE, ZCTA_BOUNDARIES_FILE, load_geojson_polygons,
+                                           load_ward_index, assign_wards, load_zcta_index, assign_zipcodes)
+from Help.spatial_helper_functions import EARTH_RADIUS_METERS
+
+# Location of the Chicago zipcode => city area mapping, and of the US zipcode centroids
+ZIP_AREA_FILE = "../Data/zipcode_to_area_map.csv"
+ZIP_CENTROIDS_FILE = "../Raw Data/US_Zip_Codes_from_2013_Government_Data.csv"
+
+# Location of the zipcode table and of the share of each zipcode in each ward
+GEOGRAPHY_FILE = "../Data/Chicago_Zip_Geography.parquet"
+ZIP_WARD_OVERLAP_FILE = "../Data/Chicago_Zip_Ward_Overlap.parquet"
+
+# Zipcodes in the city area mapping that are not Chicago zipcodes
+# (skipped when demographic_data_analysis.ipynb built its list of Chicago zipcodes)
+NON_CHICAGO_ZIPCODES = ['60627', '60635', '60648', '60650', '60658']
+
+# Name of the column holding the zipcode key of each row, and the key of rows outside the table
+ZIP_KEY_COLUMN = 'zip_key'
+MISSING_ZIP_KEY = -1
+
+# Spacing (meters) of the points used to measure the overlap of the zipcodes and wards
+OVERLAP_SPACING_METERS = 100
+
+# Function to convert zipcodes in any of the formats used by the datasets
+#  (60601, 60601.0, "60601", "60601-1234") to integers
+# Returns: int64 array (-1 for missing or invalid zipcodes)
+def normalize_zipcodes(a_zips):
+    zips = pd.Series( np.asarray(a_zips, dtype=object) ).astype(str).str.strip().str[:5]
+
+    return pd.to_numeric(zips, errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+
+# Function to measure how much of each zipcode lies in each ward
+# A grid of points (OVERLAP_SPACING_METERS apart) is laid over the wards; each point is assigned its
+#  ward and its zipcode (the ZCTA polygon containing it or, without the ZCTA boundaries, the zipcode
+#  with the closest centroid - as in the fix_cta_zips pipeline stage)
+# Arguments:
+#    a_zips: list of 5 character zipcodes to measure
+#    a_centroid_zips, a_centroid_lat, a_centroid_lon: zipcode centroids
+#    wards_file: ward boundaries
+#    zcta_file: ZCTA boundaries (None: use the closest centroid)
+#    spacing: spacing of the grid of points (meters)
+# Returns: dataframe of 'Zipcode', 'Ward' and 'Overlap' (share of the zipcode's area within the city that
+#          is in the ward), sorted by zipcode and largest overlap first
+def measure_zip_ward_overlap(a_zips, a_centroid_zips, a_centroid_lat, a_centroid_lon, wards_file=WARDS_GEOJSON_FILE,
+                             zcta_file=None, spacing=OVERLAP_SPACING_METERS):
+    _, polygons = load_geojson_polygons(wards_file, 'ward')
+    points = np.concatenate( [ ring for polygon in polygons for ring in polygon ] )
+    (lon_min, lat_min) = points.min(axis=0)
+    (lon_max, lat_max) = points.max(axis=0)
+
+    # Grid of points over the wards
+    lat_step = np.degrees( spacing / EARTH_RADIUS_METERS )
+    lon_step = lat_step / np.cos( np.radians( (lat_min + lat_max) / 2 ) )
+    (grid_lat, grid_lon) = np.meshgrid( np.arange(lat_min, lat_max, lat_step), np.arange(lon_min, lon_max, lon_step) )
+    grid_lat = grid_lat.ravel()
+    grid_lon = grid_lon.ravel()
+
+    wards = assign_wards( load_ward_index(wards_file), grid_lat, grid_lon )
+    in_city = wards != None
+
+    zcta_index = load_zcta_index(zcta_file) if zcta_file is not None else None
+    zips, _ = assign_zipcodes( zcta_index, grid_lat[in_city], grid_lon[in_city],
+                               a_centroid_zips, a_centroid_lat, a_centroid_lon )
+
+    grid_df = pd.DataFrame({ 'Zipcode': zips, 'Ward': wards[in_city].astype(int) })
+    grid_df = grid_df.loc[ grid_df['Zipcode'].isin(a_zips) ]
+
+    overlap_df = grid_df.value_counts().rename('Points').reset_index()
+    overlap_df['Overlap'] = ( overlap_df['Points'] /
+                              overlap_df.groupby('Zipcode')['Points'].transform('sum') ).astype(np.float32)
+
+    return overlap_df.sort_values(['Zipcode', 'Overlap'], ascending=[True, False], ignore_index=True) \
+                     [['Zipcode', 'Ward', 'Overlap']]
+
+# Function to build the Chicago zipcode table
+# Arguments:
+#    area_file: Chicago zipcode => city area mapping
+#    centroids_file: US zipcode centroids
+#    wards_file: ward boundaries
+#    zcta_file: ZCTA boundaries (None: measure the ward overlap with the zipcode centroids)
+# Returns: a tuple of dataframes
+#    geography: one row per Chicago zipcode, in zipcode order, with
+#       'zip_key' (int32: the row number), 'Zipcode' (5 character string), 'zip' (int32), 'Area',
+#       'Latitude'/'Longitude' (centroid), 'Primary Ward' (ward with the largest share of the zipcode),
+#       'Primary Ward Overlap' (that share) and 'Wards' (number of wards the zipcode is in)
+#       (zipcodes with no area in the city, e.g. PO box zipcodes, have no primary ward)
+#    ward overlap: 'zip_key', 'Ward' and 'Overlap' for every zipcode/ward pair (see measure_zip_ward_overlap)
+def build_geography(area_file=ZIP_AREA_FILE, centroids_file=ZIP_CENTROIDS_FILE, wards_file=WARDS_GEOJSON_FILE,
+                    zcta_file=None):
+    area_df = pd.read_csv(area_file, encoding="utf-8-sig", dtype=str)
+    area_df['Zipcode'] = area_df['Zipcode'].str.strip().str.zfill(5)
+    area_df = area_df.loc[ ~area_df['Zipcode'].isin(NON_CHICAGO_ZIPCODES) ] \
+                     .drop_duplicates(subset='Zipcode').sort_values('Zipcode', ignore_index=True)
+
+    geography_df = pd.DataFrame({ ZIP_KEY_COLUMN: np.arange(len(area_df), dtype=np.int32),
+                                  'Zipcode': area_df['Zipcode'],
+                                  'zip': area_df['Zipcode'].astype(np.int32),
+                                  'Area': area_df['Area'].astype('category') })
+
+    # Zipcode centroids
+    centroids_df = pd.read_csv(centroids_file, dtype={'ZIP': str})
+    centroids_df['ZIP'] = centroids_df['ZIP'].str.zfill(5)
+    centroids = centroids_df.set_index('ZIP').reindex(geography_df['Zipcode'])
+    geography_df['Latitude'] = centroids['LAT'].to_numpy()
+    geography_df['Longitude'] = centroids['LNG'].to_numpy()
+
+    # Ward overlap (using the centroids of all the Chicago area zipcodes for the fallback)
+    area_centroids_df = centroids_df.loc[ centroids_df['ZIP'].str.startswith('606') ]
+    overlap_df = measure_zip_ward_overlap( list(geography_df['Zipcode']), area_centroids_df['ZIP'],
+                                           area_centroids_df['LAT'], area_centroids_df['LNG'],
+                                           wards_file, zcta_file )
+    overlap_df.insert( 0, ZIP_KEY_COLUMN, zip_keys(overlap_df['Zipcode'], geography_df) )
+    overlap_df = overlap_df.drop(columns='Zipcode').astype({ 'Ward': np.int16 })
+
+    primary = overlap_df.drop_duplicates(subset=ZIP_KEY_COLUMN, keep='first').set_index(ZIP_KEY_COLUMN)
+    primary = primary.reindex(geography_df[ZIP_KEY_COLUMN]).reset_index(drop=True)
+    geography_df['Primary Ward'] = primary['Ward'].astype('Int16')
+    geography_df['Primary Ward Overlap'] = primary['Overlap']
+    geography_df['Wards'] = np.bincount( overlap_df[ZIP_KEY_COLUMN], minlength=len(geography_df) ).astype(np.int8)
+
+    return geography_df, overlap_df
+
+# Function to build the zipcode table and save it (with the ward overlap) as Parquet files
+def save_geography(a_geography_file=GEOGRAPHY_FILE, a_overlap_file=ZIP_WARD_OVERLAP_FILE, **kwargs):
+    geography_df, overlap_df = build_geography(**kwargs)
+
+    geography_df.to_parquet(a_geography_file, index=False)
+    overlap_df.to_parquet(a_overlap_file, index=False)
+
+    return geography_df, overlap_df
+
+# Function to load the zipcode table (building it first if it doesn't exist yet)
+def load_geography(a_geography_file=GEOGRAPHY_FILE):
+    if not os.path.exists(a_geography_file):
+        zcta_file = ZCTA_BOUNDARIES_FILE if os.path.exists(ZCTA_BOUNDARIES_FILE) else None
+        return save_geography(a_geography_file, os.path.join( os.path.dirname(a_geography_file),
+                                                               os.path.basename(ZIP_WARD_OVERLAP_FILE) ),
+                              zcta_file=zcta_file)[0]
+
+    return pd.read_parquet(a_geography_file)
+
+# Function to look up the key of each zipcode
+# Arguments:
+#    a_zips: array (or list/Series) of zipcodes, in any format (see normalize_zipcodes)
+#    a_geography_df: the zipcode table (see load_geography)
+# Returns: int32 array of zip_keys (MISSING_ZIP_KEY for zipcodes that aren't in the table)
+def zip_keys(a_zips, a_geography_df):
+    table_zips = a_geography_df['zip'].to_numpy(dtype=np.int64)
+    zips = normalize_zipcodes(a_zips)
+
+    # The table is in zipcode order, so each zipcode's key is its position in the table
+    pos = np.minimum( np.searchsorted(table_zips, zips), len(table_zips) - 1 )
+    found = table_zips[pos] == zips
+
+    return np.where(found, a_geography_df[ZIP_KEY_COLUMN].to_numpy()[pos], MISSING_ZIP_KEY).astype(np.int32)
+
+# Function to add the zip_key column to a dataframe
+def stamp_zip_keys(a_df, a_zip_column, a_geography_df):
+    a_df[ZIP_KEY_COLUMN] = zip_keys(a_df[a_zip_column], a_geography_df)
+
+    return a_df
+
+# Function to add columns of the zipcode table to a dataframe with a zip_key column (a lookup by key)
+# Arguments:
+#    a_df: dataframe with a zip_key column (see stamp_zip_keys)
+#    a_geography_df: the zipcode table (see load_geography)
+#    columns: columns of the zipcode table to add
+#    chicago_only: if True, drop the rows whose zipcode isn't in the table
+# Returns: a new dataframe (the added columns are missing for rows whose zipcode isn't in the table)
+def add_geography(a_df, a_geography_df, columns=['Area'], chicago_only=True):
+    keys = a_df[ZIP_KEY_COLUMN].to_numpy()
+    in_table = keys != MISSING_ZIP_KEY
+
+    geo_df = a_df.loc[in_table].copy() if chicago_only else a_df.copy()
+    keys = keys[in_table] if chicago_only else keys
+
+    for c in columns:
+        values = a_geography_df[c].take( np.maximum(keys, 0) ).reset_index(drop=True)
+        geo_df[c] = values.where( keys != MISSING_ZIP_KEY ).to_numpy()
+
+    return geo_df
+
+# Function to count the rows of a dataframe per zipcode (e.g. successful restaurants per zipcode)
+# Returns: Series of counts indexed by zip_key, with every zipcode in the table (0 for zipcodes with no rows)
+def count_by_zip_key(a_df, a_geography_df):
+    keys = a_df[ZIP_KEY_COLUMN].to_numpy()
+
+    counts = np.bincount( keys[keys != MISSING_ZIP_KEY], minlength=len(a_geography_df) )
+
+    return pd.Series( counts, index=pd.Index(a_geography_df[ZIP_KEY_COLUMN], name=ZIP_KEY_COLUMN) )
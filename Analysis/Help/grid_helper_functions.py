@@ -0,0 +1,153 @@
+# grid_helper_functions.py
+# AUTHOR: Jeff Brown
+#
+# A collection of functions used to give every lat/long row of the Project 1 datasets
+# (Yelp restaurants, business licenses, CTA stops) a hierarchical grid cell id,
+# so the datasets can be joined and rolled up by location at any resolution
+# with integer keys, instead of by zipcode ('zip', 'Zipcode', 'ZIP CODE', 'postal_code', 'ZIP', ...)
+#
+# Cells are squares of the Web Mercator map grid: at grid level L the world is a (2 ** L) x (2 ** L) grid,
+# and each cell is numbered by interleaving the bits of its column and row (a Morton / Z-order key)
+# The cell containing a cell at the next level up is key >> 2, so a cell id stored at the finest level
+# (GRID_CELL_LEVEL) gives the cell at every coarser level with a shift
+
+# Dependencies
+import numpy as np
+import pandas as pd
+
+# Grid level of the cell ids stored with each row (about 1.8 m cells in Chicago)
+GRID_CELL_LEVEL = 24
+
+# Default grid level of the cross-dataset rollups (about 450 m cells in Chicago)
+GRID_ROLLUP_LEVEL = 16
+
+# Name of the column holding the cell id of each row
+GRID_CELL_COLUMN = 'grid_cell'
+
+# Cell id of rows without a location
+GRID_CELL_MISSING = -1
+
+# Latitude limit of the Web Mercator projection
+MERCATOR_MAX_LAT = 85.0511287798
+
+# Circumference of the earth at the equator (meters)
+EARTH_CIRCUMFERENCE_METERS = 40075016.686
+
+# Function to spread the bits of an integer array out to every other bit (e.g. 0b111 => 0b10101)
+def spread_bits(a_values):
+    v = a_values.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for (shift, mask) in [ (16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                           (2, 0x3333333333333333), (1, 0x5555555555555555) ]:
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+
+    return v
+
+# Function to gather every other bit of an integer array back together (the inverse of spread_bits)
+def compact_bits(a_values):
+    v = a_values.astype(np.uint64) & np.uint64(0x5555555555555555)
+    for (shift, mask) in [ (1, 0x3333333333333333), (2, 0x0F0F0F0F0F0F0F0F), (4, 0x00FF00FF00FF00FF),
+                           (8, 0x0000FFFF0000FFFF), (16, 0x00000000FFFFFFFF) ]:
+        v = (v | (v >> np.uint64(shift))) & np.uint64(mask)
+
+    return v.astype(np.int64)
+
+# Function to get the grid cell of each lat/long point at a grid level
+# Arguments:
+#    a_lat, a_lon: arrays (or lists/Series) of point coordinates in degrees
+#    a_level: grid level (0 to 31)
+# Returns: int64 array of cell keys (GRID_CELL_MISSING for points without coordinates)
+def grid_cell_keys(a_lat, a_lon, a_level):
+    lat = np.asarray(a_lat, dtype=np.float64)
+    lon = np.asarray(a_lon, dtype=np.float64)
+    missing = np.isnan(lat) | np.isnan(lon)
+
+    # Position on the map (0 to 1, from the top left corner)
+    lat_r = np.radians( np.clip(np.where(missing, 0.0, lat), -MERCATOR_MAX_LAT, MERCATOR_MAX_LAT) )
+    x = ( np.where(missing, 0.0, lon) + 180.0 ) / 360.0
+    y = ( 1.0 - np.log( np.tan(lat_r) + 1.0 / np.cos(lat_r) ) / np.pi ) / 2.0
+
+    n = 2 ** a_level
+    col = np.clip( np.floor(x * n), 0, n - 1 ).astype(np.int64)
+    row = np.clip( np.floor(y * n), 0, n - 1 ).astype(np.int64)
+
+    keys = ( spread_bits(col) | (spread_bits(row) << np.uint64(1)) ).astype(np.int64)
+    keys[missing] = GRID_CELL_MISSING
+
+    return keys
+
+# Function to get the grid cell id (at GRID_CELL_LEVEL) of each lat/long point
+def grid_cells(a_lat, a_lon):
+    return grid_cell_keys(a_lat, a_lon, GRID_CELL_LEVEL)
+
+# Function to get the cell containing each cell at a coarser grid level
+# Arguments:
+#    a_keys: array (or Series) of cell keys at grid level from_level
+#    a_level: grid level of the cells to return (<= from_level)
+#    from_level: grid level of a_keys
+# Returns: int64 array of cell keys at a_level (GRID_CELL_MISSING stays missing)
+def grid_parent(a_keys, a_level, from_level=GRID_CELL_LEVEL):
+    keys = np.asarray(a_keys, dtype=np.int64)
+
+    return np.where( keys == GRID_CELL_MISSING, GRID_CELL_MISSING, keys >> (2 * (from_level - a_level)) )
+
+# Function to get the lat/long of the center of each cell
+# Returns: a tuple of arrays (latitude, longitude)
+def grid_cell_centers(a_keys, a_level):
+    keys = np.asarray(a_keys, dtype=np.int64)
+    n = 2 ** a_level
+
+    x = ( compact_bits(keys) + 0.5 ) / n
+    y = ( compact_bits(keys >> 1) + 0.5 ) / n
+
+    lat = np.degrees( np.arctan( np.sinh( np.pi * (1.0 - 2.0 * y) ) ) )
+    lon = x * 360.0 - 180.0
+
+    missing = keys == GRID_CELL_MISSING
+    return np.where(missing, np.nan, lat), np.where(missing, np.nan, lon)
+
+# Function to get the width (meters) of the cells at a grid level, at a latitude
+def grid_cell_size(a_level, a_lat):
+    return EARTH_CIRCUMFERENCE_METERS * np.cos( np.radians(a_lat) ) / 2 ** a_level
+
+# Function to get the finest grid level whose cells are at least a_meters wide at a latitude
+def grid_level_for_size(a_meters, a_lat):
+    level = int( np.floor( np.log2( EARTH_CIRCUMFERENCE_METERS * np.cos( np.radians(a_lat) ) / a_meters ) ) )
+
+    return min( max(level, 0), GRID_CELL_LEVEL )
+
+# Function to add the grid cell id column (GRID_CELL_COLUMN) to a dataframe of lat/long rows
+def stamp_grid_cells(a_df, a_lat_column, a_lon_column):
+    a_df[GRID_CELL_COLUMN] = grid_cells(a_df[a_lat_column], a_df[a_lon_column])
+
+    return a_df
+
+# Function to roll up the rows of a dataframe to the grid cells of a grid level
+# Arguments:
+#    a_df: dataframe with a cell id column (see stamp_grid_cells)
+#    a_level: grid level of the rollup
+#    aggregates: dictionary of output column => (column, aggregation) as for DataFrame.groupby().agg()
+#    key_column: column with the cell ids (at GRID_CELL_LEVEL)
+# Returns: dataframe indexed by the cell key at a_level (index name f"grid_cell_{a_level}"),
+#  with a 'count' of the rows in each cell plus the aggregates (rows without a location are dropped)
+def grid_rollup(a_df, a_level, aggregates={}, key_column=GRID_CELL_COLUMN):
+    keys = grid_parent(a_df[key_column], a_level)
+    has_key = keys != GRID_CELL_MISSING
+
+    rollup_df = a_df.loc[has_key].groupby( pd.Index(keys[has_key], name=f"{GRID_CELL_COLUMN}_{a_level}") ) \
+                                 .agg( count=(key_column, 'size'), **aggregates )
+
+    return rollup_df
+
+# Function to join the rollups of several datasets at the same grid level (an integer key join)
+# Arguments:
+#    a_rollups: dictionary of dataset name => rollup (see grid_rollup)
+#    how: type of join ('outer': every cell in any of the rollups)
+# Returns: dataframe indexed by cell key, with columns f"{name} {column}" (counts of missing cells are 0)
+def join_grid_rollups(a_rollups, how='outer'):
+    joined_df = pd.concat( { name: r for (name, r) in a_rollups.items() }, axis=1, join=how )
+    joined_df.columns = [ f"{name} {c}" for (name, c) in joined_df.columns ]
+
+    for name in a_rollups:
+        joined_df[f"{name} count"] = joined_df[f"{name} count"].fillna(0).astype(np.int64)
+
+    return joined_df.sort_index()
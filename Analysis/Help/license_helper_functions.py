@@ -0,0 +1,316 @@
+# license_helper_functions.py
+# AUTHOR: Jeff Brown
+#
+# A collection of functions used to ingest the Chicago business license export
+# (https://data.cityofchicago.org/Community-Economic-Development/Business-Licenses/r5kz-chrr)
+# in support of the License Analysis and the Yelp / License Merge with Project 1
+
+# Dependencies
+import os
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from Help.grid_helper_functions import (GRID_CELL_COLUMN, stamp_grid_cells)
+
+# Location of the full business license export
+LICENSE_EXPORT_FILE = "../Raw Data/Business_Licenses.csv"
+
+# Location of the restaurant licenses (all licenses, and one license per business name)
+LICENSE_STORE_FILE = "../Data/Chicago_Restaurant_Licenses.parquet"
+LICENSE_UNIQUE_FILE = "../Data/Chicago_Restaurant_Licenses_Unique.parquet"
+
+# Location of the license counts per ward, zipcode and year, and of the watermark of the last update
+LICENSE_AGGREGATES_FILE = "../Data/Chicago_Restaurant_License_Counts.json"
+LICENSE_WATERMARK_FILE = "../Data/.license_watermark.json"
+
+# Column identifying a license record: the export's record id (a renewal keeps the license number
+#  but is a new record, and one license number can have several records with the same issue date)
+LICENSE_KEY = ['LICENSE ID']
+
+# Column with the hash of a license record's values (see license_hashes), used to find corrected records
+LICENSE_HASH_COLUMN = 'RECORD HASH'
+
+# License code of a Retail Food Establishment (restaurant)
+RESTAURANT_LICENSE_CODE = 1006
+
+# Columns of the export that are kept, and the type each is stored as,
+#  plus the hash of each record and the grid cell id of each license's location (see grid_helper_functions)
+LICENSE_SCHEMA = pa.schema( [ ('LICENSE ID', pa.int64()),
+                              ('LICENSE NUMBER', pa.int64()),
+                              ('LEGAL NAME', pa.string()),
+                              ('DOING BUSINESS AS NAME', pa.string()),
+                              ('LICENSE CODE', pa.int32()),
+                              ('CITY', pa.string()),
+                              ('WARD', pa.int16()),
+                              ('ZIP CODE', pa.string()),
+                              ('DATE ISSUED', pa.timestamp('ms')),
+                              ('LATITUDE', pa.float64()),
+                              ('LONGITUDE', pa.float64()),
+                              (LICENSE_HASH_COLUMN, pa.uint64()),
+                              (GRID_CELL_COLUMN, pa.int64()) ] )
+
+# Columns read from the export
+LICENSE_EXPORT_COLUMNS = [ c for c in LICENSE_SCHEMA.names if c not in [LICENSE_HASH_COLUMN, GRID_CELL_COLUMN] ]
+
+# Function to calculate the hash of each license record (over the columns read from the export)
+# The values are converted to one type per column first, so a record hashes the same whether
+#  it was just read from the export or loaded back from the store
+def license_hashes(a_license_df):
+    types = { c: ('datetime64[ns]' if c == 'DATE ISSUED' else
+                  object if pa.types.is_string(LICENSE_SCHEMA.field(c).type) else
+                  LICENSE_SCHEMA.field(c).type.to_pandas_dtype())
+              for c in LICENSE_EXPORT_COLUMNS }
+
+    return pd.util.hash_pandas_object( a_license_df[LICENSE_EXPORT_COLUMNS].astype(types), index=False ) \
+             .to_numpy(dtype=np.uint64)
+
+# Function to get the keys (LICENSE_KEY) of a set of licenses as an index
+def license_keys(a_license_df):
+    return pd.Index( a_license_df['LICENSE ID'].to_numpy(dtype=np.int64), name='LICENSE ID' )
+
+# Function to read the license export in chunks, keeping only the licenses for one city and license code
+# Only the columns in LICENSE_SCHEMA are parsed, and each chunk is filtered as soon as it is read,
+#  so memory use depends on the chunk size rather than the size of the export
+# Arguments:
+#    a_export_file: location of the license export (CSV)
+#    city: value of 'CITY' to keep (None = all cities)
+#    license_code: value of 'LICENSE CODE' to keep (None = all license codes)
+#    chunksize: number of rows read at a time
+# Returns: a generator of dataframes (one per chunk) with the columns in LICENSE_SCHEMA
+#           (rows missing any of the export's values are dropped, as in the original cleaning notebook,
+#            and so are repeats of a 'LICENSE ID' already read - only its first record is kept)
+def read_license_chunks(a_export_file=LICENSE_EXPORT_FILE, city="CHICAGO", license_code=RESTAURANT_LICENSE_CODE,
+                        chunksize=200000):
+    seen_ids = set()
+
+    reader = pd.read_csv( a_export_file, usecols=LICENSE_EXPORT_COLUMNS, chunksize=chunksize,
+                          dtype={ 'LEGAL NAME': str, 'DOING BUSINESS AS NAME': str, 'CITY': str, 'ZIP CODE': str } )
+
+    for chunk in reader:
+        chunk['LICENSE CODE'] = pd.to_numeric(chunk['LICENSE CODE'], errors='coerce')
+
+        keep = pd.Series(True, index=chunk.index)
+        if city is not None:
+            keep &= chunk['CITY'].str.strip().str.upper() == city
+        if license_code is not None:
+            keep &= chunk['LICENSE CODE'] == license_code
+
+        chunk = chunk.loc[keep].dropna()
+        chunk['DATE ISSUED'] = pd.to_datetime(chunk['DATE ISSUED'], format="%m/%d/%Y", errors='coerce')
+        chunk = chunk.dropna(subset=['DATE ISSUED'])
+
+        chunk = chunk[LICENSE_EXPORT_COLUMNS].astype( { 'LICENSE ID': 'int64', 'LICENSE NUMBER': 'int64',
+                                                        'LICENSE CODE': 'int32', 'WARD': 'int16' } )
+
+        # First record of each license id in this chunk, that was not in an earlier chunk
+        chunk = chunk.drop_duplicates(subset=LICENSE_KEY, keep='first')
+        chunk = chunk.loc[ ~chunk['LICENSE ID'].isin(seen_ids) ]
+        seen_ids.update( chunk['LICENSE ID'] )
+
+        chunk[LICENSE_HASH_COLUMN] = license_hashes(chunk)
+
+        yield stamp_grid_cells(chunk, 'LATITUDE', 'LONGITUDE')
+
+# Function to convert a dataframe of licenses into a pyarrow Table with LICENSE_SCHEMA
+def license_table(a_license_df):
+    return pa.Table.from_pandas( a_license_df[LICENSE_SCHEMA.names], schema=LICENSE_SCHEMA, preserve_index=False )
+
+# Function to ingest the license export into compact Parquet files
+# The export is streamed (see read_license_chunks) and every chunk is written out as it is read:
+#  - a_output_file: every license kept by the filter
+#  - a_unique_file: the first license for each 'DOING BUSINESS AS NAME'
+#     (same as groupby("DOING BUSINESS AS NAME").first() in Merge_Yelp_License.ipynb);
+#     the names seen so far are kept in a set, so duplicates are dropped across chunks
+# Arguments:
+#    a_export_file: location of the license export (CSV)
+#    a_output_file: location of the licenses (Parquet)
+#    a_unique_file: location of the licenses with one per business name (Parquet, None = don't write it)
+#    city, license_code, chunksize: see read_license_chunks()
+# Returns: dictionary with the number of licenses written to each file
+def ingest_license_export(a_export_file=LICENSE_EXPORT_FILE, a_output_file=LICENSE_STORE_FILE,
+                          a_unique_file=LICENSE_UNIQUE_FILE, city="CHICAGO", license_code=RESTAURANT_LICENSE_CODE,
+                          chunksize=200000):
+    seen_names = set()
+    counts = { 'licenses': 0, 'unique': 0 }
+
+    writer = pq.ParquetWriter(a_output_file, LICENSE_SCHEMA)
+    unique_writer = pq.ParquetWriter(a_unique_file, LICENSE_SCHEMA) if a_unique_file is not None else None
+    try:
+        for chunk in read_license_chunks(a_export_file, city, license_code, chunksize):
+            writer.write_table( license_table(chunk) )
+            counts['licenses'] += len(chunk)
+
+            if unique_writer is not None:
+                # First license for each name in this chunk, that was not in an earlier chunk
+                first = chunk.drop_duplicates(subset='DOING BUSINESS AS NAME', keep='first')
+                first = first.loc[ ~first['DOING BUSINESS AS NAME'].isin(seen_names) ]
+                seen_names.update( first['DOING BUSINESS AS NAME'] )
+
+                unique_writer.write_table( license_table(first) )
+                counts['unique'] += len(first)
+    finally:
+        writer.close()
+        if unique_writer is not None:
+            unique_writer.close()
+
+    return counts
+
+# Function to load the restaurant licenses
+# columns: list of columns to load (default: all columns)
+def load_licenses(a_store_file=LICENSE_STORE_FILE, columns=None):
+    return pq.read_table(a_store_file, columns=columns, memory_map=True).to_pandas()
+
+# Function to count the licenses per ward, zipcode and year issued
+#  (the counts behind Ward_Map.json and the 'LICENSES' columns of chicago_zip_income_1.csv)
+# Returns: dictionary of 'ward'/'zip'/'year' => Series of counts (indexed by string keys)
+def license_aggregates(a_license_df):
+    return { 'ward': a_license_df['WARD'].astype(str).value_counts(),
+             'zip': a_license_df['ZIP CODE'].astype(str).value_counts(),
+             'year': a_license_df['DATE ISSUED'].dt.year.astype(str).value_counts() }
+
+# Function to add (a_sign=1) or remove (a_sign=-1) the counts of some licenses to/from a set of aggregates
+def patch_license_aggregates(a_aggregates, a_delta, a_sign=1):
+    patched = {}
+    for (name, counts) in a_aggregates.items():
+        counts = counts.add( a_sign * a_delta[name], fill_value=0 ).astype(int)
+        patched[name] = counts.loc[counts != 0].sort_index()
+
+    return patched
+
+# Function to save the license aggregates as JSON
+def save_license_aggregates(a_aggregates, a_aggregates_file=LICENSE_AGGREGATES_FILE):
+    with open(a_aggregates_file, "w") as f:
+        json.dump( { name: counts.sort_index().to_dict() for (name, counts) in a_aggregates.items() }, f, indent=1 )
+
+# Function to load the license aggregates (see license_aggregates)
+def load_license_aggregates(a_aggregates_file=LICENSE_AGGREGATES_FILE):
+    with open(a_aggregates_file) as f:
+        aggregates = json.load(f)
+
+    return { name: pd.Series(counts, dtype=int) for (name, counts) in aggregates.items() }
+
+# Function to get the watermark (latest license number and issue date) of a set of licenses
+def license_watermark(a_license_df):
+    return { 'LICENSE NUMBER': int(a_license_df['LICENSE NUMBER'].max()),
+             'DATE ISSUED': a_license_df['DATE ISSUED'].max().strftime("%Y-%m-%d") }
+
+# Function to rewrite a license file without some licenses, and with some licenses added
+# The file is streamed a batch of rows at a time, so it is never loaded into memory as a whole
+# Arguments:
+#    a_license_file: location of the licenses (Parquet)
+#    a_drop_keys: index of the keys (see license_keys) of the licenses to remove
+#    a_add_df: licenses to add at the end of the file
+#    batch_size: number of rows read at a time
+# Returns: dataframe of the licenses that were removed
+def rewrite_license_file(a_license_file, a_drop_keys, a_add_df, batch_size=200000):
+    removed = []
+
+    temp_file = a_license_file + ".tmp"
+    with pq.ParquetFile(a_license_file) as pf, pq.ParquetWriter(temp_file, LICENSE_SCHEMA) as writer:
+        for batch in pf.iter_batches(batch_size=batch_size):
+            batch_df = batch.to_pandas()
+            drop = license_keys(batch_df).isin(a_drop_keys)
+
+            removed.append( batch_df.loc[drop] )
+            writer.write_table( license_table(batch_df.loc[~drop]) )
+
+        if len(a_add_df) > 0:
+            writer.write_table( license_table(a_add_df) )
+    os.replace(temp_file, a_license_file)
+
+    return pd.concat(removed, ignore_index=True) if removed else a_add_df.iloc[:0]
+
+# Function to update the restaurant license store with the new and corrected licenses in an export
+# Each license in the export is compared with the store by key (LICENSE_KEY, the export's record id)
+#  and record hash (the export and the store both keep only the first record of each key):
+#  - a key not in the store is a new license if its 'LICENSE NUMBER' or 'DATE ISSUED' is at or after
+#     the watermark of the last update (licenses issued on the watermark day are kept, and the
+#     ones already in the store are dropped by the key compare)
+#  - a key in the store with a different hash is a correction, and replaces the stored license
+# The store and unique license file are rewritten a batch at a time (see rewrite_license_file),
+#  the names not seen before are added to the unique license file, and the per-ward/zip/year counts
+#  are patched (new and corrected licenses added, replaced licenses removed) instead of being recalculated
+# If the store hasn't been built yet (or was built with an older LICENSE_SCHEMA),
+#  the whole export is ingested (see ingest_license_export)
+# Arguments:
+#    a_export_file: location of the license export (CSV) - the full export or just the latest records
+#    a_store_file, a_unique_file: location of the licenses (see ingest_license_export)
+#    aggregates_file: location of the license counts
+#    watermark_file: location of the watermark of the last update
+#    city, license_code, chunksize: see read_license_chunks()
+# Returns: dictionary with the update 'mode' ('full' or 'delta') and the number of licenses
+#           'inserted' and 'replaced' in the store
+def update_license_store(a_export_file=LICENSE_EXPORT_FILE, a_store_file=LICENSE_STORE_FILE,
+                         a_unique_file=LICENSE_UNIQUE_FILE, aggregates_file=LICENSE_AGGREGATES_FILE,
+                         watermark_file=LICENSE_WATERMARK_FILE, city="CHICAGO",
+                         license_code=RESTAURANT_LICENSE_CODE, chunksize=200000):
+    # First run: ingest everything
+    if not all( os.path.exists(f) for f in [a_store_file, a_unique_file, aggregates_file, watermark_file] ) or \
+       pq.read_schema(a_store_file).names != LICENSE_SCHEMA.names:
+        counts = ingest_license_export(a_export_file, a_store_file, a_unique_file, city, license_code, chunksize)
+
+        store_df = load_licenses(a_store_file, columns=['LICENSE NUMBER', 'WARD', 'ZIP CODE', 'DATE ISSUED'])
+        save_license_aggregates( license_aggregates(store_df), aggregates_file )
+        with open(watermark_file, "w") as f:
+            json.dump( license_watermark(store_df), f )
+
+        return { 'mode': 'full', 'inserted': counts['licenses'], 'replaced': 0 }
+
+    with open(watermark_file) as f:
+        watermark = json.load(f)
+    watermark_date = pd.Timestamp(watermark['DATE ISSUED'])
+
+    # Keys and record hashes of the store
+    store_df = load_licenses(a_store_file, columns=LICENSE_KEY + [LICENSE_HASH_COLUMN])
+    store_keys = license_keys(store_df)
+    store_hashes = store_df[LICENSE_HASH_COLUMN].to_numpy()
+
+    # New licenses and corrections of stored licenses
+    delta = []
+    for chunk in read_license_chunks(a_export_file, city, license_code, chunksize):
+        pos = store_keys.get_indexer( license_keys(chunk) )
+        stored_hash = store_hashes[np.maximum(pos, 0)] if len(store_hashes) > 0 else np.zeros(len(chunk), dtype=np.uint64)
+
+        is_new = (pos == -1) & ( (chunk['LICENSE NUMBER'] >= watermark['LICENSE NUMBER']) |
+                                 (chunk['DATE ISSUED'] >= watermark_date) ).to_numpy()
+        is_corrected = (pos != -1) & (stored_hash != chunk[LICENSE_HASH_COLUMN].to_numpy())
+        delta.append( chunk.loc[is_new | is_corrected] )
+    delta_df = pd.concat(delta, ignore_index=True)
+
+    if len(delta_df) == 0:
+        return { 'mode': 'delta', 'inserted': 0, 'replaced': 0 }
+
+    # Upsert into the store
+    delta_keys = license_keys(delta_df)
+    is_replacement = delta_keys.isin(store_keys)
+    replaced_df = rewrite_license_file(a_store_file, delta_keys[is_replacement], delta_df)
+
+    # Replace the corrected licenses in the unique license file, and add the business names not seen before
+    unique_df = load_licenses(a_unique_file, columns=LICENSE_KEY + ['DOING BUSINESS AS NAME'])
+    is_unique_correction = delta_keys.isin( license_keys(unique_df) ) & is_replacement
+    new_names_df = delta_df.loc[ ~is_unique_correction &
+                                 ~delta_df['DOING BUSINESS AS NAME'].isin(unique_df['DOING BUSINESS AS NAME']) ] \
+                           .drop_duplicates(subset='DOING BUSINESS AS NAME', keep='first')
+    if is_unique_correction.any() or len(new_names_df) > 0:
+        rewrite_license_file( a_unique_file, delta_keys[is_unique_correction],
+                              pd.concat([delta_df.loc[is_unique_correction], new_names_df], ignore_index=True) )
+
+    # Patch the counts
+    aggregates = load_license_aggregates(aggregates_file)
+    aggregates = patch_license_aggregates( aggregates, license_aggregates(delta_df), 1 )
+    aggregates = patch_license_aggregates( aggregates, license_aggregates(replaced_df), -1 )
+    save_license_aggregates(aggregates, aggregates_file)
+
+    # Move the watermark
+    new_watermark = license_watermark(delta_df)
+    watermark = { 'LICENSE NUMBER': max(watermark['LICENSE NUMBER'], new_watermark['LICENSE NUMBER']),
+                  'DATE ISSUED': max(watermark['DATE ISSUED'], new_watermark['DATE ISSUED']) }
+    with open(watermark_file, "w") as f:
+        json.dump(watermark, f)
+
+    n_replaced = int( is_replacement.sum() )
+
+    return { 'mode': 'delta', 'inserted': len(delta_df) - n_replaced, 'replaced': n_replaced }
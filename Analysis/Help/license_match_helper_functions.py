@@ -0,0 +1,408 @@
+# license_match_helper_functions.py
+# AUTHOR: Jeff Brown
+#
+# A collection of functions used to match Yelp restaurants
+# to Chicago business licenses (name + location)
+# in support of the Yelp / License Merge with Project 1
+
+# Dependencies
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from Help.spatial_helper_functions import (build_spatial_index, within_radius_pairs, rowwise_distance)
+
+# Words that are dropped from business names before they are compared
+# e.g. "WILDBERRY PANCAKES & CAFE" and "Wildberry Pancakes and Cafe" are the same business
+NAME_STOP_WORDS = ['and', 'the', 'inc', 'llc', 'corp', 'corporation', 'co', 'ltd', 'incorporated']
+
+# Regular expressions used to normalize business names
+NAME_PUNCT_RE = r"[^0-9a-z ]+"
+NAME_STOP_RE = r"\b(?:" + "|".join(NAME_STOP_WORDS) + r")\b"
+NAME_SPACE_RE = r"\s+"
+
+# Function to normalize a list/Series of business names so they can be compared:
+#  lowercase, "&" and punctuation removed, "and"/"inc"/etc. removed, whitespace collapsed
+# Returns: a Series of normalized names (missing names become "")
+def normalize_business_names(a_names):
+    names = pd.Series(a_names, dtype=object).fillna("").astype(str).str.lower()
+    names = names.str.replace("&", " ", regex=False)
+    names = names.str.replace("'", "", regex=False)
+    names = names.str.replace(NAME_PUNCT_RE, " ", regex=True)
+    names = names.str.replace(NAME_STOP_RE, " ", regex=True)
+    names = names.str.replace(NAME_SPACE_RE, " ", regex=True).str.strip()
+
+    return names.reset_index(drop=True)
+
+# Maximum size (names x characters) of the arrays used to generate the q-grams of a block of names
+QGRAM_BLOCK_CELLS = 4000000
+
+# Function to generate the q-grams of a block of names (see qgram_codes)
+# a_names: array of names; a_lengths: array of name lengths (all of the names fit in a max_len wide array)
+# Returns: a tuple (row numbers within the block, q-gram codes)
+def qgram_block_codes(a_names, a_lengths, q=3):
+    n_names = len(a_names)
+    max_len = int(a_lengths.max())
+
+    # Fixed width (names x characters) array of bytes, padded with spaces on both ends
+    chars = np.frombuffer( a_names.astype(f"S{max_len}").tobytes(), dtype=np.uint8 ).reshape(n_names, max_len)
+    padded = np.full( (n_names, max_len + 2 * (q - 1)), ord(" "), dtype=np.int64 )
+    padded[:, q-1:q-1+max_len] = np.where( chars == 0, ord(" "), chars )
+
+    # Encode each window of q characters as an integer
+    n_windows = max_len + q - 1
+    codes = np.zeros( (n_names, n_windows), dtype=np.int64 )
+    for k in range(q):
+        codes = (codes << 8) | padded[:, k:k+n_windows]
+
+    # Windows past the end of a name are set to -1,
+    #  then sorting each row puts them first and groups repeated q-grams together
+    in_name = np.arange(n_windows)[np.newaxis,:] < np.where( a_lengths > 0, a_lengths + q - 1, 0 )[:,np.newaxis]
+    codes = np.sort( np.where(in_name, codes, -1), axis=1 )
+
+    # Only keep the first copy of each q-gram within a name (names are compared as sets of q-grams)
+    keep = np.empty(codes.shape, dtype=bool)
+    keep[:,0] = True
+    keep[:,1:] = codes[:,1:] != codes[:,:-1]
+    keep &= codes >= 0
+
+    rows = np.broadcast_to( np.arange(n_names)[:,np.newaxis], codes.shape )[keep]
+
+    return rows, codes[keep]
+
+# Function to generate the q-grams (substrings of length q) for a list of normalized names
+# Each name is padded with spaces so that the first and last characters
+#  get the same weight as the characters in the middle of the name
+# Each q-gram is encoded as an integer (its q bytes), which lets all of the names
+#  be processed at once with numpy instead of one name at a time
+# The names are processed in blocks of similar length (at most QGRAM_BLOCK_CELLS names x characters),
+#  so one very long name doesn't make the arrays for all of the other names as wide as it is
+# Note: Normalized names only contain [0-9a-z ], so they are plain ASCII
+# Returns: a tuple (row numbers, q-gram codes, number of distinct q-grams per name)
+#           with one (row, code) entry for each distinct q-gram of each name
+#           (in row order, and in code order within each row)
+def qgram_codes(a_names, q=3, block_cells=QGRAM_BLOCK_CELLS):
+    names = pd.Series(a_names, dtype=object).fillna("").astype(str)
+    lengths = names.str.len().to_numpy(dtype=np.int64)
+    n_names = len(names)
+
+    # Names in order of length (empty names have no q-grams)
+    order = np.argsort(lengths, kind='stable')
+    order = order[ lengths[order] > 0 ]
+    sorted_lengths = lengths[order]
+    name_array = names.to_numpy()
+
+    rows = []
+    codes = []
+    start = 0
+    while start < len(order):
+        # Largest block of names whose array (names x (longest name + padding)) fits in block_cells
+        width = sorted_lengths[start:] + 2 * (q - 1)
+        fits = np.arange(1, len(width) + 1) * width <= block_cells
+        stop = start + max( 1, int(np.argmin(fits)) if not fits.all() else len(fits) )
+
+        block = order[start:stop]
+        block_rows, block_codes = qgram_block_codes(name_array[block], lengths[block], q)
+        rows.append( block[block_rows] )
+        codes.append( block_codes )
+        start = stop
+
+    if len(rows) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.zeros(n_names, dtype=np.int32)
+
+    rows = np.concatenate(rows).astype(np.int64)
+    codes = np.concatenate(codes)
+
+    # Back to row order (the codes of each row are already sorted)
+    row_order = np.argsort(rows, kind='stable')
+    rows = rows[row_order]
+    codes = codes[row_order]
+
+    counts = np.bincount(rows, minlength=n_names).astype(np.int32)
+
+    return rows, codes, counts
+
+# Function to build a sparse (names x q-grams) 0/1 matrix for a list of normalized names
+# a_vocab: sorted array of q-gram codes, where the position of a code is its column number
+#           If None, the vocabulary is built from the names provided,
+#           otherwise q-grams that are not in the vocabulary are ignored
+# Returns: a tuple (CSR matrix, array with the number of q-grams for each name, vocabulary)
+# Note: The q-gram counts include q-grams missing from the vocabulary,
+#        so they can be used as set sizes when calculating the Jaccard similarity
+def qgram_matrix(a_names, a_vocab=None, q=3):
+    rows, codes, counts = qgram_codes(a_names, q)
+
+    if a_vocab is None:
+        a_vocab = np.unique(codes)
+
+    # Look up the column number for each q-gram
+    cols = np.searchsorted(a_vocab, codes)
+    found = cols < len(a_vocab)
+    found[found] = a_vocab[ cols[found] ] == codes[found]
+
+    gram_m = sparse.csr_matrix( (np.ones(found.sum(), dtype=np.float32), (rows[found], cols[found])),
+                                shape=(len(counts), max(len(a_vocab), 1)) )
+
+    return gram_m, counts, a_vocab
+
+# Function to build the (reusable) index used to match businesses to the licenses
+# Arguments:
+#    a_license_df: dataframe of business licenses
+#    lat_column, lon_column: columns with the lat/long of each license
+#    name_column: column with the name used for matching
+#    q: length of the q-grams used to compare names
+# Returns: a dictionary 'license_index' with elements
+#    'license_df': the license dataframe (rows with a lat/long only, index reset)
+#    'name_column': name_column
+#    'spatial_index': spatial index on the license lat/long coordinates
+#    'lat', 'lon': arrays of the license lat/long coordinates
+#    'vocab': sorted array of q-gram codes (see qgram_matrix)
+#    'gram_m': sparse (licenses x q-grams) matrix
+#    'gram_counts': number of q-grams in each license name
+#    'q': q
+def build_license_index(a_license_df, lat_column='LATITUDE', lon_column='LONGITUDE',
+                        name_column='DOING BUSINESS AS NAME', q=3):
+    # Licenses without coordinates can never pass the distance filter
+    license_df = a_license_df.dropna(subset=[lat_column, lon_column]).reset_index(drop=True)
+
+    lat = license_df[lat_column].to_numpy(dtype=np.float64)
+    lon = license_df[lon_column].to_numpy(dtype=np.float64)
+
+    # Normalize the names and generate their q-grams only once
+    gram_m, gram_counts, vocab = qgram_matrix( normalize_business_names(license_df[name_column]), q=q )
+
+    return { 'license_df': license_df,
+             'name_column': name_column,
+             'spatial_index': build_spatial_index(lat, lon),
+             'lat': lat,
+             'lon': lon,
+             'vocab': vocab,
+             'gram_m': gram_m,
+             'gram_counts': gram_counts,
+             'q': q }
+
+# Function to score candidate (business, license) pairs by name similarity
+# The Jaccard similarity of the q-gram sets is used:
+#    | grams(business) & grams(license) | / | grams(business) | grams(license) |
+# a_query_m, a_query_counts: q-gram matrix / counts for the businesses (from qgram_matrix)
+# a_license_m, a_license_counts: q-gram matrix / counts for the licenses
+# a_query_idx, a_license_idx: parallel arrays with the candidate pairs
+def score_name_pairs(a_query_m, a_query_counts, a_license_m, a_license_counts, a_query_idx, a_license_idx):
+    if len(a_query_idx) == 0:
+        return np.empty(0, dtype=np.float64)
+
+    # Size of the intersection for each pair: row-wise dot product of the 0/1 q-gram rows
+    inter = np.asarray( a_query_m[a_query_idx].multiply(a_license_m[a_license_idx]).sum(axis=1) ).ravel()
+    union = a_query_counts[a_query_idx] + a_license_counts[a_license_idx] - inter
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        score = np.where( union > 0, inter / union, 0.0 )
+
+    return score
+
+# Function to find the best matching license for each of a set of businesses
+# Arguments:
+#    a_query_lat, a_query_lon: arrays of the business lat/long coordinates
+#    a_query_names: list/Series of the business names
+#    a_license_index: index generated by build_license_index()
+#    max_dist: maximum distance (meters) between a business and its license
+#    min_name_corr: minimum name similarity for a match
+#    dist_method: distance method used for 'Select_Dist' ('haversine' or 'vincenty')
+# Returns: a tuple of arrays (license row, distance in meters, name similarity, confidence)
+#           with license row -1 (and NaN for the others) when there is no match
+# Note: Ties on name similarity are broken by the closer license,
+#        then by the lower license row, so results are deterministic
+def best_license_matches(a_query_lat, a_query_lon, a_query_names, a_license_index,
+                         max_dist=50, min_name_corr=0.5, dist_method='vincenty'):
+    query_lat = np.asarray(a_query_lat, dtype=np.float64)
+    query_lon = np.asarray(a_query_lon, dtype=np.float64)
+    n_query = len(query_lat)
+
+    match_row = np.full(n_query, -1, dtype=np.int64)
+    match_dist = np.full(n_query, np.nan)
+    match_corr = np.full(n_query, np.nan)
+    match_conf = np.full(n_query, np.nan)
+
+    # Businesses without coordinates can't be matched
+    valid = np.flatnonzero( ~(np.isnan(query_lat) | np.isnan(query_lon)) )
+    if len(valid) == 0 or a_license_index['spatial_index']['size'] == 0:
+        return match_row, match_dist, match_corr, match_conf
+
+    # Step 1: Spatial blocking - only licenses within max_dist are candidates
+    # (a small margin is added since the index uses a spherical earth)
+    qi, li = within_radius_pairs( a_license_index['spatial_index'],
+                                  np.column_stack((query_lat[valid], query_lon[valid])),
+                                  max_dist * 1.01 + 1.0 )
+    qi = valid[qi]
+
+    dist = rowwise_distance( query_lat[qi], query_lon[qi], a_license_index['lat'][li], a_license_index['lon'][li],
+                             method=dist_method )
+    keep = dist <= max_dist
+    qi, li, dist = qi[keep], li[keep], dist[keep]
+
+    # Step 2: Score the names of the surviving candidates only
+    query_m, query_counts, _ = qgram_matrix( normalize_business_names(a_query_names), a_license_index['vocab'],
+                                             a_license_index['q'] )
+    corr = score_name_pairs( query_m, query_counts,
+                             a_license_index['gram_m'], a_license_index['gram_counts'], qi, li )
+    keep = corr >= min_name_corr
+    qi, li, dist, corr = qi[keep], li[keep], dist[keep], corr[keep]
+
+    if len(qi) == 0:
+        return match_row, match_dist, match_corr, match_conf
+
+    # Step 3: Select the best candidate for each business
+    # Sort by business, then best name similarity, then shortest distance, then license row
+    order = np.lexsort( (li, dist, -corr, qi) )
+    qi, li, dist, corr = qi[order], li[order], dist[order], corr[order]
+    first = np.r_[True, qi[1:] != qi[:-1]]
+
+    # Confidence: the name similarity, discounted by up to half for distance
+    conf = corr * (1.0 - 0.5 * dist / max_dist)
+
+    match_row[qi[first]] = li[first]
+    match_dist[qi[first]] = dist[first]
+    match_corr[qi[first]] = corr[first]
+    match_conf[qi[first]] = conf[first]
+
+    return match_row, match_dist, match_corr, match_conf
+
+# Function to match each Yelp restaurant to a business license
+# (replacement for the iterrows() loop in Merge_Yelp_License.ipynb)
+# Arguments:
+#    a_yelp_df: dataframe of Yelp restaurants
+#    a_license_index: index generated by build_license_index()
+#    license_columns: dictionary of license column => output column to copy for the matched license
+#    lat_column, lon_column, name_column: Yelp columns with the lat/long and name
+#    max_dist, min_name_corr, dist_method: same as best_license_matches()
+# Returns: a copy of a_yelp_df with the columns
+#    'Select_Dist': distance (meters) to the matched license
+#    'Select_Name': name of the matched license
+#    'Name_Corr': name similarity (0 to 1) with the matched license
+#    'Match_Confidence': confidence (0 to 1) in the match
+#    plus the columns in license_columns
+#  Restaurants without a match have NaN in these columns
+def match_yelp_to_licenses(a_yelp_df, a_license_index, license_columns={'DATE ISSUED': 'Date_Issued'},
+                           lat_column='latitude', lon_column='longitude', name_column='name',
+                           max_dist=50, min_name_corr=0.5, dist_method='vincenty'):
+    match_row, match_dist, match_corr, match_conf = best_license_matches(
+        a_yelp_df[lat_column], a_yelp_df[lon_column], a_yelp_df[name_column], a_license_index,
+        max_dist=max_dist, min_name_corr=min_name_corr, dist_method=dist_method )
+
+    return add_match_columns(a_yelp_df, a_license_index, match_row, match_dist, match_corr, match_conf,
+                             license_columns)
+
+# Function to add the match result columns to a copy of the Yelp dataframe
+# (see match_yelp_to_licenses() for the columns that are added)
+def add_match_columns(a_yelp_df, a_license_index, a_match_row, a_match_dist, a_match_corr, a_match_conf,
+                      license_columns={'DATE ISSUED': 'Date_Issued'}):
+    yelp_license_df = a_yelp_df.copy()
+    license_df = a_license_index['license_df']
+    matched = a_match_row >= 0
+
+    yelp_license_df['Select_Dist'] = a_match_dist
+    yelp_license_df['Name_Corr'] = a_match_corr
+    yelp_license_df['Match_Confidence'] = a_match_conf
+
+    for (lc, oc) in [ (a_license_index['name_column'], 'Select_Name') ] + list(license_columns.items()):
+        values = pd.Series(np.nan, index=yelp_license_df.index, dtype=object)
+        values[matched] = license_df[lc].to_numpy()[ a_match_row[matched] ]
+        yelp_license_df[oc] = values
+
+    return yelp_license_df
+
+# Arrays of the license index that are shared with worker processes
+# through memory-mapped .npy files (instead of being pickled for each worker)
+SHARED_INDEX_ARRAYS = ['lat', 'lon', 'vocab', 'gram_counts', 'gram_indices', 'gram_indptr']
+
+# License index rebuilt from the shared arrays in each worker process
+worker_license_index = None
+
+# Function to save the parts of the license index needed for matching
+#  to .npy files in a_dir, so they can be memory-mapped by worker processes
+def save_shared_license_index(a_license_index, a_dir):
+    arrays = { 'lat': a_license_index['lat'],
+               'lon': a_license_index['lon'],
+               'vocab': a_license_index['vocab'],
+               'gram_counts': a_license_index['gram_counts'],
+               'gram_indices': a_license_index['gram_m'].indices,
+               'gram_indptr': a_license_index['gram_m'].indptr }
+
+    for name in SHARED_INDEX_ARRAYS:
+        np.save( os.path.join(a_dir, f"{name}.npy"), arrays[name] )
+
+# Function run once when each worker process starts:
+#  memory-map the shared license arrays and rebuild the license index from them
+def init_license_match_worker(a_dir, a_shape, a_q):
+    global worker_license_index
+
+    arrays = { name: np.load(os.path.join(a_dir, f"{name}.npy"), mmap_mode='r') for name in SHARED_INDEX_ARRAYS }
+
+    gram_m = sparse.csr_matrix( (np.ones(len(arrays['gram_indices']), dtype=np.float32),
+                                 arrays['gram_indices'], arrays['gram_indptr']), shape=a_shape )
+
+    worker_license_index = { 'spatial_index': build_spatial_index(arrays['lat'], arrays['lon']),
+                             'lat': arrays['lat'],
+                             'lon': arrays['lon'],
+                             'vocab': arrays['vocab'],
+                             'gram_m': gram_m,
+                             'gram_counts': arrays['gram_counts'],
+                             'q': a_q }
+
+# Function run by the worker processes to match one partition of the businesses
+# a_part: tuple (lat array, lon array, names list, match kwargs)
+def match_license_partition(a_part):
+    (lat, lon, names, kwargs) = a_part
+
+    return best_license_matches(lat, lon, names, worker_license_index, **kwargs)
+
+# Function to match each Yelp restaurant to a business license using multiple processes
+# Same arguments and result as match_yelp_to_licenses(), plus:
+#    workers: number of worker processes (None = number of CPUs, 1 = no worker processes)
+#    partition_column: Yelp column used to split the restaurants into partitions (e.g. 'zip')
+# Note: Each restaurant is matched independently, so the result is identical
+#        to match_yelp_to_licenses() regardless of the number of workers
+def match_yelp_to_licenses_parallel(a_yelp_df, a_license_index, license_columns={'DATE ISSUED': 'Date_Issued'},
+                                    lat_column='latitude', lon_column='longitude', name_column='name',
+                                    max_dist=50, min_name_corr=0.5, dist_method='vincenty',
+                                    workers=None, partition_column='zip'):
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    match_kwargs = { 'max_dist': max_dist, 'min_name_corr': min_name_corr, 'dist_method': dist_method }
+
+    # No worker processes for a single worker or no restaurants (there are no partitions to hand out)
+    if workers <= 1 or len(a_yelp_df) == 0:
+        return match_yelp_to_licenses(a_yelp_df, a_license_index, license_columns,
+                                      lat_column, lon_column, name_column, **match_kwargs)
+
+    lat = a_yelp_df[lat_column].to_numpy(dtype=np.float64)
+    lon = a_yelp_df[lon_column].to_numpy(dtype=np.float64)
+    names = a_yelp_df[name_column].tolist()
+
+    # Split the restaurants (row positions) into partitions, in sorted order of the partition column
+    # (restaurants missing the partition value are a partition of their own)
+    part_codes, _ = pd.factorize( a_yelp_df[partition_column].astype(str), sort=True, use_na_sentinel=False )
+    part_rows = [ np.flatnonzero(part_codes == pc) for pc in range(part_codes.max() + 1) ]
+    parts = [ (lat[pr], lon[pr], [ names[i] for i in pr ], match_kwargs) for pr in part_rows ]
+
+    n_query = len(a_yelp_df)
+    match_row = np.full(n_query, -1, dtype=np.int64)
+    match_dist = np.full(n_query, np.nan)
+    match_corr = np.full(n_query, np.nan)
+    match_conf = np.full(n_query, np.nan)
+
+    with tempfile.TemporaryDirectory() as shared_dir:
+        save_shared_license_index(a_license_index, shared_dir)
+
+        with ProcessPoolExecutor( max_workers=workers, initializer=init_license_match_worker,
+                                  initargs=(shared_dir, a_license_index['gram_m'].shape, a_license_index['q']) ) as executor:
+            # Results come back in the same order as the partitions
+            for pr, result in zip( part_rows, executor.map(match_license_partition, parts) ):
+                match_row[pr], match_dist[pr], match_corr[pr], match_conf[pr] = result
+
+    return add_match_columns(a_yelp_df, a_license_index, match_row, match_dist, match_corr, match_conf,
+                             license_columns)
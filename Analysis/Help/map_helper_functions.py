@@ -0,0 +1,421 @@
+# map_helper_functions.py
+# AUTHOR: Jeff Brown
+#
+# A collection of functions used to build a small, fast loading choropleth map of the Chicago wards
+# (replacing the folium map chicago_licenses_map.html, which embedded the full resolution boundaries):
+# the ward boundaries are quantized, simplified and encoded as TopoJSON, and the per-ward
+# metrics are stored in the feature properties instead of a separate file (Ward_Map.json)
+#
+# Each border shared by 2 wards is stored (and simplified) once, so the simplified
+# wards still meet exactly, with no gaps or overlaps between them
+
+# Dependencies
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from Help.file_helper_functions import file_hash
+from Help.polygon_helper_functions import (WARDS_GEOJSON_FILE, load_ward_index, assign_wards)
+
+# Location of the ward map
+WARD_MAP_FILE = "chicago_licenses_map.html"
+
+# Location of the number of restaurant licenses per ward (from Map_Licenses.ipynb)
+WARD_LICENSE_COUNTS_FILE = "Ward_Map.json"
+
+# Location of the cached (simplified) TopoJSON boundaries, one file per tolerance/quantization
+MAP_CACHE_DIR = "../Data/.map_cache"
+
+# Default simplification tolerance (meters) and quantization (grid steps across the map)
+MAP_TOLERANCE_METERS = 10
+MAP_QUANTIZATION = 10000
+
+# Center of the map
+CHICAGO_COORDINATES = (41.895140898, -87.624255632)
+
+# Approximate length of a degree of latitude (meters), used to measure the tolerance
+METERS_PER_DEGREE = 111195.0
+
+# Colors used for the choropleth (ColorBrewer 'Purples', as in Map_Licenses.ipynb)
+MAP_COLORS = ['#f2f0f7', '#cbc9e2', '#9e9ac8', '#756bb1', '#54278f']
+
+# Function to quantize a ring of (long, lat) coordinates (see load_quantized_geojson)
+# Returns: closed ring ((N x 2) int array) without repeated points, or None if the ring collapsed
+def quantize_ring(a_ring, a_translate, a_scale):
+    q = np.round( (np.asarray(a_ring, dtype=np.float64)[:, :2] - a_translate) / a_scale ).astype(np.int64)
+
+    first = np.ones(len(q), dtype=bool)
+    first[1:] = (q[1:] != q[:-1]).any(axis=1)
+    q = q[first]
+    if (q[0] != q[-1]).any():
+        q = np.vstack( (q, q[:1]) )
+
+    return q if len(q) >= 4 else None
+
+# Function to load the polygons of a GeoJSON file as quantized integer coordinates
+# Each coordinate becomes a point on a (a_quantization x a_quantization) grid over the bounding box
+#  of the whole file (TopoJSON's "quantized" coordinates)
+# Returns: a tuple (list of feature properties,
+#                   list of features, each a list of polygons, each a list of closed rings ((N x 2) int arrays),
+#                   TopoJSON transform {'scale': [dx, dy], 'translate': [x0, y0]})
+# Note: Repeated points created by the quantization are removed and rings that collapse are dropped
+def load_quantized_geojson(a_geojson_file, a_quantization=MAP_QUANTIZATION):
+    with open(a_geojson_file) as f:
+        geojson = json.load(f)
+
+    features = [ f for f in geojson['features'] if f['geometry'] is not None ]
+    feature_parts = [ f['geometry']['coordinates'] if f['geometry']['type'] == 'MultiPolygon'
+                      else [ f['geometry']['coordinates'] ] for f in features ]
+
+    all_points = np.concatenate( [ np.asarray(ring, dtype=np.float64)[:, :2]
+                                   for parts in feature_parts for part in parts for ring in part ] )
+    translate = all_points.min(axis=0)
+    scale = (all_points.max(axis=0) - translate) / (a_quantization - 1)
+
+    polygons = []
+    for parts in feature_parts:
+        feature_polygons = []
+        for part in parts:
+            rings = [ quantize_ring(ring, translate, scale) for ring in part ]
+
+            # A polygon whose outer ring collapsed is dropped
+            if rings[0] is not None:
+                feature_polygons.append( [ r for r in rings if r is not None ] )
+
+        polygons.append(feature_polygons)
+
+    return ( [ f['properties'] for f in features ], polygons,
+             { 'scale': scale.tolist(), 'translate': translate.tolist() } )
+
+# Function to split the rings of a set of polygons into arcs (TopoJSON topology)
+# A ring is cut wherever the polygons on the other side of its border change (a junction),
+#  so a border shared by 2 polygons becomes one arc used by both (in opposite directions)
+# Arguments:
+#    a_polygons: list of features, each a list of polygons, each a list of closed rings (see load_quantized_geojson)
+# Returns: a tuple (points: (P x 2) array of the unique points,
+#                   arcs: list of arrays of point numbers,
+#                   geometries: same nesting as a_polygons, each ring a list of arc numbers
+#                               (~n for arc n reversed))
+def extract_arcs(a_polygons):
+    rings = [ r for polygons in a_polygons for polygon in polygons for r in polygon ]
+
+    # Number the unique points and the unique (undirected) edges
+    points, point_ids = np.unique( np.concatenate(rings), axis=0, return_inverse=True )
+    point_ids = point_ids.ravel()
+    ring_bounds = np.cumsum( [0] + [ len(r) for r in rings ] )
+    ring_points = [ point_ids[ring_bounds[i]:ring_bounds[i+1]] for i in range(len(rings)) ]
+
+    edge_ring = np.concatenate( [ np.full(len(p) - 1, i) for (i, p) in enumerate(ring_points) ] )
+    edge_a = np.concatenate( [ p[:-1] for p in ring_points ] )
+    edge_b = np.concatenate( [ p[1:] for p in ring_points ] )
+    edge_key = np.minimum(edge_a, edge_b) * len(points) + np.maximum(edge_a, edge_b)
+    _, edge_id, edge_count = np.unique(edge_key, return_inverse=True, return_counts=True)
+
+    # The rings on either side of each edge (its 'signature')
+    ring_min = np.full(len(edge_count), len(rings))
+    ring_max = np.full(len(edge_count), -1)
+    np.minimum.at(ring_min, edge_id, edge_ring)
+    np.maximum.at(ring_max, edge_id, edge_ring)
+    signature = (edge_count * len(rings) + ring_min) * len(rings) + ring_max
+    edge_signature = signature[edge_id]
+
+    # A point is a junction if the signature of a ring's edges changes there (in any ring)
+    junction = np.zeros(len(points), dtype=bool)
+    edge_start = 0
+    for p in ring_points:
+        s = edge_signature[edge_start:edge_start + len(p) - 1]
+        junction[ p[:-1][ s != np.roll(s, 1) ] ] = True
+        edge_start += len(p) - 1
+
+    # Cut each ring into arcs at its junctions, storing each arc once
+    arcs = []
+    arc_lookup = {}
+    ring_arcs = []
+    for p in ring_points:
+        cuts = np.flatnonzero( junction[p[:-1]] )
+        if len(cuts) == 0:
+            # No junctions: the whole ring is one arc, starting from its lowest numbered point
+            cuts = [ int(np.argmin(p[:-1])) ]
+
+        ring = np.concatenate( (p[cuts[0]:-1], p[:cuts[0] + 1]) )
+        cuts = list( np.asarray(cuts) - cuts[0] ) + [ len(ring) - 1 ]
+
+        arc_numbers = []
+        for (i, j) in zip(cuts[:-1], cuts[1:]):
+            arc = ring[i:j + 1]
+            key = arc.tobytes()
+            if key not in arc_lookup:
+                reverse_key = arc[::-1].tobytes()
+                if reverse_key in arc_lookup:
+                    arc_numbers.append( ~arc_lookup[reverse_key] )
+                    continue
+                arc_lookup[key] = len(arcs)
+                arcs.append(arc)
+            arc_numbers.append( arc_lookup[key] )
+
+        ring_arcs.append(arc_numbers)
+
+    # Rebuild the feature/polygon/ring nesting
+    geometries = []
+    ring_iter = iter(ring_arcs)
+    for polygons in a_polygons:
+        geometries.append( [ [ next(ring_iter) for _ in polygon ] for polygon in polygons ] )
+
+    return points, arcs, geometries
+
+# Function to simplify a line (Douglas-Peucker), keeping its first and last points
+# Arguments:
+#    a_points: (N x 2) array of points (in units where the tolerance applies to both axes)
+#    a_tolerance: maximum distance of a removed point from the simplified line
+# Returns: boolean array, True for the points that are kept
+def douglas_peucker(a_points, a_tolerance):
+    keep = np.zeros(len(a_points), dtype=bool)
+    keep[0] = keep[-1] = True
+
+    stack = [ (0, len(a_points) - 1) ]
+    while len(stack) > 0:
+        (i, j) = stack.pop()
+        if j <= i + 1:
+            continue
+
+        # Distance of each point from the segment between the end points
+        # (or from the end point itself, for a closed arc)
+        d = a_points[i+1:j] - a_points[i]
+        seg = a_points[j] - a_points[i]
+        seg_len = np.hypot(*seg)
+        if seg_len > 0:
+            dist = np.abs( d[:, 0] * seg[1] - d[:, 1] * seg[0] ) / seg_len
+        else:
+            dist = np.hypot(d[:, 0], d[:, 1])
+
+        k = int(np.argmax(dist))
+        if dist[k] > a_tolerance:
+            keep[i + 1 + k] = True
+            stack.extend( [ (i, i + 1 + k), (i + 1 + k, j) ] )
+
+    return keep
+
+# Function to simplify the arcs of a topology (see extract_arcs)
+# Each arc is simplified once, so polygons sharing a border still meet exactly after simplification
+# Arguments:
+#    a_points, a_arcs, a_geometries: topology from extract_arcs()
+#    a_transform: TopoJSON transform of the quantized points
+#    a_tolerance_meters: simplification tolerance (meters)
+# Returns: list of the simplified arcs (arrays of point numbers)
+# Note: Rings that would be left with fewer than 3 corners keep their original arcs
+def simplify_arcs(a_points, a_arcs, a_geometries, a_transform, a_tolerance_meters):
+    # Convert the quantized points to (approximate) meters
+    lon_lat = a_points * a_transform['scale'] + a_transform['translate']
+    meters = lon_lat * METERS_PER_DEGREE
+    meters[:, 0] *= np.cos( np.radians(lon_lat[:, 1].mean()) )
+
+    simplified = [ arc[ douglas_peucker(meters[arc], a_tolerance_meters) ] for arc in a_arcs ]
+
+    for ring in ( r for polygons in a_geometries for polygon in polygons for r in polygon ):
+        if sum( len(simplified[a if a >= 0 else ~a]) - 1 for a in ring ) < 3:
+            for a in ring:
+                a = a if a >= 0 else ~a
+                simplified[a] = a_arcs[a]
+
+    return simplified
+
+# Function to build the (simplified, quantized) TopoJSON topology of the polygons in a GeoJSON file
+# The topology for each source file/tolerance/quantization is cached in a_cache_dir
+# Arguments:
+#    a_geojson_file: GeoJSON file with the polygons
+#    a_id_property: feature property used as the id of each polygon (the only property kept)
+#    tolerance: simplification tolerance (meters, 0: no simplification)
+#    quantization: number of grid steps across the map
+#    cache_dir: directory of cached topologies (None: don't cache)
+# Returns: TopoJSON topology (dictionary) with a single object 'polygons'
+def build_topology(a_geojson_file, a_id_property, tolerance=MAP_TOLERANCE_METERS, quantization=MAP_QUANTIZATION,
+                   cache_dir=MAP_CACHE_DIR):
+    cache_file = None
+    if cache_dir is not None:
+        source_name = os.path.splitext(os.path.basename(a_geojson_file))[0]
+        cache_file = os.path.join( cache_dir, f"{source_name}_{file_hash(a_geojson_file)[:16]}"
+                                              f"_t{tolerance:g}_q{quantization}.topojson" )
+        if os.path.exists(cache_file):
+            with open(cache_file) as f:
+                return json.load(f)
+
+    properties, polygons, transform = load_quantized_geojson(a_geojson_file, quantization)
+    points, arcs, geometries = extract_arcs(polygons)
+    if tolerance > 0:
+        arcs = simplify_arcs(points, arcs, geometries, transform, tolerance)
+
+    # Delta encode the arcs (the first point of each arc is absolute)
+    encoded_arcs = []
+    for arc in arcs:
+        q = points[arc]
+        encoded_arcs.append( np.vstack( (q[:1], np.diff(q, axis=0)) ).tolist() )
+
+    topo_geometries = []
+    for (props, geometry) in zip(properties, geometries):
+        if len(geometry) == 0:
+            continue
+        topo_geometries.append( { 'type': 'Polygon' if len(geometry) == 1 else 'MultiPolygon',
+                                  'arcs': geometry[0] if len(geometry) == 1 else geometry,
+                                  'id': props[a_id_property],
+                                  'properties': { a_id_property: props[a_id_property] } } )
+
+    topology = { 'type': 'Topology',
+                 'transform': transform,
+                 'objects': { 'polygons': { 'type': 'GeometryCollection', 'geometries': topo_geometries } },
+                 'arcs': encoded_arcs }
+
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_file, "w") as f:
+            json.dump(topology, f, separators=(',', ':'))
+
+    return topology
+
+# Function to calculate the metrics shown for each ward
+# Arguments:
+#    a_license_counts_file: JSON file with the number of restaurant licenses per ward,
+#       either Ward_Map.json ({'WARD': {ward: count}}) or the license counts of the license store ({'ward': ...})
+#    a_yelp_file: Yelp restaurants (with latitude/longitude and rating)
+#    a_cta_stops_file: CTA stops (with stop_lat/stop_lon)
+#    a_geojson_file: ward boundaries, used to find the ward of each restaurant and stop
+# Returns: a dataframe indexed by ward (string)
+def ward_metrics(a_license_counts_file, a_yelp_file, a_cta_stops_file, a_geojson_file=WARDS_GEOJSON_FILE):
+    with open(a_license_counts_file) as f:
+        counts = json.load(f)
+    license_counts = pd.Series( counts.get('ward', counts.get('WARD')), dtype=int )
+
+    ward_index = load_ward_index(a_geojson_file)
+
+    yelp_df = pd.read_csv(a_yelp_file)
+    yelp_df['ward'] = assign_wards(ward_index, yelp_df['latitude'], yelp_df['longitude'])
+    yelp_g = yelp_df.dropna(subset=['ward']).groupby('ward')['rating'].agg(['count', 'mean'])
+
+    stops_df = pd.read_csv(a_cta_stops_file)
+    stop_counts = pd.Series( assign_wards(ward_index, stops_df['stop_lat'], stops_df['stop_lon']) ).value_counts()
+
+    metrics_df = pd.DataFrame( index=pd.Index(ward_index['ids'], name='ward') )
+    metrics_df['Restaurant Licenses'] = license_counts.reindex(metrics_df.index).fillna(0).astype(int)
+    metrics_df['Yelp Restaurants'] = yelp_g['count'].reindex(metrics_df.index).fillna(0).astype(int)
+    metrics_df['Avg Yelp Rating'] = yelp_g['mean'].reindex(metrics_df.index).round(2)
+    metrics_df['CTA Stops'] = stop_counts.reindex(metrics_df.index).fillna(0).astype(int)
+
+    return metrics_df
+
+# Function to store metrics in the properties of a topology's features
+# a_metrics_df: dataframe indexed by feature id (missing values are stored as null)
+def join_topology_metrics(a_topology, a_metrics_df):
+    topology = json.loads( json.dumps(a_topology) )
+
+    metrics = a_metrics_df.astype(object).where( a_metrics_df.notna(), None )
+    for g in topology['objects']['polygons']['geometries']:
+        if str(g['id']) in metrics.index:
+            g['properties'].update( metrics.loc[str(g['id'])].to_dict() )
+
+    return topology
+
+# Page for the choropleth map: Leaflet (as used by folium) + topojson-client to decode the boundaries
+MAP_HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta http-equiv="content-type" content="text/html; charset=UTF-8" />
+<meta name="viewport" content="width=device-width, initial-scale=1.0" />
+<title>%(title)s</title>
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet@1.3.4/dist/leaflet.css"/>
+<script src="https://cdn.jsdelivr.net/npm/leaflet@1.3.4/dist/leaflet.js"></script>
+<script src="https://cdn.jsdelivr.net/npm/topojson-client@3/dist/topojson-client.min.js"></script>
+<style>
+html, body, #map {width: 100%%; height: 100%%; margin: 0; padding: 0;}
+.legend {background: white; padding: 6px 8px; font: 12px sans-serif; line-height: 18px;}
+.legend i {width: 18px; height: 18px; float: left; margin-right: 6px; opacity: %(fill_opacity)s;}
+</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+var topology = %(topology)s;
+var metric = %(metric)s, thresholds = %(thresholds)s, colors = %(colors)s;
+
+function fillColor(v) {
+    var i = 0;
+    while (i < colors.length - 1 && v >= thresholds[i + 1]) { i++; }
+    return colors[i];
+}
+
+var map = L.map('map', {center: %(center)s, zoom: 11, preferCanvas: true});
+L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png',
+            {attribution: '&copy; OpenStreetMap contributors', maxZoom: 18}).addTo(map);
+
+L.geoJson(topojson.feature(topology, topology.objects.polygons), {
+    style: function(f) {
+        return {fillColor: fillColor(f.properties[metric]), fillOpacity: %(fill_opacity)s,
+                color: '#000', weight: 1, opacity: %(line_opacity)s};
+    },
+    onEachFeature: function(f, layer) {
+        layer.bindTooltip(function() {
+            return Object.keys(f.properties).map(function(k) {
+                return '<b>' + k + '</b>: ' + (f.properties[k] === null ? 'n/a' : f.properties[k]);
+            }).join('<br>');
+        }, {sticky: true});
+    }
+}).addTo(map);
+
+var legend = L.control({position: 'topright'});
+legend.onAdd = function() {
+    var div = L.DomUtil.create('div', 'legend');
+    div.innerHTML = '<b>' + %(legend_name)s + '</b><br>' + colors.map(function(c, i) {
+        return '<i style="background:' + c + '"></i>' + thresholds[i] + ' &ndash; ' + thresholds[i + 1];
+    }).join('<br>');
+    return div;
+};
+legend.addTo(map);
+</script>
+</body>
+</html>
+"""
+
+# Function to save a choropleth map of a topology as a standalone HTML page
+# Arguments:
+#    a_topology: TopoJSON topology (see build_topology) with the metrics in its feature properties
+#    a_metric: property used to color the polygons
+#    a_save_file: HTML file to save the map to
+#    thresholds: list of bin edges for the colors (default: len(colors)+1 evenly spaced edges)
+#    colors: list of colors, one per bin
+#    legend_name: title of the legend (default: a_metric)
+# Returns: the size of the HTML file (bytes)
+def save_choropleth_html(a_topology, a_metric, a_save_file, thresholds=None, colors=MAP_COLORS, legend_name=None,
+                         fill_opacity=0.7, line_opacity=0.2, center=CHICAGO_COORDINATES, title="Chicago Wards"):
+    if thresholds is None:
+        values = [ g['properties'].get(a_metric) for g in a_topology['objects']['polygons']['geometries'] ]
+        top = max( [ v for v in values if v is not None ] + [1] )
+        thresholds = np.linspace(0, top, len(colors) + 1).round(2).tolist()
+
+    html = MAP_HTML_TEMPLATE % { 'title': title,
+                                 'topology': json.dumps(a_topology, separators=(',', ':')),
+                                 'metric': json.dumps(a_metric),
+                                 'thresholds': json.dumps(list(thresholds)),
+                                 'colors': json.dumps(list(colors)),
+                                 'legend_name': json.dumps(legend_name or a_metric),
+                                 'center': json.dumps(list(center)),
+                                 'fill_opacity': fill_opacity,
+                                 'line_opacity': line_opacity }
+
+    with open(a_save_file, "w") as f:
+        f.write(html)
+
+    return os.path.getsize(a_save_file)
+
+# Function to build the ward map: simplified ward boundaries colored by the number of restaurant licenses
+#  (same scale as Map_Licenses.ipynb), with every ward metric shown when hovering over a ward
+# Arguments: see ward_metrics and build_topology
+# Returns: the size of the HTML file (bytes)
+def build_ward_map(a_geojson_file=WARDS_GEOJSON_FILE, a_license_counts_file=WARD_LICENSE_COUNTS_FILE,
+                   a_yelp_file="../Data/Yelp_Restaurants_Chicago.csv", a_cta_stops_file="../Data/chicago_cta_stops.csv",
+                   a_save_file=WARD_MAP_FILE, tolerance=MAP_TOLERANCE_METERS, quantization=MAP_QUANTIZATION,
+                   cache_dir=MAP_CACHE_DIR):
+    topology = build_topology(a_geojson_file, 'ward', tolerance, quantization, cache_dir)
+    metrics_df = ward_metrics(a_license_counts_file, a_yelp_file, a_cta_stops_file, a_geojson_file)
+
+    return save_choropleth_html( join_topology_metrics(topology, metrics_df), 'Restaurant Licenses', a_save_file,
+                                 thresholds=[0, 4000, 8000, 12000, 16000, 20000],
+                                 legend_name="Number of Restaurant Licenses" )
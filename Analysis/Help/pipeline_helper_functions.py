@@ -0,0 +1,445 @@
+# pipeline_helper_functions.py
+# AUTHOR: Jeff Brown
+#
+# A simple pipeline runner used to (re)build the derived datasets of Project 1
+# Each stage declares its input and output files; a stage is only re-run when
+# the content of one of its inputs (or its code) has changed since it was last run,
+# and stages that don't depend on each other are run in parallel
+#
+# Usage (from the Analysis directory):
+#    python -m Help.pipeline_helper_functions --list
+#    python -m Help.pipeline_helper_functions ../Data/merged_restaurants_and_CTA_stops.csv
+#    python -m Help.pipeline_helper_functions merge_restaurants_and_cta_stops --workers 4
+
+# Dependencies
+import os
+import sys
+import json
+import inspect
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import pandas as pd
+
+from Help.file_helper_functions import file_hash
+from Help.transport_helper_functions import (closest_coords, gen_stop_access_features)
+from Help.polygon_helper_functions import (ZCTA_BOUNDARIES_FILE, load_zcta_index, assign_zipcodes)
+from Help.license_helper_functions import (LICENSE_EXPORT_FILE, LICENSE_STORE_FILE, LICENSE_UNIQUE_FILE,
+                                           LICENSE_AGGREGATES_FILE, update_license_store)
+from Help.dataset_helper_functions import (DATASETS, dataset_files, convert_csv_datasets)
+from Help.pyramid_helper_functions import (RATING_COLORS, RATING_THRESHOLDS, build_restaurant_pyramid,
+                                           pyramid_levels_df, save_pyramid_html)
+from Help.grid_helper_functions import (GRID_CELL_COLUMN, GRID_ROLLUP_LEVEL, grid_rollup, join_grid_rollups,
+                                        grid_cell_centers)
+from Help.map_helper_functions import (WARDS_GEOJSON_FILE, WARD_MAP_FILE, WARD_LICENSE_COUNTS_FILE, build_ward_map)
+from Help.geography_helper_functions import (ZIP_AREA_FILE, ZIP_CENTROIDS_FILE, GEOGRAPHY_FILE, ZIP_WARD_OVERLAP_FILE,
+                                             save_geography)
+from Help.census_matrix_helper_functions import (CENSUS_MATRIX_FILE, CENSUS_TOPIC_FILES, counts_from_topic_files,
+                                                 success_counts, build_census_matrix, save_census_matrix)
+
+# Default location of the file recording the state of the last build
+PIPELINE_STATE_FILE = "../Data/.pipeline_state.json"
+
+# Function to get the global and enclosing names a stage function uses: name => value
+def stage_references(a_func):
+    try:
+        refs = inspect.getclosurevars(a_func)
+    except TypeError:
+        return {}
+
+    return dict( refs.globals, **refs.nonlocals )
+
+# Function to find the Help modules a stage function depends on:
+#  the modules of the functions/constants it uses, and every Help module those modules use in turn
+def stage_modules(a_func):
+    values = list( stage_references(a_func).values() )
+
+    # Function to get the name of the Help module an object comes from (None for other objects)
+    def help_module(a_value):
+        name = a_value.__name__ if inspect.ismodule(a_value) else getattr(a_value, '__module__', None)
+        return name if isinstance(name, str) and name.startswith("Help.") else None
+
+    found = set()
+    pending = [ m for m in map(help_module, values) if m is not None ]
+    while len(pending) > 0:
+        name = pending.pop()
+        if name in found or name not in sys.modules:
+            continue
+        found.add(name)
+        pending.extend( m for m in map(help_module, vars(sys.modules[name]).values()) if m is not None )
+
+    return sorted(found)
+
+# Function to calculate the fingerprint of a stage:
+#  a hash of the stage's code, the source files of the Help modules it uses (see stage_modules),
+#  the constants it uses, its (optional) 'version', its input and output names, and the contents of its inputs
+# so fixing a helper function reruns the stages that depend on it
+def stage_fingerprint(a_stage, a_hash_cache=None):
+    h = hashlib.sha256()
+    try:
+        h.update( inspect.getsource(a_stage['func']).encode() )
+    except (OSError, TypeError):
+        h.update( repr(a_stage['func']).encode() )
+
+    for m in stage_modules(a_stage['func']):
+        h.update( m.encode() )
+        h.update( file_hash(os.path.abspath(sys.modules[m].__file__), a_hash_cache).encode() )
+
+    constants = { n: v for (n, v) in stage_references(a_stage['func']).items()
+                  if isinstance(v, (int, float, str, tuple, list, dict)) }
+    h.update( json.dumps(constants, sort_keys=True, default=repr).encode() )
+
+    h.update( str(a_stage.get('version', "")).encode() )
+    h.update( json.dumps([a_stage['inputs'], a_stage['outputs']]).encode() )
+    for i in a_stage['inputs']:
+        h.update( file_hash(i, a_hash_cache).encode() )
+
+    return h.hexdigest()
+
+# Function to find the stages needed to build a list of targets
+# A target is either the name of a stage or one of the files a stage outputs
+# Returns: dictionary of stage name => list of the stages it depends on,
+#  for the target stages and every stage upstream of them
+def required_stages(a_stages, a_targets):
+    producer = { os.path.normpath(o): s for (s, stage) in a_stages.items() for o in stage['outputs'] }
+
+    # Function to get the stages whose outputs are inputs of a stage
+    def upstream(a_name):
+        return sorted( { producer[os.path.normpath(i)] for i in a_stages[a_name]['inputs']
+                         if os.path.normpath(i) in producer } )
+
+    needed = {}
+    todo = []
+    for t in a_targets:
+        if t in a_stages:
+            todo.append(t)
+        elif os.path.normpath(t) in producer:
+            todo.append( producer[os.path.normpath(t)] )
+        else:
+            raise KeyError(f"Unknown pipeline target: {t}")
+
+    while len(todo) > 0:
+        s = todo.pop()
+        if s not in needed:
+            needed[s] = upstream(s)
+            todo.extend(needed[s])
+
+    return needed
+
+# Function to build a list of targets, re-running only the stages that are out of date
+# Arguments:
+#    a_stages: dictionary of stage name => {'inputs': [files], 'outputs': [files], 'func': function}
+#              (plus an optional 'version', changed to force the stage to rerun)
+#              where func(inputs, outputs) builds the output files from the input files
+#    a_targets: list of stage names and/or output files to build (default: every stage)
+#    state_file: file recording the fingerprint of each stage from the last build
+#    max_workers: maximum number of stages to run at the same time
+#    force: if True, re-run every stage needed for the targets
+# Returns: dictionary of stage name => 'ran' or 'up to date'
+def build_targets(a_stages, a_targets=None, state_file=PIPELINE_STATE_FILE, max_workers=4, force=False):
+    if a_targets is None:
+        a_targets = list(a_stages.keys())
+
+    needed = required_stages(a_stages, a_targets)
+
+    state = {'stages': {}, 'files': {}}
+    if os.path.exists(state_file):
+        with open(state_file) as f:
+            state = json.load(f)
+
+    state_lock = threading.Lock()
+    results = {}
+
+    # Function to run a stage if it's out of date (called once all of its upstream stages are done)
+    def run_stage(a_name):
+        stage = a_stages[a_name]
+
+        with state_lock:
+            fingerprint = stage_fingerprint(stage, state['files'])
+
+        up_to_date = ( not force and state['stages'].get(a_name) == fingerprint and
+                       all(os.path.exists(o) for o in stage['outputs']) )
+        if up_to_date:
+            return 'up to date'
+
+        print(f"Running stage: {a_name}")
+        stage['func'](stage['inputs'], stage['outputs'])
+
+        # Record the fingerprint and save the state after each stage,
+        #  so completed stages are not re-run if a later stage fails
+        with state_lock:
+            state['stages'][a_name] = fingerprint
+            with open(state_file, "w") as f:
+                json.dump(state, f, indent=1)
+
+        return 'ran'
+
+    # Run the stages as their upstream stages complete
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while len(results) < len(needed):
+            ready = [ s for s in sorted(needed) if s not in results and s not in running.values()
+                      and all(u in results for u in needed[s]) ]
+            for s in ready:
+                running[executor.submit(run_stage, s)] = s
+
+            done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+
+    return results
+
+# Stage: assign each CTA stop the zipcode (ZCTA polygon) that contains it
+# (from jeff_fix_for_transport_data.ipynb, which used the zipcode with the closest centroid)
+# Stops outside every ZCTA polygon - or all stops, if the ZCTA boundaries are not available -
+#  fall back to the zipcode with the closest centroid
+# inputs: CTA stops, US zipcode centroids, [ZCTA boundaries]
+# outputs: corrected CTA stops
+def fix_cta_zips_stage(a_inputs, a_outputs):
+    c_cta_stops_df = pd.read_csv(a_inputs[0])
+    zip_latlong_df = pd.read_csv(a_inputs[1])
+    zcta_index = load_zcta_index(a_inputs[2]) if len(a_inputs) > 2 else None
+
+    # Only Chicago area zipcodes
+    zip_c_only_df = zip_latlong_df.loc[ (zip_latlong_df['ZIP'] > 60000) & (zip_latlong_df['ZIP'] < 61000) ]
+
+    zips, in_polygon = assign_zipcodes( zcta_index, c_cta_stops_df['stop_lat'], c_cta_stops_df['stop_lon'],
+                                        zip_c_only_df['ZIP'], zip_c_only_df['LAT'], zip_c_only_df['LNG'] )
+
+    # Report how many stops are assigned a different zipcode than by closest centroid alone
+    closest_zip_index = closest_coords( zip_c_only_df[['LAT', 'LNG']].to_numpy(),
+                                        c_cta_stops_df[['stop_lat', 'stop_lon']].to_numpy() )
+    closest_zips = zip_c_only_df['ZIP'].to_numpy()[closest_zip_index]
+    changed = (zips.astype(int) != closest_zips).sum()
+    print(f"fix_cta_zips: {in_polygon.sum()} of {len(zips)} stops assigned by ZCTA polygon, "
+          f"{(~in_polygon).sum()} by closest centroid; {changed} zipcodes changed vs. closest centroid")
+
+    c_cta_stops_df['postal_code'] = zips.astype(int)
+
+    c_cta_stops_df.to_csv(a_outputs[0], index=False)
+
+# Stage: aggregate the Yelp restaurants and CTA stops by zipcode
+# (from jeff_transport_data_merge.ipynb)
+# inputs: corrected CTA stops, Yelp restaurants, US zipcode centroids
+# outputs: merged restaurants and CTA stops
+def merge_restaurants_and_cta_stops_stage(a_inputs, a_outputs):
+    c_cta_stops_df = pd.read_csv(a_inputs[0])
+    rest_zip_df = pd.read_csv(a_inputs[1])
+    zip_latlong_df = pd.read_csv(a_inputs[2])
+
+    # Number of CTA stops in each zipcode
+    c_cta_stop_count = c_cta_stops_df['postal_code'].value_counts().sort_index().rename("Total CTA Stops")
+
+    # Convert the price from '$' format to numerical value
+    rest_zip_df['price_num'] = rest_zip_df['price'].apply(len)
+
+    rest_z_g_df = rest_zip_df.groupby('zip').agg({'name':'count',
+                                                  'rating':'mean',
+                                                  'review_count':['median','mean','sum'],
+                                                  'price_num':'mean'})
+
+    merged_rest_df = pd.DataFrame()
+    merged_rest_df['Total Restaurants'] = rest_z_g_df['name']['count']
+    merged_rest_df['Avg Rating'] = rest_z_g_df['rating']['mean']
+    merged_rest_df['Total Reviews'] = rest_z_g_df['review_count']['sum']
+    merged_rest_df['Median Reviews'] = rest_z_g_df['review_count']['median']
+    merged_rest_df['Avg Reviews'] = rest_z_g_df['review_count']['mean']
+    merged_rest_df['Avg Price (# of $)'] = rest_z_g_df['price_num']['mean']
+
+    merged_rest_df = pd.merge(merged_rest_df, c_cta_stop_count.to_frame(),
+                              how='left', left_index=True, right_index=True)
+
+    # Add the zipcode lat/long coords
+    zip_c_only_df = zip_latlong_df.loc[ (zip_latlong_df['ZIP'] > 60000) & (zip_latlong_df['ZIP'] < 61000) ]
+    merged_rest_df = pd.merge(merged_rest_df, zip_c_only_df.set_index('ZIP'),
+                              how='left', left_index=True, right_index=True)
+    merged_rest_df = merged_rest_df.rename( columns={'LAT': 'Latitude', 'LNG': 'Longitude'})
+    merged_rest_df.index.name = 'zip'
+
+    merged_rest_df.to_csv(a_outputs[0], index=True)
+
+# Stage: CTA stop accessibility features for each Yelp restaurant
+# (distance to the nearest stop and number of stops within each radius - see gen_stop_access_features)
+# inputs: CTA stops, Yelp restaurants
+# outputs: restaurant accessibility features
+def restaurant_cta_access_stage(a_inputs, a_outputs):
+    c_cta_stops_df = pd.read_csv(a_inputs[0])
+    rest_df = pd.read_csv(a_inputs[1])
+
+    access_df = gen_stop_access_features(rest_df, c_cta_stops_df).round(1)
+
+    pd.concat( [rest_df[['zip', 'name', 'type', 'latitude', 'longitude']], access_df], axis=1 ) \
+        .to_csv(a_outputs[0], index=False)
+
+# Stage: update the restaurant license store from the business license export
+# (replaces reading the whole export into memory in Chicago Restaurant Licenses.ipynb)
+# The first run ingests the whole export; after that only the new and corrected licenses
+#  are added to the store and the license counts are patched (see update_license_store)
+# inputs: business license export
+# outputs: restaurant licenses, restaurant licenses with one per business name, license counts
+def ingest_licenses_stage(a_inputs, a_outputs):
+    result = update_license_store(a_inputs[0], a_outputs[0], a_outputs[1], a_outputs[2])
+    print(f"ingest_licenses: {result['mode']} update, {result['inserted']} licenses inserted, "
+          f"{result['replaced']} replaced")
+
+# Stage: build the ward map (replaces the folium choropleth in Map_Licenses.ipynb)
+# The ward boundaries are simplified and stored as TopoJSON with the ward metrics (see build_ward_map)
+# inputs: ward boundaries, license counts per ward, Yelp restaurants, CTA stops
+# outputs: ward map
+def ward_map_stage(a_inputs, a_outputs):
+    size = build_ward_map(a_inputs[0], a_inputs[1], a_inputs[2], a_inputs[3], a_outputs[0])
+    print(f"ward_map: {a_outputs[0]} ({size / 1024:.0f} KB)")
+
+# Stage: aggregate the restaurants (and restaurant licenses) into map grid cells for each zoom level
+# (replaces drawing every restaurant as a gmaps marker in Yelp_Data.ipynb - see build_restaurant_pyramid)
+# inputs: Yelp restaurants (one file per city), [restaurant license store]
+# outputs: cells of every zoom level, restaurant cell map
+def restaurant_cells_stage(a_inputs, a_outputs):
+    yelp_files = [ i for i in a_inputs if i != LICENSE_STORE_FILE ]
+    pyramid = build_restaurant_pyramid( yelp_files, LICENSE_STORE_FILE if LICENSE_STORE_FILE in a_inputs else None )
+
+    pyramid_levels_df(pyramid).to_parquet(a_outputs[0], index=False)
+    size = save_pyramid_html( pyramid, a_outputs[1], 'Rating', RATING_THRESHOLDS, RATING_COLORS,
+                              popup_columns=['Name', 'City', 'Rating', 'Reviews', 'Type'], popup_sort_column='Reviews',
+                              title="Restaurant Cells" )
+    print(f"restaurant_cells: {len(pyramid['points'])} points, "
+          f"{sum( len(l) for l in pyramid['levels'].values() )} cells, {a_outputs[1]} ({size / 1024:.0f} KB)")
+
+# Stage: roll up the Yelp restaurants, CTA stops and restaurant licenses to grid cells and join them
+# on the cell key (see grid_helper_functions), giving a location table finer than zipcodes
+# inputs: Yelp restaurants (Parquet), CTA stops (Parquet), [restaurant license store]
+# outputs: grid cell rollups
+def grid_rollups_stage(a_inputs, a_outputs):
+    yelp_df = pd.read_parquet(a_inputs[0], columns=[GRID_CELL_COLUMN, 'rating', 'review_count'])
+    stops_df = pd.read_parquet(a_inputs[1], columns=[GRID_CELL_COLUMN])
+
+    rollups = { 'Yelp': grid_rollup( yelp_df, GRID_ROLLUP_LEVEL, { 'Avg Rating': ('rating', 'mean'),
+                                                                   'Reviews': ('review_count', 'sum') } ),
+                'CTA Stops': grid_rollup( stops_df, GRID_ROLLUP_LEVEL ) }
+    if len(a_inputs) > 2:
+        rollups['Licenses'] = grid_rollup( pd.read_parquet(a_inputs[2], columns=[GRID_CELL_COLUMN]), GRID_ROLLUP_LEVEL )
+
+    rollup_df = join_grid_rollups(rollups)
+    rollup_df['Latitude'], rollup_df['Longitude'] = grid_cell_centers(rollup_df.index, GRID_ROLLUP_LEVEL)
+
+    rollup_df.reset_index().to_parquet(a_outputs[0], index=False)
+    print(f"grid_rollups: {len(rollup_df)} cells at grid level {GRID_ROLLUP_LEVEL}")
+
+# Stage: build the Chicago zipcode table (zipcode => zip_key, area, centroid, ward overlap - see build_geography)
+# inputs: zipcode => area map, US zipcode centroids, ward boundaries, [ZCTA boundaries]
+# outputs: zipcode table, zipcode/ward overlap
+def zip_geography_stage(a_inputs, a_outputs):
+    geography_df, overlap_df = save_geography( a_outputs[0], a_outputs[1], area_file=a_inputs[0],
+                                               centroids_file=a_inputs[1], wards_file=a_inputs[2],
+                                               zcta_file=a_inputs[3] if len(a_inputs) > 3 else None )
+    print(f"zip_geography: {len(geography_df)} zipcodes, {len(overlap_df)} zipcode/ward pairs")
+
+# Stage: build the Census zipcode x feature table (see census_matrix_helper_functions)
+# inputs: Chicago zipcode table, Yelp restaurants (Parquet), census topic files
+# outputs: Census zipcode x feature table
+def census_matrix_stage(a_inputs, a_outputs):
+    geography_df = pd.read_parquet(a_inputs[0])
+    yelp_df = pd.read_parquet(a_inputs[1], columns=['zip_key', 'rating'])
+
+    topic_files = dict( zip(CENSUS_TOPIC_FILES, a_inputs[2:]) )
+    matrix_df = build_census_matrix( counts_from_topic_files(geography_df, topic_files),
+                                     success_counts(yelp_df, geography_df), geography_df )
+    save_census_matrix(matrix_df, a_outputs[0])
+    print(f"census_matrix: {len(matrix_df)} zipcodes x {matrix_df.shape[1] - 2} features")
+
+# Stage: convert one of the CSV datasets to Parquet (see dataset_helper_functions)
+def parquet_stage(a_name):
+    def stage_func(a_inputs, a_outputs):
+        convert_csv_datasets([a_name], os.path.dirname(a_inputs[0]))
+
+    return stage_func
+
+# The Project 1 pipeline stages
+PIPELINE_STAGES = {
+    'fix_cta_zips': {
+        'inputs': ["../Data/chicago_cta_stops.csv", "../Raw Data/US_Zip_Codes_from_2013_Government_Data.csv"] +
+                  ( [ZCTA_BOUNDARIES_FILE] if os.path.exists(ZCTA_BOUNDARIES_FILE) else [] ),
+        'outputs': ["../Data/corrected_chicago_cta_stops.csv"],
+        'func': fix_cta_zips_stage },
+    'merge_restaurants_and_cta_stops': {
+        'inputs': ["../Data/corrected_chicago_cta_stops.csv", "../Data/Yelp_Restaurants_Chicago.csv",
+                   "../Raw Data/US_Zip_Codes_from_2013_Government_Data.csv"],
+        'outputs': ["../Data/merged_restaurants_and_CTA_stops.csv"],
+        'func': merge_restaurants_and_cta_stops_stage },
+    'restaurant_cta_access': {
+        'inputs': ["../Data/chicago_cta_stops.csv", "../Data/Yelp_Restaurants_Chicago.csv"],
+        'outputs': ["../Data/Yelp_Restaurants_CTA_Access.csv"],
+        'func': restaurant_cta_access_stage },
+    'ward_map': {
+        # Use the license counts from the license store once it has been built
+        'inputs': [WARDS_GEOJSON_FILE,
+                   LICENSE_AGGREGATES_FILE if os.path.exists(LICENSE_AGGREGATES_FILE) else WARD_LICENSE_COUNTS_FILE,
+                   "../Data/Yelp_Restaurants_Chicago.csv", "../Data/chicago_cta_stops.csv"],
+        'outputs': [WARD_MAP_FILE],
+        'func': ward_map_stage },
+    'restaurant_cells': {
+        'inputs': ["../Data/Yelp_Restaurants_Chicago.csv", "../Data/Yelp_Restaurants_New_York.csv"] +
+                  ( [LICENSE_STORE_FILE] if os.path.exists(LICENSE_STORE_FILE) else [] ),
+        'outputs': ["../Data/Restaurant_Cells.parquet", "restaurant_cells_map.html"],
+        'func': restaurant_cells_stage },
+}
+
+# The license export is not in the repository (download it to LICENSE_EXPORT_FILE)
+if os.path.exists(LICENSE_EXPORT_FILE):
+    PIPELINE_STAGES['ingest_licenses'] = { 'inputs': [LICENSE_EXPORT_FILE],
+                                           'outputs': [LICENSE_STORE_FILE, LICENSE_UNIQUE_FILE,
+                                                       LICENSE_AGGREGATES_FILE],
+                                           'func': ingest_licenses_stage }
+
+# Grid cell rollups of the datasets with locations (built from their Parquet files, which have the cell ids)
+PIPELINE_STAGES['grid_rollups'] = { 'inputs': [ dataset_files('yelp_chicago')[1], dataset_files('cta_stops')[1] ] +
+                                              ( [LICENSE_STORE_FILE] if os.path.exists(LICENSE_STORE_FILE) else [] ),
+                                    'outputs': ["../Data/Grid_Rollups.parquet"],
+                                    'func': grid_rollups_stage }
+
+# Chicago zipcode table (the zip_key of the datasets with a zipcode)
+PIPELINE_STAGES['zip_geography'] = { 'inputs': [ZIP_AREA_FILE, ZIP_CENTROIDS_FILE, WARDS_GEOJSON_FILE] +
+                                               ( [ZCTA_BOUNDARIES_FILE] if os.path.exists(ZCTA_BOUNDARIES_FILE) else [] ),
+                                     'outputs': [GEOGRAPHY_FILE, ZIP_WARD_OVERLAP_FILE],
+                                     'func': zip_geography_stage }
+
+# Census zipcode x feature table (built once from the census topic files)
+PIPELINE_STAGES['census_matrix'] = { 'inputs': [ GEOGRAPHY_FILE, dataset_files('yelp_chicago')[1] ] +
+                                               list( CENSUS_TOPIC_FILES.values() ),
+                                     'outputs': [CENSUS_MATRIX_FILE],
+                                     'func': census_matrix_stage }
+
+# One stage per Parquet dataset (these are independent, so they run in parallel)
+# Datasets with a zipcode are rebuilt when the zipcode table changes
+for ds_name in DATASETS:
+    ds_csv, ds_parquet = dataset_files(ds_name)
+    PIPELINE_STAGES[f"parquet_{ds_name}"] = { 'inputs': [ds_csv] + ( [GEOGRAPHY_FILE] if 'zip_key' in DATASETS[ds_name]
+                                                                     else [] ),
+                                              'outputs': [ds_parquet],
+                                              'func': parquet_stage(ds_name) }
+
+# Command line entry point
+def main(a_argv=None):
+    parser = argparse.ArgumentParser(description="Build Project 1 datasets (run from the Analysis directory)")
+    parser.add_argument("targets", nargs="*", help="stage names or output files to build (default: all)")
+    parser.add_argument("--list", action="store_true", help="list the pipeline stages")
+    parser.add_argument("--force", action="store_true", help="re-run stages even if they are up to date")
+    parser.add_argument("--workers", type=int, default=4, help="maximum number of stages to run at once")
+    parser.add_argument("--state-file", default=PIPELINE_STATE_FILE)
+    args = parser.parse_args(a_argv)
+
+    if args.list:
+        for (name, stage) in PIPELINE_STAGES.items():
+            print(f"{name}: {', '.join(stage['inputs'])} => {', '.join(stage['outputs'])}")
+        return 0
+
+    results = build_targets(PIPELINE_STAGES, args.targets or None, state_file=args.state_file,
+                            max_workers=args.workers, force=args.force)
+    for (name, result) in sorted(results.items()):
+        print(f"{name}: {result}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
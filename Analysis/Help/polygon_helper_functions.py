@@ -0,0 +1,388 @@
+# polygon_helper_functions.py
+# AUTHOR: Jeff Brown
+#
+# A collection of functions used to assign lat/long points to the polygon
+# (e.g. Chicago ward) that contains them, for millions of points at a time
+# in support of spatial joins of the License, Yelp and CTA data with Project 1
+
+# Dependencies
+import os
+import json
+import numpy as np
+
+from Help.spatial_helper_functions import (build_spatial_index, nearest_geodesic)
+
+# Location of the Chicago ward boundaries
+WARDS_GEOJSON_FILE = "../Data/Boundaries_Wards.geojson"
+
+# Location of the Census ZIP Code Tabulation Area (ZCTA) boundaries
+#  (GeoJSON, or a shapefile such as the Census cartographic boundary file cb_2013_us_zcta510_500k.shp)
+# and the feature property holding the 5 digit zipcode
+ZCTA_BOUNDARIES_FILE = "../Raw Data/ZCTA_Boundaries.geojson"
+ZCTA_ID_PROPERTY = 'ZCTA5CE10'
+
+# Function to load the polygons from a GeoJSON file
+# a_id_property: feature property used as the id of each polygon, e.g. 'ward'
+# Returns: a tuple (list of ids, list of polygons) where each polygon is
+#  a list of rings (outer boundaries and holes), each an (N x 2) array of (long, lat)
+# Note: The parts of a MultiPolygon are combined into a single polygon (list of rings)
+def load_geojson_polygons(a_geojson_file, a_id_property):
+    with open(a_geojson_file) as f:
+        geojson = json.load(f)
+
+    ids = []
+    polygons = []
+    for feature in geojson['features']:
+        geometry = feature['geometry']
+        if geometry is None:
+            continue
+
+        parts = geometry['coordinates'] if geometry['type'] == 'MultiPolygon' else [geometry['coordinates']]
+
+        ids.append( feature['properties'][a_id_property] )
+        polygons.append( [ np.asarray(ring, dtype=np.float64)[:, :2] for part in parts for ring in part ] )
+
+    return ids, polygons
+
+# Function to load the polygons from a shapefile (same results as load_geojson_polygons)
+# Note: Requires the pyshp library (import shapefile)
+def load_shapefile_polygons(a_shapefile, a_id_property):
+    import shapefile
+
+    ids = []
+    polygons = []
+    with shapefile.Reader(a_shapefile) as sf:
+        for sr in sf.iterShapeRecords():
+            points = np.asarray(sr.shape.points, dtype=np.float64).reshape(-1, 2)
+            if len(points) == 0:
+                continue
+
+            # Each part of the shape is a ring (outer boundary or hole)
+            bounds = list(sr.shape.parts) + [len(points)]
+
+            ids.append( sr.record[a_id_property] )
+            polygons.append( [ points[bounds[i]:bounds[i+1]] for i in range(len(bounds) - 1) ] )
+
+    return ids, polygons
+
+# Function to load the polygons from a GeoJSON file or a shapefile (based on the file extension)
+def load_polygons(a_file, a_id_property):
+    if os.path.splitext(a_file)[1].lower() == ".shp":
+        return load_shapefile_polygons(a_file, a_id_property)
+
+    return load_geojson_polygons(a_file, a_id_property)
+
+# Function to bulk load an R-tree (Sort-Tile-Recursive) over a set of bounding boxes
+# a_bboxes: (N x 4) array of (x_min, y_min, x_max, y_max)
+# Returns: a tuple (order, levels) where
+#    order: the boxes in leaf order (the tree's leaves are a_bboxes[order])
+#    levels: list of tree levels from the root down, each a dictionary with
+#             'bbox': (nodes x 4) bounding box of each node
+#             'start', 'end': range of each node's children in the level below
+#                             (for the last level, the range of leaves in order)
+def build_rtree(a_bboxes, node_capacity=16):
+    n = len(a_bboxes)
+
+    # Sort-Tile-Recursive: sort into vertical slices by x, then within each slice by y
+    centers = (a_bboxes[:, :2] + a_bboxes[:, 2:]) / 2
+    n_leaf_nodes = max(1, int(np.ceil(n / node_capacity)))
+    n_slices = max(1, int(np.ceil(np.sqrt(n_leaf_nodes))))
+    slice_size = n_slices * node_capacity
+
+    order = np.argsort(centers[:, 0], kind='stable')
+    slice_of = np.arange(n) // slice_size
+    order = order[ np.lexsort( (centers[order, 1], slice_of) ) ]
+
+    # Build the levels from the leaves up, grouping node_capacity children per node
+    levels = []
+    child_bbox = a_bboxes[order]
+    while True:
+        starts = np.arange(0, len(child_bbox), node_capacity)
+        ends = np.minimum(starts + node_capacity, len(child_bbox))
+        bbox = np.column_stack( (np.minimum.reduceat(child_bbox[:, 0], starts),
+                                 np.minimum.reduceat(child_bbox[:, 1], starts),
+                                 np.maximum.reduceat(child_bbox[:, 2], starts),
+                                 np.maximum.reduceat(child_bbox[:, 3], starts)) )
+        levels.insert(0, {'bbox': bbox, 'start': starts, 'end': ends})
+
+        if len(bbox) == 1:
+            break
+        child_bbox = bbox
+
+    return order, levels
+
+# Function to find the (point, leaf) pairs where the point is inside the leaf's bounding box
+# a_x, a_y: arrays of point coordinates
+# Returns: a tuple (point indices, leaf indices) - leaf indices are in the tree's leaf order
+def query_rtree(a_levels, a_leaf_bbox, a_x, a_y):
+    point_idx = np.arange(len(a_x))
+    node_idx = np.zeros(len(a_x), dtype=np.intp)
+
+    # Descend the tree, keeping only the children whose bounding boxes contain the point
+    for level in a_levels + [{'bbox': a_leaf_bbox}]:
+        bbox = level['bbox']
+        px = a_x[point_idx]
+        py = a_y[point_idx]
+        inside = (bbox[node_idx, 0] <= px) & (px <= bbox[node_idx, 2]) & \
+                 (bbox[node_idx, 1] <= py) & (py <= bbox[node_idx, 3])
+        point_idx, node_idx = point_idx[inside], node_idx[inside]
+
+        # Expand each node into its children (not needed for the leaves)
+        if 'start' in level:
+            counts = level['end'][node_idx] - level['start'][node_idx]
+            first = np.repeat( level['start'][node_idx] - np.cumsum(counts) + counts, counts )
+            point_idx = np.repeat(point_idx, counts)
+            node_idx = first + np.arange(len(first))
+
+    return point_idx, node_idx
+
+# Function to build the index used to find the polygon containing each point
+# The index has 3 parts:
+#  - an R-tree over the polygon bounding boxes, to find candidate polygons for each point
+#  - for each polygon, its edges bucketed into horizontal bands, so that the ray casting test
+#     for a point only looks at the few edges in the point's band
+#  - a grid over all of the polygons: grid cells that no polygon edge passes through are
+#     entirely inside one polygon (or outside all of them), so they are resolved once here
+#     and points falling in them don't need the R-tree or ray casting at all
+# Arguments:
+#    a_ids: list of polygon ids
+#    a_polygons: list of polygons (list of rings, each an (N x 2) array of (long, lat))
+#    node_capacity: maximum number of children of each R-tree node
+#    edges_per_band: target average number of edges per band
+#    grid_size: number of grid cells along each axis (default: based on the number of edges)
+# Returns: a dictionary 'polygon_index'
+def build_polygon_index(a_ids, a_polygons, node_capacity=8, edges_per_band=4, grid_size=None):
+    n = len(a_polygons)
+
+    # Edges (x1, y1) => (x2, y2) of every ring of every polygon
+    edges = []
+    edge_owner = []
+    for (pi, rings) in enumerate(a_polygons):
+        for ring in rings:
+            if len(ring) < 2:
+                continue
+            # Close the ring if needed
+            if (ring[0] != ring[-1]).any():
+                ring = np.vstack( (ring, ring[:1]) )
+            edges.append( np.hstack( (ring[:-1], ring[1:]) ) )
+            edge_owner.append( np.full(len(ring) - 1, pi) )
+
+    edges = np.vstack(edges) if edges else np.empty((0, 4))
+    edge_owner = np.concatenate(edge_owner) if edge_owner else np.empty(0, dtype=np.intp)
+
+    # Every edge bounds the grid cells it passes through, but the ray casting tables leave out
+    # the horizontal edges (a horizontal ray never crosses them)
+    all_edges = edges
+    keep = edges[:, 1] != edges[:, 3]
+    edges, edge_owner = edges[keep], edge_owner[keep]
+
+    # Bounding box of each polygon
+    bboxes = np.full( (n, 4), np.nan )
+    for (pi, rings) in enumerate(a_polygons):
+        pts = np.vstack(rings) if rings else np.empty((0, 2))
+        if len(pts) > 0:
+            bboxes[pi] = (pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max(), pts[:, 1].max())
+
+    # Horizontal bands for each polygon
+    n_edges = np.bincount(edge_owner, minlength=n)
+    n_bands = np.clip( n_edges // edges_per_band, 1, 4096 )
+    band_offset = np.concatenate( ([0], np.cumsum(n_bands)) )
+    band_y0 = np.nan_to_num(bboxes[:, 1])
+    band_h = np.where( n_bands > 0, np.nan_to_num(bboxes[:, 3] - bboxes[:, 1]) / n_bands, 1.0 )
+    band_h[band_h <= 0] = 1.0
+
+    # Add each edge to every band it crosses
+    y_lo = np.minimum(edges[:, 1], edges[:, 3])
+    y_hi = np.maximum(edges[:, 1], edges[:, 3])
+    b_lo = np.clip( ((y_lo - band_y0[edge_owner]) / band_h[edge_owner]).astype(np.intp), 0, n_bands[edge_owner] - 1 )
+    b_hi = np.clip( ((y_hi - band_y0[edge_owner]) / band_h[edge_owner]).astype(np.intp), 0, n_bands[edge_owner] - 1 )
+    counts = b_hi - b_lo + 1
+    band_edge = np.repeat( np.arange(len(edges)), counts )
+    band_id = band_offset[edge_owner][band_edge] + np.repeat(b_lo, counts) + \
+              ( np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) )
+
+    order = np.argsort(band_id, kind='stable')
+    band_edge = band_edge[order]
+    band_ptr = np.searchsorted( band_id[order], np.arange(band_offset[-1] + 1) )
+
+    # R-tree over the bounding boxes of the polygons (polygons without any points are left out)
+    has_bbox = np.flatnonzero( ~np.isnan(bboxes[:, 0]) )
+    leaf_order, levels = build_rtree(bboxes[has_bbox], node_capacity)
+
+    polygon_index = { 'ids': list(a_ids),
+                      'bboxes': bboxes,
+                      'rtree_levels': levels,
+                      'rtree_leaves': has_bbox[leaf_order],
+                      'edges': edges,
+                      'band_offset': band_offset,
+                      'n_bands': n_bands,
+                      'band_y0': band_y0,
+                      'band_h': band_h,
+                      'band_ptr': band_ptr,
+                      'band_edge': band_edge }
+
+    # Grid over the extent of all of the polygons
+    if grid_size is None:
+        grid_size = int( np.clip(np.sqrt(len(all_edges)), 16, 1024) )
+    extent = ( np.nanmin(bboxes[:, 0]), np.nanmin(bboxes[:, 1]), np.nanmax(bboxes[:, 2]), np.nanmax(bboxes[:, 3]) ) \
+             if len(has_bbox) > 0 else (0.0, 0.0, 1.0, 1.0)
+    cell_w = max(extent[2] - extent[0], 1e-12) / grid_size
+    cell_h = max(extent[3] - extent[1], 1e-12) / grid_size
+
+    # Mark the cells that an edge (bounding box) passes through, including the horizontal edges
+    ex0 = np.minimum(all_edges[:, 0], all_edges[:, 2])
+    ex1 = np.maximum(all_edges[:, 0], all_edges[:, 2])
+    ey0 = np.minimum(all_edges[:, 1], all_edges[:, 3])
+    ey1 = np.maximum(all_edges[:, 1], all_edges[:, 3])
+    cx0 = np.clip( ((ex0 - extent[0]) / cell_w).astype(np.intp), 0, grid_size - 1 )
+    cx1 = np.clip( ((ex1 - extent[0]) / cell_w).astype(np.intp), 0, grid_size - 1 )
+    cy0 = np.clip( ((ey0 - extent[1]) / cell_h).astype(np.intp), 0, grid_size - 1 )
+    cy1 = np.clip( ((ey1 - extent[1]) / cell_h).astype(np.intp), 0, grid_size - 1 )
+    w = cx1 - cx0 + 1
+    counts = w * (cy1 - cy0 + 1)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cell_x = np.repeat(cx0, counts) + k % np.repeat(w, counts)
+    cell_y = np.repeat(cy0, counts) + k // np.repeat(w, counts)
+
+    boundary = np.zeros(grid_size * grid_size, dtype=bool)
+    boundary[cell_y * grid_size + cell_x] = True
+
+    # Resolve every other cell using its center point
+    # (-2 marks the cells whose points have to be located one by one)
+    cell_value = np.full(grid_size * grid_size, -2, dtype=np.intp)
+    resolved = np.flatnonzero(~boundary)
+    cell_value[resolved] = locate_points_exact( polygon_index,
+                                                extent[0] + (resolved % grid_size + 0.5) * cell_w,
+                                                extent[1] + (resolved // grid_size + 0.5) * cell_h )
+
+    polygon_index.update( { 'grid_size': grid_size, 'grid_extent': extent,
+                            'cell_w': cell_w, 'cell_h': cell_h, 'cell_value': cell_value } )
+
+    return polygon_index
+
+# Function to find the polygon that contains each point, using the R-tree and ray casting
+# a_index: index generated by build_polygon_index()
+# a_x, a_y: arrays of point coordinates (long, lat)
+# Returns: array with the position (in a_index['ids']) of the polygon containing each point,
+#           or -1 if the point is not inside any polygon
+# Note: If polygons overlap, the polygon that comes first is returned
+def locate_points_exact(a_index, a_x, a_y):
+    result = np.full(len(a_x), -1, dtype=np.intp)
+    edges = a_index['edges']
+
+    # Candidate polygons: the point is inside the polygon's bounding box
+    pt, leaf = query_rtree(a_index['rtree_levels'], a_index['bboxes'][a_index['rtree_leaves']], a_x, a_y)
+    poly = a_index['rtree_leaves'][leaf]
+
+    # Edges in the point's band of each candidate polygon
+    band = np.clip( ((a_y[pt] - a_index['band_y0'][poly]) / a_index['band_h'][poly]).astype(np.intp),
+                    0, a_index['n_bands'][poly] - 1 )
+    gb = a_index['band_offset'][poly] + band
+    start = a_index['band_ptr'][gb]
+    counts = a_index['band_ptr'][gb + 1] - start
+
+    pair = np.repeat( np.arange(len(pt)), counts )
+    e = a_index['band_edge'][ np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(counts.sum()) ]
+
+    # Ray casting: count the edges crossed by a ray from the point going east
+    px = a_x[pt][pair]
+    py = a_y[pt][pair]
+    x1, y1, x2, y2 = edges[e, 0], edges[e, 1], edges[e, 2], edges[e, 3]
+    crosses = ((y1 > py) != (y2 > py)) & ( px < (x2 - x1) * (py - y1) / (y2 - y1) + x1 )
+
+    inside = np.bincount( pair[crosses], minlength=len(pt) ) % 2 == 1
+
+    # First (lowest position) polygon containing each point
+    pt, poly = pt[inside], poly[inside]
+    order = np.lexsort( (poly, pt) )
+    pt, poly = pt[order], poly[order]
+    first = np.ones(len(pt), dtype=bool)
+    first[1:] = pt[1:] != pt[:-1]
+    result[pt[first]] = poly[first]
+
+    return result
+
+# Function to find the polygon that contains each point
+# a_index: index generated by build_polygon_index()
+# a_lat, a_lon: arrays of point coordinates
+# chunk_size: number of points processed at a time (keeps memory bounded)
+# Returns: array with the position (in a_index['ids']) of the polygon containing each point,
+#           or -1 if the point is not inside any polygon
+# Note: If polygons overlap, the polygon that comes first is returned
+def locate_points(a_index, a_lat, a_lon, chunk_size=1000000):
+    lat = np.asarray(a_lat, dtype=np.float64).ravel()
+    lon = np.asarray(a_lon, dtype=np.float64).ravel()
+
+    result = np.full(len(lat), -1, dtype=np.intp)
+    (x0, y0, x1, y1) = a_index['grid_extent']
+    grid_size = a_index['grid_size']
+
+    for s in range(0, len(lat), chunk_size):
+        x = lon[s:s+chunk_size]
+        y = lat[s:s+chunk_size]
+
+        # Points outside of the grid are outside of every polygon
+        in_grid = np.flatnonzero( (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1) )
+        cx = np.minimum( ((x[in_grid] - x0) / a_index['cell_w']).astype(np.intp), grid_size - 1 )
+        cy = np.minimum( ((y[in_grid] - y0) / a_index['cell_h']).astype(np.intp), grid_size - 1 )
+        value = a_index['cell_value'][cy * grid_size + cx]
+
+        # Points in cells crossed by an edge are located one by one
+        exact = value == -2
+        value[exact] = locate_points_exact( a_index, x[in_grid[exact]], y[in_grid[exact]] )
+
+        result[s + in_grid] = value
+
+    return result
+
+# Function to get the id of the polygon that contains each point
+# Returns: an object array of polygon ids (None if the point is not inside any polygon)
+def assign_polygon_ids(a_index, a_lat, a_lon):
+    pos = locate_points(a_index, a_lat, a_lon)
+
+    ids = np.array( a_index['ids'] + [None], dtype=object )
+
+    return ids[pos]
+
+# Function to load the Chicago ward boundaries into a polygon index
+def load_ward_index(a_geojson_file=WARDS_GEOJSON_FILE):
+    return build_polygon_index( *load_geojson_polygons(a_geojson_file, 'ward') )
+
+# Function to get the Chicago ward (e.g. '42') containing each lat/long point
+# (None for points outside of Chicago)
+def assign_wards(a_ward_index, a_lat, a_lon):
+    return assign_polygon_ids(a_ward_index, a_lat, a_lon)
+
+# Function to load the ZCTA boundaries into a polygon index
+def load_zcta_index(a_boundaries_file=ZCTA_BOUNDARIES_FILE, a_id_property=ZCTA_ID_PROPERTY):
+    ids, polygons = load_polygons(a_boundaries_file, a_id_property)
+
+    return build_polygon_index( [ str(z).zfill(5) for z in ids ], polygons )
+
+# Function to get the zipcode of each lat/long point
+# Points are assigned the ZCTA polygon that contains them;
+#  points outside every ZCTA polygon (or all points, if a_zcta_index is None)
+#  fall back to the zipcode with the nearest centroid
+# Arguments:
+#    a_zcta_index: index generated by load_zcta_index() (or None)
+#    a_lat, a_lon: arrays of point coordinates
+#    a_centroid_zips, a_centroid_lat, a_centroid_lon: zipcode centroids used for the fallback
+# Returns: a tuple (array of 5 character zipcodes, boolean array: True if assigned by polygon)
+def assign_zipcodes(a_zcta_index, a_lat, a_lon, a_centroid_zips, a_centroid_lat, a_centroid_lon):
+    lat = np.asarray(a_lat, dtype=np.float64).ravel()
+    lon = np.asarray(a_lon, dtype=np.float64).ravel()
+
+    zips = np.full(len(lat), None, dtype=object)
+    if a_zcta_index is not None:
+        zips = assign_polygon_ids(a_zcta_index, lat, lon)
+    in_polygon = zips != None
+
+    # Nearest centroid for the remaining points
+    fallback = np.flatnonzero(~in_polygon)
+    if len(fallback) > 0:
+        centroid_zips = np.array( [ str(z).zfill(5) for z in a_centroid_zips ], dtype=object )
+        _, idx = nearest_geodesic( build_spatial_index(a_centroid_lat, a_centroid_lon),
+                                   np.column_stack( (lat[fallback], lon[fallback]) ) )
+        zips[fallback] = centroid_zips[idx]
+
+    return zips, in_polygon
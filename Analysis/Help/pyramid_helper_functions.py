@@ -0,0 +1,279 @@
+# pyramid_helper_functions.py
+# AUTHOR: Jeff Brown
+#
+# A collection of functions used to aggregate point layers (Yelp restaurants, business licenses)
+# into a pyramid of map grid cells, one level per map zoom level, so maps can draw a few
+# hundred cells per zoom level instead of every point (see Working/Yelp_Data.ipynb,
+# which drew every restaurant as a gmaps marker with its own info box)
+#
+# Cells are the grid cells of grid_helper_functions (map zoom level z uses grid level z + CELL_ZOOM_BITS):
+# the cell containing a cell at the next zoom level is key >> 2, and once the points are sorted by key,
+# the points of any cell (at any zoom level) are a contiguous slice, so popups only need to look up
+# the points of the cell clicked
+
+# Dependencies
+import os
+import json
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from Help.grid_helper_functions import (GRID_CELL_COLUMN, grid_cell_keys, grid_parent)
+
+# Number of cell levels per map tile: each 256 pixel map tile is split into
+#  (2 ** CELL_ZOOM_BITS) x (2 ** CELL_ZOOM_BITS) cells (i.e. 64 pixel cells)
+CELL_ZOOM_BITS = 2
+
+# Default range of map zoom levels in a pyramid
+PYRAMID_MIN_ZOOM = 9
+PYRAMID_MAX_ZOOM = 16
+
+# Colors used for the average rating of the restaurants in a cell (and the rating thresholds for each color)
+RATING_COLORS = ['#d7191c', '#fdae61', '#ffffbf', '#a6d96a', '#1a9641']
+RATING_THRESHOLDS = [1, 3, 3.5, 4, 4.5, 5]
+
+# Function to aggregate each run of equal keys in a sorted array of keys
+# Returns: a tuple (array of the index of the first element of each run, array of the key of each run)
+def key_runs(a_sorted_keys):
+    first = np.ones(len(a_sorted_keys), dtype=bool)
+    first[1:] = a_sorted_keys[1:] != a_sorted_keys[:-1]
+    starts = np.flatnonzero(first)
+
+    return starts, a_sorted_keys[starts]
+
+# Function to build a pyramid of grid cells over a set of points
+# The finest level is aggregated from the points; each coarser level is rolled up from the level below it
+# Arguments:
+#    a_points_df: dataframe of points
+#    a_lat_column, a_lon_column: columns with the point coordinates
+#    aggregates: dictionary of column => 'sum' or 'mean' (missing values are ignored)
+#    min_zoom, max_zoom: range of map zoom levels (max_zoom + CELL_ZOOM_BITS <= GRID_CELL_LEVEL)
+# Returns: a dictionary 'pyramid' with
+#    'points': the points (with coordinates), sorted by cell
+#    'levels': dictionary of map zoom level => dataframe of the cells with points at that zoom level, with
+#              'key' (see grid_cell_keys), 'count' (number of points), 'latitude'/'longitude' (mean of the points),
+#              one column per aggregate, and 'start'/'end' (the cell's points are points[start:end])
+#    'aggregates', 'min_zoom', 'max_zoom'
+def build_point_pyramid(a_points_df, a_lat_column, a_lon_column, aggregates={}, min_zoom=PYRAMID_MIN_ZOOM,
+                        max_zoom=PYRAMID_MAX_ZOOM):
+    points_df = a_points_df.loc[ a_points_df[a_lat_column].notna() & a_points_df[a_lon_column].notna() ]
+
+    # Use the cell ids stamped on the rows if they have them (see grid_helper_functions)
+    if GRID_CELL_COLUMN in points_df.columns:
+        keys = grid_parent(points_df[GRID_CELL_COLUMN], max_zoom + CELL_ZOOM_BITS)
+    else:
+        keys = grid_cell_keys(points_df[a_lat_column], points_df[a_lon_column], max_zoom + CELL_ZOOM_BITS)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    points_df = points_df.iloc[order].reset_index(drop=True)
+
+    # Per point sums (and number of values, for the means) that are rolled up level by level
+    sums = { 'count': np.ones(len(points_df)),
+             'latitude': points_df[a_lat_column].to_numpy(dtype=np.float64),
+             'longitude': points_df[a_lon_column].to_numpy(dtype=np.float64) }
+    for c in aggregates:
+        values = points_df[c].to_numpy(dtype=np.float64)
+        sums[c] = np.nan_to_num(values)
+        sums[f"{c} values"] = (~np.isnan(values)).astype(np.float64)
+    cell_start = np.arange(len(points_df))
+
+    levels = {}
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        # Cells of this level: runs of equal keys in the level below (or the points)
+        starts, keys = key_runs(keys)
+        sums = { name: np.add.reduceat(s, starts) if len(s) > 0 else s for (name, s) in sums.items() }
+        cell_start = cell_start[starts]
+
+        level_df = pd.DataFrame({ 'key': keys, 'count': sums['count'].astype(np.int64),
+                                  'latitude': sums['latitude'] / sums['count'],
+                                  'longitude': sums['longitude'] / sums['count'] })
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for (c, agg) in aggregates.items():
+                level_df[c] = sums[c] if agg == 'sum' else np.where( sums[f"{c} values"] > 0,
+                                                                     sums[c] / sums[f"{c} values"], np.nan )
+        level_df['start'] = cell_start
+        level_df['end'] = cell_start + level_df['count'].to_numpy()
+        levels[zoom] = level_df
+
+        # Key of each cell's parent at the next zoom level out
+        keys = keys >> 2
+
+    return { 'points': points_df, 'levels': levels, 'aggregates': dict(aggregates),
+             'min_zoom': min_zoom, 'max_zoom': max_zoom }
+
+# Function to build the pyramid of restaurant cells: the number of Yelp restaurants, their average rating
+#  and total reviews, and the number of restaurant licenses in each cell
+# Arguments:
+#    a_yelp_files: list of Yelp restaurant files (e.g. one per city)
+#    a_license_store_file: restaurant license store (see license_helper_functions), or None
+#    min_zoom, max_zoom: range of map zoom levels
+# Returns: the pyramid (see build_point_pyramid)
+def build_restaurant_pyramid(a_yelp_files, a_license_store_file=None, min_zoom=PYRAMID_MIN_ZOOM,
+                             max_zoom=PYRAMID_MAX_ZOOM):
+    points = []
+    for yelp_file in a_yelp_files:
+        yelp_df = pd.read_csv(yelp_file, usecols=['name', 'city', 'rating', 'review_count', 'type',
+                                                  'latitude', 'longitude'])
+        points.append( yelp_df.rename(columns={ 'name': 'Name', 'city': 'City', 'rating': 'Rating',
+                                                'review_count': 'Reviews', 'type': 'Type' })
+                              .assign(Restaurants=1, Licenses=0) )
+
+    if a_license_store_file is not None:
+        license_df = pq.read_table(a_license_store_file, memory_map=True,
+                                   columns=['DOING BUSINESS AS NAME', 'CITY', 'LATITUDE', 'LONGITUDE']).to_pandas()
+        points.append( license_df.rename(columns={ 'DOING BUSINESS AS NAME': 'Name', 'CITY': 'City',
+                                                   'LATITUDE': 'latitude', 'LONGITUDE': 'longitude' })
+                                 .assign(Restaurants=0, Licenses=1) )
+
+    points_df = pd.concat(points, ignore_index=True)
+
+    return build_point_pyramid( points_df, 'latitude', 'longitude',
+                                aggregates={ 'Restaurants': 'sum', 'Rating': 'mean', 'Reviews': 'sum', 'Licenses': 'sum' },
+                                min_zoom=min_zoom, max_zoom=max_zoom )
+
+# Function to get the points in a cell of a pyramid (e.g. for a popup)
+# Arguments:
+#    a_pyramid: pyramid from build_point_pyramid()
+#    a_zoom: map zoom level
+#    a_key: key of the cell
+# Returns: dataframe of the points in the cell (empty if the cell has no points)
+def cell_points(a_pyramid, a_zoom, a_key):
+    level_df = a_pyramid['levels'][a_zoom]
+
+    i = np.searchsorted(level_df['key'].to_numpy(), a_key)
+    if i == len(level_df) or level_df['key'].iat[i] != a_key:
+        return a_pyramid['points'].iloc[0:0]
+
+    return a_pyramid['points'].iloc[ level_df['start'].iat[i]:level_df['end'].iat[i] ]
+
+# Function to combine the levels of a pyramid into a single dataframe (with a 'zoom' column), e.g. to save it
+def pyramid_levels_df(a_pyramid):
+    return pd.concat( [ level_df.assign(zoom=np.int8(zoom)) for (zoom, level_df) in a_pyramid['levels'].items() ],
+                      ignore_index=True )
+
+# Page for the cell map: Leaflet (as used by folium) drawing the cells of the current zoom level
+#  as circles, with the popup of a cell built from its points only when it is clicked
+PYRAMID_HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta http-equiv="content-type" content="text/html; charset=UTF-8" />
+<meta name="viewport" content="width=device-width, initial-scale=1.0" />
+<title>%(title)s</title>
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet@1.3.4/dist/leaflet.css"/>
+<script src="https://cdn.jsdelivr.net/npm/leaflet@1.3.4/dist/leaflet.js"></script>
+<style>html, body, #map {width: 100%%; height: 100%%; margin: 0; padding: 0;}</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+var levels = %(levels)s;
+var points = %(points)s;
+var cellColumns = %(cell_columns)s, popupColumns = %(popup_columns)s;
+var colorColumn = %(color_column)s, thresholds = %(thresholds)s, colors = %(colors)s;
+var minZoom = %(min_zoom)d, maxZoom = %(max_zoom)d, maxPopupPoints = %(max_popup_points)d, popupSort = %(popup_sort)s;
+
+function fillColor(v) {
+    if (v === null) { return '#999999'; }
+    var i = 0;
+    while (i < colors.length - 1 && v >= thresholds[i + 1]) { i++; }
+    return colors[i];
+}
+
+function popupHtml(level, i) {
+    var html = cellColumns.map(function(c) {
+        var v = level[c][i];
+        return '<b>' + c + '</b>: ' + (v === null ? 'n/a' : v);
+    }).join('<br>');
+
+    var cellPoints = [];
+    for (var p = level['start'][i]; p < level['end'][i]; p++) { cellPoints.push(p); }
+    if (popupSort !== null) {
+        cellPoints.sort(function(a, b) { return (points[popupSort][b] || 0) - (points[popupSort][a] || 0); });
+    }
+
+    var rows = cellPoints.slice(0, maxPopupPoints).map(function(p) {
+        return popupColumns.map(function(c) { return points[c][p]; }).join(' | ');
+    });
+    if (cellPoints.length > maxPopupPoints) { rows.push('... ' + (cellPoints.length - maxPopupPoints) + ' more'); }
+
+    return html + '<hr>' + rows.join('<br>');
+}
+
+var map = L.map('map', {preferCanvas: true});
+L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png',
+            {attribution: '&copy; OpenStreetMap contributors', maxZoom: 18}).addTo(map);
+
+var cellLayer = L.layerGroup().addTo(map);
+function drawCells() {
+    var level = levels[Math.max(minZoom, Math.min(maxZoom, map.getZoom()))];
+    var maxCount = Math.max.apply(null, level['count']);
+    cellLayer.clearLayers();
+    for (var i = 0; i < level['count'].length; i++) {
+        var marker = L.circleMarker([level['latitude'][i], level['longitude'][i]], {
+            radius: 4 + 16 * Math.sqrt(level['count'][i] / maxCount),
+            fillColor: fillColor(level[colorColumn][i]), fillOpacity: 0.7, color: '#333', weight: 1});
+        marker.bindPopup((function(i) { return function() { return popupHtml(level, i); }; })(i));
+        cellLayer.addLayer(marker);
+    }
+}
+map.on('zoomend', drawCells);
+
+var bounds = levels[minZoom];
+map.fitBounds([[Math.min.apply(null, bounds['latitude']), Math.min.apply(null, bounds['longitude'])],
+               [Math.max.apply(null, bounds['latitude']), Math.max.apply(null, bounds['longitude'])]]);
+drawCells();
+</script>
+</body>
+</html>
+"""
+
+# Function to save a map of a pyramid's cells as a standalone HTML page
+# Only the cells of the current zoom level are drawn; a cell's popup lists its points,
+#  and is built from the points' columns only when the cell is clicked
+# Arguments:
+#    a_pyramid: pyramid from build_point_pyramid()
+#    a_save_file: HTML file to save the map to
+#    a_color_column: aggregate used to color the cells
+#    thresholds: list of bin edges for the colors (len(colors) + 1)
+#    colors: list of colors, one per bin
+#    popup_columns: point columns listed in the popups (default: none)
+#    popup_sort_column: point column used to order the points in a popup (highest first), or None
+#    max_popup_points: maximum number of points listed in a popup
+# Returns: the size of the HTML file (bytes)
+def save_pyramid_html(a_pyramid, a_save_file, a_color_column, thresholds, colors, popup_columns=[],
+                      popup_sort_column=None, max_popup_points=20, title="Restaurants"):
+    cell_columns = [ 'count' ] + list(a_pyramid['aggregates'])
+
+    def columns_json(a_df, a_columns):
+        # Columns as lists, with missing values as null and floats rounded (to keep the page small)
+        data = {}
+        for c in a_columns:
+            values = a_df[c].round(5 if c in ['latitude', 'longitude'] else 2) if a_df[c].dtype.kind == 'f' else a_df[c]
+            data[c] = values.astype(object).where( values.notna(), None ).tolist()
+        return data
+
+    point_columns = list(popup_columns)
+    if popup_sort_column is not None and popup_sort_column not in point_columns:
+        point_columns.append(popup_sort_column)
+
+    levels = { zoom: columns_json( level_df, cell_columns + ['latitude', 'longitude', 'start', 'end'] )
+               for (zoom, level_df) in a_pyramid['levels'].items() }
+
+    html = PYRAMID_HTML_TEMPLATE % { 'title': title,
+                                     'levels': json.dumps(levels, separators=(',', ':')),
+                                     'points': json.dumps( columns_json(a_pyramid['points'], point_columns),
+                                                           separators=(',', ':') ),
+                                     'cell_columns': json.dumps(cell_columns),
+                                     'popup_columns': json.dumps(list(popup_columns)),
+                                     'color_column': json.dumps(a_color_column),
+                                     'thresholds': json.dumps(list(thresholds)),
+                                     'colors': json.dumps(list(colors)),
+                                     'min_zoom': a_pyramid['min_zoom'],
+                                     'max_zoom': a_pyramid['max_zoom'],
+                                     'popup_sort': json.dumps(popup_sort_column),
+                                     'max_popup_points': max_popup_points }
+
+    with open(a_save_file, "w") as f:
+        f.write(html)
+
+    return os.path.getsize(a_save_file)
@@ -0,0 +1,248 @@
+# resample_helper_functions.py
+# AUTHOR: Jeff Brown
+#
+# A collection of functions used to calculate bootstrap confidence intervals
+# and permutation test p-values for the Project 1 regressions and comparisons
+# (e.g. a metric vs. 'success_count' across ~56 zipcodes), where the
+# parametric p-values from linregress / ttest_ind are fragile
+#
+# Every resample is drawn at once as a (B x n) index matrix and all B regressions
+# are evaluated together with array operations, instead of B calls to linregress
+
+# Dependencies
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+# Number of resamples drawn (and evaluated) at a time
+# Each block gets its own random stream, so results for a given seed
+#  are the same whether the blocks are run in one process or across a pool
+RESAMPLE_BLOCK_SIZE = 20000
+
+# Minimum number of resamples before they are split across a pool of processes
+RESAMPLE_POOL_MIN = 100000
+
+# Function to perform a batch of linear regressions
+# Arguments:
+#    a_x: (B x n) array of x-values, one regression per row
+#    a_y: (B x n x k) array of y-values, k metrics regressed against the same x-values
+# Returns: a tuple of (B x k) arrays (slope, intercept, rvalue)
+#          (NaN for any regression where the x-values or y-values are all the same)
+def batch_linregress(a_x, a_y):
+    x_mean = a_x.mean(axis=1)
+    y_mean = a_y.mean(axis=1)
+    dx = a_x - x_mean[:, None]
+    dy = a_y - y_mean[:, None, :]
+
+    sxx = np.einsum('bn,bn->b', dx, dx)[:, None]
+    syy = np.einsum('bnk,bnk->bk', dy, dy)
+    sxy = np.einsum('bn,bnk->bk', dx, dy)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = sxy / sxx
+        rvalue = np.clip( sxy / np.sqrt(sxx * syy), -1.0, 1.0 )
+
+    return slope, y_mean - slope * x_mean[:, None], rvalue
+
+# Function to evaluate one block of bootstrap (resampled pairs) regressions
+# Returns: a tuple of (a_size x k) arrays (slope, intercept, rvalue)
+def bootstrap_block(a_x, a_y, a_size, a_seed):
+    rng = np.random.default_rng(a_seed)
+    idx = rng.integers(0, len(a_x), size=(a_size, len(a_x)))
+
+    return batch_linregress( a_x[idx], a_y[idx] )
+
+# Function to evaluate one block of permutation regressions (y-values shuffled against fixed x-values)
+# Only the correlation is calculated: with x fixed, the slope is a constant multiple of it
+# Returns: a tuple with an (a_size x k) array of correlations
+def permutation_block(a_x, a_y, a_size, a_seed):
+    rng = np.random.default_rng(a_seed)
+    idx = rng.permuted( np.broadcast_to( np.arange(len(a_x)), (a_size, len(a_x)) ), axis=1 )
+
+    dx = a_x - a_x.mean()
+    dy = a_y - a_y.mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rvalue = np.einsum('bnk,n->bk', dy[idx], dx) / np.sqrt( (dx @ dx) * (dy * dy).sum(axis=0) )
+
+    return ( rvalue, )
+
+# Function to evaluate one block of two sample permutations (values shuffled between the samples)
+# Returns: a tuple with an array of the differences in means (sample a - sample b)
+def mean_diff_block(a_values, a_n_a, a_size, a_seed):
+    rng = np.random.default_rng(a_seed)
+    shuffled = rng.permuted( np.broadcast_to( a_values, (a_size, len(a_values)) ), axis=1 )
+
+    return ( shuffled[:, :a_n_a].mean(axis=1) - shuffled[:, a_n_a:].mean(axis=1), )
+
+# Function to get the SeedSequence for a seed (int, SeedSequence or None for a random seed)
+def seed_sequence(a_seed):
+    if isinstance(a_seed, np.random.SeedSequence):
+        return a_seed
+
+    return np.random.SeedSequence(a_seed)
+
+# Function to run a number of resamples in blocks (see RESAMPLE_BLOCK_SIZE)
+# Arguments:
+#    a_block_func: function(*a_args, size, seed) evaluating one block, returning a tuple of arrays
+#    a_args: arguments for a_block_func
+#    a_n: total number of resamples
+#    seed: seed for the random number generator (int, SeedSequence or None for a random seed)
+#    max_workers: number of processes used once a_n >= RESAMPLE_POOL_MIN
+#                 (default: number of CPUs, 1: never use a pool)
+# Returns: a tuple of arrays, each with a_n rows
+def run_resamples(a_block_func, a_args, a_n, seed=None, max_workers=None):
+    sizes = [ RESAMPLE_BLOCK_SIZE ] * (a_n // RESAMPLE_BLOCK_SIZE)
+    if a_n % RESAMPLE_BLOCK_SIZE > 0:
+        sizes.append( a_n % RESAMPLE_BLOCK_SIZE )
+
+    seeds = seed_sequence(seed).spawn( len(sizes) )
+    block_args = [ (*a_args, s, ss) for (s, ss) in zip(sizes, seeds) ]
+
+    if a_n >= RESAMPLE_POOL_MIN and max_workers != 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            blocks = list( executor.map(a_block_func, *zip(*block_args)) )
+    else:
+        blocks = [ a_block_func(*b) for b in block_args ]
+
+    return tuple( np.concatenate(r) for r in zip(*blocks) )
+
+# Function to calculate a two-sided permutation p-value from the resampled statistics
+# The observed arrangement counts as one of the permutations, so p is never 0
+def permutation_pvalue(a_observed, a_resampled):
+    # Allow for rounding so permutations that tie the observed value count as "at least as extreme"
+    extreme = np.abs(a_resampled) >= np.abs(a_observed) * (1 - 1e-12)
+
+    return ( extreme.sum(axis=0) + 1 ) / ( len(a_resampled) + 1 )
+
+# Function to convert x-values and y-values (one metric, or one column per metric) to arrays,
+#  dropping rows with a missing value
+# Returns: a tuple (x array (n), y array (n x k))
+def regression_arrays(a_x, a_y):
+    x = np.asarray(a_x, dtype=np.float64)
+    y = np.asarray(a_y, dtype=np.float64).reshape(len(x), -1)
+
+    has_value = ~( np.isnan(x) | np.isnan(y).any(axis=1) )
+
+    return x[has_value], y[has_value]
+
+# Function to calculate bootstrap confidence intervals for a linear regression
+# The (x, y) pairs are resampled with replacement and the interval is
+#  the percentile interval of the resampled slopes, intercepts and correlations
+# Arguments:
+#    a_x: array (or list/Series) of x-values
+#    a_y: array (or list/Series) of y-values, or a 2D array / dataframe with one column per metric
+#    n_boot: number of bootstrap resamples
+#    ci: confidence level of the intervals
+#    seed: seed for the random number generator (the same seed gives the same intervals)
+#    max_workers: number of processes used once n_boot >= RESAMPLE_POOL_MIN (1: never use a pool)
+# Returns: a dictionary with
+#    'slope', 'intercept', 'rvalue': regression of the original data
+#    'slope_ci', 'intercept_ci', 'rvalue_ci': (low, high) of the confidence interval
+#    'boot_slope', 'boot_intercept', 'boot_rvalue': the n_boot resampled values (see trend_ci_band)
+#  Each value is a float (array of k values if a_y had a column per metric)
+def bootstrap_linregress(a_x, a_y, n_boot=10000, ci=0.95, seed=None, max_workers=None):
+    x, y = regression_arrays(a_x, a_y)
+
+    observed = batch_linregress( x[None, :], y[None, :, :] )
+    resampled = run_resamples( bootstrap_block, (x, y), n_boot, seed, max_workers )
+
+    pct = [ 50 * (1 - ci), 50 * (1 + ci) ]
+    boot_dict = {}
+    for (name, o, r) in zip( ['slope', 'intercept', 'rvalue'], observed, resampled ):
+        # Resamples that picked a single x-value have no regression and are ignored
+        low, high = np.nanpercentile(r, pct, axis=0)
+
+        if np.ndim(a_y) == 1:
+            (o, low, high, r) = (o[0, 0], low[0], high[0], r[:, 0])
+        else:
+            o = o[0]
+
+        boot_dict[name] = o
+        boot_dict[f"{name}_ci"] = (low, high)
+        boot_dict[f"boot_{name}"] = r
+
+    return boot_dict
+
+# Function to calculate permutation test p-values for a linear regression
+# The y-values are shuffled against the x-values; the p-value (two-sided) is the
+#  fraction of shuffles with a correlation at least as strong as the original data
+#  (this is also the p-value for the slope, since the slope is a fixed multiple of the correlation)
+# Arguments: see bootstrap_linregress
+# Returns: the p-value (array of k values if a_y had a column per metric)
+def permutation_linregress(a_x, a_y, n_perm=10000, seed=None, max_workers=None):
+    x, y = regression_arrays(a_x, a_y)
+
+    (_, _, observed) = batch_linregress( x[None, :], y[None, :, :] )
+    (resampled, ) = run_resamples( permutation_block, (x, y), n_perm, seed, max_workers )
+
+    pvalue = permutation_pvalue( observed[0], resampled )
+
+    return pvalue[0] if np.ndim(a_y) == 1 else pvalue
+
+# Function to perform a two sample permutation test on the difference in means
+# (a resampling alternative to stats.ttest_ind)
+# Arguments:
+#    a_a, a_b: arrays (or lists/Series) of the values in each sample (missing values are dropped)
+#    n_perm, seed, max_workers: see bootstrap_linregress
+# Returns: a tuple (difference in means (a - b), two-sided p-value)
+def permutation_test_means(a_a, a_b, n_perm=10000, seed=None, max_workers=None):
+    a = np.asarray(a_a, dtype=np.float64)
+    b = np.asarray(a_b, dtype=np.float64)
+    a = a[ ~np.isnan(a) ]
+    b = b[ ~np.isnan(b) ]
+
+    observed = a.mean() - b.mean()
+    (resampled, ) = run_resamples( mean_diff_block, (np.concatenate([a, b]), len(a)), n_perm, seed, max_workers )
+
+    return observed, permutation_pvalue(observed, resampled)
+
+# Function to calculate the confidence band of a trend line from the bootstrap regressions
+# Arguments:
+#    a_boot_dict: result of bootstrap_linregress() (for a single metric)
+#    a_x: array (or list/Series) of x-values to calculate the band at
+#    ci: confidence level of the band
+# Returns: a tuple of arrays (low, high), the band at each x-value
+def trend_ci_band(a_boot_dict, a_x, ci=0.95):
+    x = np.asarray(a_x, dtype=np.float64)
+
+    # Evaluate the trend line of every resample at the unique x-values only
+    # (the band is NaN at missing x-values)
+    (x_unique, x_inverse) = np.unique(x, return_inverse=True)
+    has_value = ~np.isnan(x_unique)
+    lines = a_boot_dict['boot_intercept'][:, None] + a_boot_dict['boot_slope'][:, None] * x_unique[None, has_value]
+
+    band = np.full( (2, len(x_unique)), np.nan )
+    band[:, has_value] = np.nanpercentile( lines, [ 50 * (1 - ci), 50 * (1 + ci) ], axis=0 )
+
+    return band[0][x_inverse], band[1][x_inverse]
+
+# Function to generate a table of regressions of several metrics against the same x-values
+# Every metric is evaluated on the same bootstrap resamples and the same permutations
+# Arguments:
+#    a_data_df: dataframe
+#    a_x_column: column with the x-values (e.g. 'success_count')
+#    a_y_columns: list of columns with the metrics (e.g. ['Less_than_HS_P', 'High_School_P', ...])
+#    n_boot, n_perm, ci, seed, max_workers: see bootstrap_linregress
+# Returns: a dataframe with one row per metric (rows with a missing value in any of the columns are dropped)
+def resample_linregress_table(a_data_df, a_x_column, a_y_columns, n_boot=10000, n_perm=10000, ci=0.95,
+                              seed=None, max_workers=None):
+    x, y = regression_arrays( a_data_df[a_x_column], a_data_df[a_y_columns] )
+
+    # Use independent random streams for the bootstrap and the permutations
+    (boot_seed, perm_seed) = seed_sequence(seed).spawn(2)
+    boot_dict = bootstrap_linregress(x, y, n_boot, ci, boot_seed, max_workers)
+    perm_pvalue = permutation_linregress(x, y, n_perm, perm_seed, max_workers)
+
+    table_df = pd.DataFrame({
+        'Slope': boot_dict['slope'],
+        'Slope CI Low': boot_dict['slope_ci'][0],
+        'Slope CI High': boot_dict['slope_ci'][1],
+        'R-Value': boot_dict['rvalue'],
+        'R-Value CI Low': boot_dict['rvalue_ci'][0],
+        'R-Value CI High': boot_dict['rvalue_ci'][1],
+        'p-Value (linregress)': [ stats.linregress(x, y[:, i]).pvalue for i in range(y.shape[1]) ],
+        'p-Value (Permutation)': perm_pvalue,
+        'Count': len(x) }, index=pd.Index(a_y_columns, name='Metric') )
+
+    return table_df
@@ -0,0 +1,309 @@
+# spatial_helper_functions.py
+# AUTHOR: Jeff Brown
+#
+# A collection of functions used to perform fast spatial lookups
+# (nearest neighbor, points within a radius) on lat/long coordinates
+# in support of Transport Data Analysis with Project 1
+
+# Dependencies
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Mean radius of the earth (IUGG), used to convert between
+#  great circle distances and distances on the unit sphere
+EARTH_RADIUS_METERS = 6371008.8
+
+# Function to convert arrays of (lat, long) coordinates in degrees
+#  into (x, y, z) points on the unit sphere
+# Note: The straight line (chord) distance between 2 points on the unit sphere
+#        increases monotonically with the great circle distance between them,
+#        so a KD-tree built on these points gives exact nearest neighbors
+# a_lat: array (or list/Series) of latitudes in degrees
+# a_lon: array (or list/Series) of longitudes in degrees
+def latlon_to_xyz(a_lat, a_lon):
+    lat = np.radians(np.asarray(a_lat, dtype=np.float64))
+    lon = np.radians(np.asarray(a_lon, dtype=np.float64))
+
+    cos_lat = np.cos(lat)
+    return np.column_stack( (cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)) )
+
+# Function to convert a great circle distance in meters into
+#  the equivalent chord distance on the unit sphere
+def meters_to_chord(a_meters):
+    return 2.0 * np.sin( np.minimum(np.asarray(a_meters, dtype=np.float64) / EARTH_RADIUS_METERS, np.pi) / 2.0 )
+
+# Function to convert a chord distance on the unit sphere into
+#  the equivalent great circle distance in meters
+def chord_to_meters(a_chord):
+    return 2.0 * EARTH_RADIUS_METERS * np.arcsin( np.clip(np.asarray(a_chord, dtype=np.float64) / 2.0, 0.0, 1.0) )
+
+# Function to split a list of (lat, long) tuples, an (N x 2) array,
+#  or a single (lat, long) tuple into separate lat and long arrays
+def split_points(a_points):
+    points = np.asarray(a_points, dtype=np.float64).reshape(-1, 2)
+    return points[:,0], points[:,1]
+
+# Function to build a spatial index over a set of (lat, long) coordinates
+# The index is built once and can then be queried many times with batches of points
+# Arguments:
+#    a_lat: array (or list/Series) of latitudes in degrees
+#    a_lon: array (or list/Series) of longitudes in degrees
+# Returns: a dictionary 'spatial_index' with elements
+#    'tree': KD-tree built on the unit sphere (x, y, z) points
+#    'xyz': (N x 3) array of the unit sphere points
+#    'size': number of coordinates in the index
+#    'lat', 'lon': arrays of the coordinates (used to re-rank neighbors by geodesic distance)
+def build_spatial_index(a_lat, a_lon):
+    lat = np.asarray(a_lat, dtype=np.float64).ravel()
+    lon = np.asarray(a_lon, dtype=np.float64).ravel()
+    xyz = latlon_to_xyz(lat, lon)
+
+    return { 'tree': cKDTree(xyz), 'xyz': xyz, 'size': len(xyz), 'lat': lat, 'lon': lon }
+
+# Function to find the k coordinates in the spatial index
+#  that are closest to each of the points provided
+# a_index: spatial index generated by build_spatial_index()
+# a_points: a list of (lat, long) tuples or an (M x 2) array
+# k: number of neighbors to return for each point
+# Returns: a tuple (distances in meters, indices into the indexed coordinates)
+#           each with shape (M,) when k == 1, otherwise (M x k)
+# Note: If fewer than k coordinates are indexed, missing neighbors
+#        have a distance of inf and an index equal to the index size
+def nearest(a_index, a_points, k=1):
+    lat, lon = split_points(a_points)
+
+    chord, idx = a_index['tree'].query( latlon_to_xyz(lat, lon), k=k )
+
+    # (chord_to_meters() would turn the inf chord of a missing neighbor into half the earth's circumference)
+    return np.where( np.isinf(chord), np.inf, chord_to_meters(chord) ), idx
+
+# Function to find all of the coordinates in the spatial index
+#  that are within a radius (in meters) of each of the points provided
+# a_index: spatial index generated by build_spatial_index()
+# a_points: a list of (lat, long) tuples or an (M x 2) array
+# a_meters: search radius in meters
+# Returns: a list (one entry per point) of sorted arrays of indices into the indexed coordinates
+def within_radius(a_index, a_points, a_meters):
+    lat, lon = split_points(a_points)
+
+    hits = a_index['tree'].query_ball_point( latlon_to_xyz(lat, lon), r=float(meters_to_chord(a_meters)),
+                                             return_sorted=True )
+
+    return [ np.asarray(h, dtype=np.intp) for h in hits ]
+
+# Function to find all (point, coordinate) pairs within a radius (in meters)
+# Same as within_radius(), but the results are flattened into 2 parallel arrays,
+#  which is more convenient (and faster) for building vectorized joins
+# Returns: a tuple (point indices, coordinate indices), sorted by point then coordinate
+def within_radius_pairs(a_index, a_points, a_meters):
+    hits = within_radius(a_index, a_points, a_meters)
+
+    counts = np.array([ len(h) for h in hits ], dtype=np.intp)
+    point_idx = np.repeat( np.arange(len(hits), dtype=np.intp), counts )
+
+    if counts.sum() == 0:
+        return point_idx, np.empty(0, dtype=np.intp)
+
+    return point_idx, np.concatenate(hits)
+
+# Function to count the coordinates in the spatial index
+#  that are within each of several radii (in meters) of each of the points provided
+# Only the counts are computed (the matching coordinates are never listed),
+#  so this is much faster than within_radius() for large radii
+# a_index: spatial index generated by build_spatial_index()
+# a_points: a list of (lat, long) tuples or an (M x 2) array
+# a_radii: list of radii in meters
+# Returns: an (M x number of radii) array of counts
+def count_within_radius(a_index, a_points, a_radii):
+    lat, lon = split_points(a_points)
+    xyz = latlon_to_xyz(lat, lon)
+
+    counts = np.zeros( (len(xyz), len(a_radii)), dtype=np.int32 )
+    for (i, r) in enumerate(a_radii):
+        counts[:, i] = a_index['tree'].query_ball_point( xyz, r=float(meters_to_chord(r)), return_length=True )
+
+    return counts
+
+# Conversion factors from meters to the supported distance units
+DISTANCE_UNITS = { 'meters': 1.0,
+                   'kilometers': 0.001,
+                   'feet': 1.0 / 0.3048,
+                   'miles': 1.0 / 1609.344 }
+
+# WGS-84 ellipsoid parameters (same ellipsoid used by geopy by default)
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+
+# Function to calculate the great circle (haversine) distance in meters
+#  between arrays of (lat, long) coordinates
+# Arguments are broadcast against each other (numpy rules), so any of them
+#  can be a scalar, a 1-D array, or (for pairwise distances) a column/row vector
+# Accuracy: Within ~0.5% of the ellipsoidal distance (the earth is not a sphere)
+def haversine_meters(a_lat1, a_lon1, a_lat2, a_lon2):
+    lat1 = np.radians(np.asarray(a_lat1, dtype=np.float64))
+    lon1 = np.radians(np.asarray(a_lon1, dtype=np.float64))
+    lat2 = np.radians(np.asarray(a_lat2, dtype=np.float64))
+    lon2 = np.radians(np.asarray(a_lon2, dtype=np.float64))
+
+    h = np.sin((lat2 - lat1) / 2.0)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0)**2
+
+    return 2.0 * EARTH_RADIUS_METERS * np.arcsin( np.sqrt(np.clip(h, 0.0, 1.0)) )
+
+# Function to calculate the ellipsoidal distance in meters on the WGS-84 ellipsoid
+#  between arrays of (lat, long) coordinates using Vincenty's inverse formula
+# This is the vectorized equivalent of geopy's vincenty(...).meters
+# Arguments are broadcast against each other in the same way as haversine_meters()
+# Accuracy: Within 1 mm of geopy's geodesic(...) / vincenty(...) distances
+# Note: For nearly antipodal points Vincenty's formula does not converge,
+#        in which case the haversine distance is returned for those points
+def vincenty_meters(a_lat1, a_lon1, a_lat2, a_lon2, a_max_iter=200, a_tol=1e-12):
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays( *[ np.radians(np.asarray(v, dtype=np.float64))
+                                                      for v in (a_lat1, a_lon1, a_lat2, a_lon2) ] )
+
+    # Reduced latitudes and difference in longitude
+    L = lon2 - lon1
+    U1 = np.arctan( (1 - WGS84_F) * np.tan(lat1) )
+    U2 = np.arctan( (1 - WGS84_F) * np.tan(lat2) )
+    sin_U1, cos_U1 = np.sin(U1), np.cos(U1)
+    sin_U2, cos_U2 = np.sin(U2), np.cos(U2)
+
+    # Iterate on lambda for all of the points at the same time,
+    #  and stop once every point has converged
+    lam = L.copy()
+    converged = np.zeros(L.shape, dtype=bool)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(a_max_iter):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.sqrt( (cos_U2 * sin_lam)**2 + (cos_U1 * sin_U2 - sin_U1 * cos_U2 * cos_lam)**2 )
+            cos_sigma = sin_U1 * sin_U2 + cos_U1 * cos_U2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+
+            sin_alpha = np.where( sin_sigma == 0, 0.0, cos_U1 * cos_U2 * sin_lam / sin_sigma )
+            cos2_alpha = 1 - sin_alpha**2
+
+            # cos2_alpha is 0 for points on the equator
+            cos_2sigma_m = np.where( cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_U1 * sin_U2 / cos2_alpha )
+
+            C = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+            lam_prev = lam
+            lam = L + (1 - C) * WGS84_F * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m**2)) )
+
+            converged = np.abs(lam - lam_prev) <= a_tol
+            if converged.all():
+                break
+
+        u2 = cos2_alpha * (WGS84_A**2 - WGS84_B**2) / WGS84_B**2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m**2)
+            - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma**2) * (-3 + 4 * cos_2sigma_m**2) ))
+
+        dist = WGS84_B * A * (sigma - delta_sigma)
+
+    # Coincident points have a distance of 0
+    dist = np.where( sin_sigma == 0, 0.0, dist )
+
+    # Fall back to the haversine distance where the iteration did not converge
+    if not converged.all():
+        dist = np.where( converged, dist, haversine_meters(a_lat1, a_lon1, a_lat2, a_lon2) )
+
+    return dist
+
+# Largest relative difference between the geodesic (WGS-84) distance and the great circle distance
+#  (on the sphere of radius EARTH_RADIUS_METERS) between 2 points, with a margin
+GEODESIC_SPHERE_TOLERANCE = 0.01
+
+# Function to find the coordinate in the spatial index with the smallest geodesic (Vincenty) distance
+#  to each of the points provided - the same coordinate as min(coords, key=geopy distance)
+# The great circle ranking of the KD-tree can differ from the geodesic ranking for nearly equidistant
+#  coordinates, so k candidates are re-ranked by geodesic distance; points whose k-th candidate
+#  could still be beaten by a coordinate further down the great circle ranking are queried again with 2k
+# Arguments:
+#    a_index: spatial index generated by build_spatial_index()
+#    a_points: a list of (lat, long) tuples or an (M x 2) array
+#    k: number of candidates to start with
+# Returns: a tuple (geodesic distances in meters, indices into the indexed coordinates), each with shape (M,)
+#          (ties are broken by the lowest index)
+def nearest_geodesic(a_index, a_points, k=8):
+    lat, lon = split_points(a_points)
+
+    best_dist = np.full(len(lat), np.inf)
+    best_idx = np.full(len(lat), a_index['size'], dtype=np.intp)
+
+    todo = np.arange(len(lat))
+    while len(todo) > 0 and a_index['size'] > 0:
+        k = min(k, a_index['size'])
+        sphere_dist, idx = nearest( a_index, np.column_stack( (lat[todo], lon[todo]) ), k=k )
+        sphere_dist = sphere_dist.reshape(len(todo), k)
+        idx = idx.reshape(len(todo), k)
+
+        geo_dist = vincenty_meters( lat[todo, None], lon[todo, None], a_index['lat'][idx], a_index['lon'][idx] )
+
+        # Closest candidate of each point (smallest distance, then lowest index)
+        rows = np.repeat( np.arange(len(todo)), k )
+        first = np.lexsort( (idx.ravel(), geo_dist.ravel(), rows) ).reshape(len(todo), k)[:, 0]
+        best_dist[todo] = geo_dist.ravel()[first]
+        best_idx[todo] = idx.ravel()[first]
+
+        # Coordinates beyond the k-th candidate are at least this far away (geodesic distance)
+        done = (k == a_index['size']) | ( sphere_dist[:, -1] * (1 - GEODESIC_SPHERE_TOLERANCE) > best_dist[todo] )
+        todo = todo[~done]
+        k *= 2
+
+    return best_dist, best_idx
+
+# Distance methods supported by rowwise_distance() and pairwise_distance()
+DISTANCE_METHODS = { 'haversine': haversine_meters,
+                     'vincenty': vincenty_meters }
+
+# Function to calculate the distance between matching rows of 2 sets of (lat, long) coordinates
+# i.e. the distance from (a_lat1[i], a_lon1[i]) to (a_lat2[i], a_lon2[i]) for each i
+# Either set can also be a single (scalar) coordinate, e.g. the distance
+#  from every license to one Yelp restaurant
+# method: 'haversine' (fastest) or 'vincenty' (matches geopy to within 1 mm)
+# units: 'meters', 'kilometers', 'feet', or 'miles'
+# chunk_size: maximum number of distances calculated at a time,
+#              which keeps the memory used by temporary arrays bounded
+def rowwise_distance(a_lat1, a_lon1, a_lat2, a_lon2, method='haversine', units='meters', chunk_size=1000000):
+    dist_func = DISTANCE_METHODS[method]
+    unit_factor = DISTANCE_UNITS[units]
+
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays( *[ np.asarray(v, dtype=np.float64)
+                                                      for v in (a_lat1, a_lon1, a_lat2, a_lon2) ] )
+    lat1, lon1, lat2, lon2 = [ v.ravel() for v in (lat1, lon1, lat2, lon2) ]
+
+    dist = np.empty(lat1.shape, dtype=np.float64)
+    for s in range(0, len(dist), chunk_size):
+        e = s + chunk_size
+        dist[s:e] = dist_func(lat1[s:e], lon1[s:e], lat2[s:e], lon2[s:e])
+
+    return dist * unit_factor
+
+# Function to calculate the distance from every coordinate in one set
+#  to every coordinate in another set
+# Returns: an (N x M) array where element [i, j] is the distance
+#           from (a_lat1[i], a_lon1[i]) to (a_lat2[j], a_lon2[j])
+# method, units: same as rowwise_distance()
+# chunk_size: maximum number of distances calculated at a time
+#              (rows of the result are calculated in blocks of chunk_size // M)
+# Note: The result itself is N x M, so for large sets prefer the spatial index
+#        (within_radius / nearest) to find candidates first
+def pairwise_distance(a_lat1, a_lon1, a_lat2, a_lon2, method='haversine', units='meters', chunk_size=1000000):
+    dist_func = DISTANCE_METHODS[method]
+    unit_factor = DISTANCE_UNITS[units]
+
+    lat1 = np.asarray(a_lat1, dtype=np.float64).ravel()
+    lon1 = np.asarray(a_lon1, dtype=np.float64).ravel()
+    lat2 = np.asarray(a_lat2, dtype=np.float64).ravel()[np.newaxis,:]
+    lon2 = np.asarray(a_lon2, dtype=np.float64).ravel()[np.newaxis,:]
+
+    dist = np.empty( (len(lat1), lat2.shape[1]), dtype=np.float64 )
+    rows_per_chunk = max(1, chunk_size // max(1, lat2.shape[1]))
+    for s in range(0, len(lat1), rows_per_chunk):
+        e = s + rows_per_chunk
+        dist[s:e] = dist_func(lat1[s:e,np.newaxis], lon1[s:e,np.newaxis], lat2, lon2)
+
+    return dist * unit_factor
@@ -7,50 +7,217 @@
 
 # Dependencies
 import matplotlib.pyplot as plt
+import matplotlib.colors as mcolors
 import pandas as pd
 import numpy as np
-import math
 from scipy import stats
 from pprint import pprint
 
-# Functions to find the distance between 2 lat/long coordinates
-# Description: https://pypi.org/project/geopy/1.9.1/
-# from geopy.distance import (distance, great_circle)
+# Spatial index used to find the closest coordinates
+#  without computing the distance to every coordinate
+from Help.spatial_helper_functions import (build_spatial_index, nearest, nearest_geodesic, count_within_radius)
+from Help.resample_helper_functions import (seed_sequence, regression_arrays, bootstrap_linregress,
+                                           permutation_linregress, trend_ci_band)
+
+# Radii (in meters) used for the CTA stop accessibility features
+ACCESS_RADII = [100, 250, 500, 1000]
+
+# Groups of CTA stops used for the accessibility features: label => (column, value)
+#  (None = all stops)
+ACCESS_STOP_GROUPS = { 'CTA': None,
+                       'Bus': ('location_type', 0),
+                       'Rail': ('location_type', 1),
+                       'Accessible': ('wheelchair_boarding', 1) }
 
 # Function to find the a (lat, long) coord that is closest to a reference point
 #  and then return the index of the coord in the provided list of coords
 # Note: If the coordinates are duplicated in the list of coordinates,
 #        then the index of the first coordinate is returned
-# reference point as a tuple (lat, long)
-# stop_coords: a list of tuples with ('stop_lat', 'stop_lon')
-#               generated from the dataframe containing CTA stops
+# coords: a list of tuples with ('stop_lat', 'stop_lon')
+#          generated from the dataframe containing CTA stops
+# r: reference point as a tuple (lat, long)
+def closest_coord(coords, r):
+    # Build a spatial index on the coordinates and query it for the reference point
+    return int( closest_coords(coords, [r])[0] )
+
+# Function to find the index of the closest coord for each of many reference points
+# Use this instead of calling closest_coord() in a loop:
+#  the spatial index is built only once for the whole batch
+# The coords are ranked by geodesic distance (see nearest_geodesic), as with geopy's distance()
+# coords: a list of (lat, long) tuples (or an N x 2 array)
+# ref_points: a list of (lat, long) tuples (or an M x 2 array)
+# Returns: an array with the index into coords of the closest coord to each reference point
+#          (if several coords are equally close, the lowest index)
+def closest_coords(coords, ref_points):
+    coord_array = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+
+    # Collapse duplicate coordinates so that the first index is always returned
+    # (the unique coordinates are kept in order of first appearance, so ties go to the lowest index)
+    _, first_index = np.unique(coord_array, axis=0, return_index=True)
+    first_index = np.sort(first_index)
+    unique_coords = coord_array[first_index]
+
+    # Build the index and find the closest (unique) coordinate for each reference point
+    s_index = build_spatial_index(unique_coords[:,0], unique_coords[:,1])
+    _, idx = nearest_geodesic(s_index, ref_points)
+
+    return first_index[idx]
+
+# Function to calculate the CTA stop accessibility features of each restaurant:
+#  the distance to the nearest stop and the number of stops within each radius,
+#  for all stops and for each group of stops (rail/bus, wheelchair accessible)
+# Arguments:
+#    a_rest_df: dataframe of restaurants (Yelp), with 'latitude' and 'longitude' columns
+#    a_stops_df: dataframe of CTA stops, with 'stop_lat', 'stop_lon',
+#                 'location_type' and 'wheelchair_boarding' columns
+#    radii: list of radii in meters
+#    stop_groups: dictionary of label => (column, value) selecting each group of stops
+# Returns: a dataframe (same index as a_rest_df) with columns such as
+#           'Nearest CTA Stop (m)', 'CTA Stops within 250m', 'Nearest Rail Stop (m)', 'Rail Stops within 500m'
+def gen_stop_access_features(a_rest_df, a_stops_df, radii=ACCESS_RADII, stop_groups=ACCESS_STOP_GROUPS):
+    rest_points = a_rest_df[['latitude', 'longitude']].to_numpy(dtype=np.float64)
+
+    features = {}
+    for (label, group) in stop_groups.items():
+        stops_df = a_stops_df if group is None else a_stops_df.loc[ a_stops_df[group[0]] == group[1] ]
+
+        if len(stops_df) == 0:
+            features[f"Nearest {label} Stop (m)"] = np.full(len(rest_points), np.nan)
+            for r in radii:
+                features[f"{label} Stops within {r}m"] = np.zeros(len(rest_points), dtype=np.int32)
+            continue
 
-#def closest_coord(coords, r):
-    # Find the lat/long tuple closest to the reference point provided
-    # close_point = min( coords, key=lambda z: distance( z, r ).feet )
-    
-    # Get the index of this closest point in the list of coordinates
-    # (Note, if there are dups in the list just return the first index)
-    # retval = coords.index( close_point )
-    # return retval
-
-    # Perform a reverse geocode loopup to find the zipcode associated with this lat/long coord
-    g_response = requests.get(full_url)
-    g_json = g_response.json()
-    
-    # Traverse the results to find a zipcode for this address
-    zipcode = None
-    for a in r_json['results'][0]['address_components']:
-        if 'postal_code' in a['types']:
-            zipcode = a['long_name']
-            
-    # Return the zipcode that was found
-    return zipcode
+        # One spatial index per group of stops, queried with all of the restaurants at once
+        s_index = build_spatial_index(stops_df['stop_lat'], stops_df['stop_lon'])
+
+        dist, _ = nearest(s_index, rest_points, k=1)
+        features[f"Nearest {label} Stop (m)"] = dist
+
+        counts = count_within_radius(s_index, rest_points, radii)
+        for (i, r) in enumerate(radii):
+            features[f"{label} Stops within {r}m"] = counts[:, i]
+
+    return pd.DataFrame(features, index=a_rest_df.index)
+
+# Function to calculate statistics of many columns for the rows in each bin of one column
+# (replaces pd.cut() followed by a separate groupby().agg() for each statistic)
+# The rows are assigned to bins with one searchsorted() and sorted by bin once, so that the
+#  counts/sums of every bin are calculated at once with np.add.reduceat();
+#  the values in each bin are then sorted in place, and the medians and quantiles are read straight out of them
+# Missing (NaN) values are ignored
+# Arguments:
+#    a_data_df: dataframe with the data
+#    a_bin_column: column used to assign the rows to bins, e.g. 'Total CTA Stops'
+#    a_bins: list of bin edges (any spacing)
+#    a_columns: list of columns to calculate the statistics for (default: every other numeric column)
+#    quantiles: list of quantiles to calculate, e.g. [0.25, 0.75] => statistics 'q25' and 'q75' (default: none)
+#    right: if False, bins are [lower, upper) (same as pd.cut(..., right=False)), otherwise (lower, upper]
+#    data_stat: statistic returned as 'data_df'
+#    bin_label: name of the column with the bins (default: a_bin_column + ' Bin')
+# Returns: a dictionary of statistic ('count', 'mean', 'median', 'sem', 'q..') => dataframe with
+#           one row per bin (the bin column, then one column per column in a_columns), plus
+#           'data_df' and 'data_sem_df' for use with gen_bar_plot()
+def gen_binned_stats(a_data_df, a_bin_column, a_bins, a_columns=None, quantiles=None, right=False,
+                     data_stat='median', bin_label=None):
+    edges = np.asarray(a_bins, dtype=np.float64)
+    n_bins = len(edges) - 1
+
+    if a_columns is None:
+        a_columns = [ c for c in a_data_df.select_dtypes(include='number').columns if c != a_bin_column ]
+    if bin_label is None:
+        bin_label = f"{a_bin_column} Bin"
+    if quantiles is None:
+        quantiles = []
+
+    # Bin of each row (rows outside of the bins are dropped)
+    x = a_data_df[a_bin_column].to_numpy(dtype=np.float64)
+    row_bin = np.searchsorted(edges, x, side=('left' if right else 'right')) - 1
+    in_bin = (row_bin >= 0) & (row_bin < n_bins) & ~np.isnan(x)
+    row_bin = row_bin[in_bin]
+
+    # First row of each bin once the rows are sorted by bin
+    bin_rows = np.bincount(row_bin, minlength=n_bins)
+    bin_start = np.concatenate( ([0], np.cumsum(bin_rows)[:-1]) )
+    nonempty = np.flatnonzero(bin_rows > 0)
+    bin_order = np.argsort(row_bin, kind='stable')
+
+    quantile_names = [ 'median' ] + [ f"q{round(q*100, 6):g}" for q in quantiles ]
+    stat_names = ['count', 'mean', 'sem'] + quantile_names
+    results = { name: {} for name in stat_names }
+
+    for c in a_columns:
+        values = a_data_df[c].to_numpy(dtype=np.float64)[in_bin]
+        has_value = ~np.isnan(values)
+        v0 = np.where(has_value, values, 0.0)[bin_order]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Count, sum and sum of squared deviations from the mean for all of the bins at once
+            count = np.zeros(n_bins)
+            total = np.zeros(n_bins)
+            ss = np.zeros(n_bins)
+            if len(nonempty) > 0:
+                count[nonempty] = np.add.reduceat(has_value[bin_order].astype(np.float64), bin_start[nonempty])
+                total[nonempty] = np.add.reduceat(v0, bin_start[nonempty])
+            mean = total / count
+
+            if len(nonempty) > 0:
+                sq_dev = np.where( has_value[bin_order], (v0 - np.repeat(mean, bin_rows))**2, 0.0 )
+                ss[nonempty] = np.add.reduceat(sq_dev, bin_start[nonempty])
+
+            # Standard error of the mean (sample standard deviation, same as stats.sem)
+            sem = np.sqrt( ss / (count - 1) / count )
+        sem[count < 2] = np.nan
+
+        results['count'][c] = count.astype(np.int64)
+        results['mean'][c] = mean
+        results['sem'][c] = sem
+
+        # Sort the values of each bin (already contiguous) in place (NaN values go last)
+        v = values[bin_order]
+        for b in nonempty:
+            v[bin_start[b]:bin_start[b]+bin_rows[b]].sort()
+
+        # Median and quantiles: linear interpolation between the sorted values of each bin
+        for (name, q) in zip(quantile_names, [0.5] + list(quantiles)):
+            pos = bin_start + q * np.maximum(count - 1, 0)
+            lo = np.minimum( np.floor(pos).astype(np.intp), max(len(v) - 1, 0) )
+            hi = np.minimum( np.ceil(pos).astype(np.intp), max(len(v) - 1, 0) )
+            quant = np.full(n_bins, np.nan)
+            ok = count > 0
+            quant[ok] = v[lo[ok]] + (v[hi[ok]] - v[lo[ok]]) * (pos[ok] - lo[ok])
+            results[name][c] = quant
+
+    # One dataframe per statistic, with the bins as the first column (same as pd.cut())
+    bins = pd.Categorical( pd.IntervalIndex.from_breaks(edges, closed=('right' if right else 'left')), ordered=True )
+    stats_dict = {}
+    for name in stat_names:
+        stat_df = pd.DataFrame(results[name], columns=a_columns)
+        stat_df.insert(0, bin_label, bins)
+        stats_dict[name] = stat_df
+
+    stats_dict['data_df'] = stats_dict[data_stat]
+    stats_dict['data_sem_df'] = stats_dict['sem']
+
+    return stats_dict
 
 # Function to generate a linear regression and a set of data points for the trend line
-def gen_linear_trend( a_x, a_y , a_start=None, a_stop=None ):    
+# Optionally, the regression is checked by resampling (see resample_helper_functions):
+#    n_boot: number of bootstrap resamples used for the confidence interval
+#            of the slope and the band around the trend line (0: none)
+#    n_perm: number of permutations used for a permutation test p-value (0: none)
+#    ci: confidence level of the interval and band
+#    seed: seed for the random number generator
+# Points with a missing (NaN) x or y-value are left out of the regression and the resampling alike
+# Returns: a dictionary with 'trend_line', 'trend_x' (the x-values a_x[a_start:a_stop] of the
+#  trend line points) and 'trend_label', plus 'trend_ci' (lists (low, high) of the band at each
+#  trend line point) if n_boot > 0
+def gen_linear_trend( a_x, a_y , a_start=None, a_stop=None, n_boot=0, n_perm=0, ci=0.95, seed=None ):    
+    # Drop the points with a missing value
+    (reg_x, reg_y) = regression_arrays( a_x[a_start:a_stop], a_y[a_start:a_stop] )
+    reg_y = reg_y[:, 0]
+
     # Perform the linear regression
-    lr = stats.linregress(a_x[a_start:a_stop], a_y[a_start:a_stop] )
+    lr = stats.linregress(reg_x, reg_y)
 
     pprint(lr)
     
@@ -62,8 +229,25 @@ def gen_linear_trend( a_x, a_y , a_start=None, a_stop=None ):
     trend_label = f"Trend: Y-value = {lr.slope:.4f} x [ X-value ] + {lr.intercept:.4f}"
     trend_label += f"\nCorrelation (R-Value): {lr.rvalue:.4f}"
     trend_label += f"\n1-(p-Value): {(1-lr.pvalue):.4%}"
+
+    trend_dict = { 'trend_line': trend_line, 'trend_x': list(a_x[a_start:a_stop]), 'trend_label': trend_label }
+
+    # Use independent random streams for the bootstrap and the permutations
+    (boot_seed, perm_seed) = seed_sequence(seed).spawn(2)
+
+    if n_boot > 0:
+        boot_dict = bootstrap_linregress(reg_x, reg_y, n_boot=n_boot, ci=ci, seed=boot_seed)
+        (ci_low, ci_high) = trend_ci_band(boot_dict, a_x[a_start:a_stop], ci=ci)
+
+        trend_dict['trend_ci'] = ( list(ci_low), list(ci_high) )
+        trend_dict['trend_label'] += f"\nSlope {ci:.0%} CI: [{boot_dict['slope_ci'][0]:.4f}, {boot_dict['slope_ci'][1]:.4f}]"
+        trend_dict['trend_label'] += f"\nR-Value {ci:.0%} CI: [{boot_dict['rvalue_ci'][0]:.4f}, {boot_dict['rvalue_ci'][1]:.4f}]"
+
+    if n_perm > 0:
+        perm_pvalue = permutation_linregress(reg_x, reg_y, n_perm=n_perm, seed=perm_seed)
+        trend_dict['trend_label'] += f"\n1-(Permutation p-Value): {(1-perm_pvalue):.4%}"
     
-    return { 'trend_line': trend_line, 'trend_label': trend_label }
+    return trend_dict
 
 # Function to generate an array containing the
 #  moving average of the list provided in the argument
@@ -75,6 +259,25 @@ def moving_average(values, window_size):
     #  using the convolve function to multiply and add
     return np.convolve( values, window, 'same')
 
+# Function to select the marker color for each value
+# The color of a value is color_list[ np.digitize(value, color_thresh) ],
+#  using the last color for values above the highest threshold
+# Arguments:
+#    a_values: array (or Series) of values
+#    a_color_list: list of colors
+#    a_color_thresh: list of thresholds used to select a color
+# Returns: a tuple (boolean array: True for values that are not NaN,
+#                   (N x 4) array of RGBA colors for the values that are not NaN)
+def gen_marker_colors(a_values, a_color_list, a_color_thresh):
+    values = np.asarray(a_values, dtype=np.float64)
+    has_value = ~np.isnan(values)
+
+    # Lookup table of RGBA colors, indexed by threshold bin
+    color_lut = mcolors.to_rgba_array(a_color_list)
+    color_index = np.minimum( np.digitize(values[has_value], a_color_thresh), len(color_lut) - 1 )
+
+    return has_value, color_lut[color_index]
+
 # Function to make a scatter plot of selected columns
 # Arguments: a dictionary 'a_plot_dict' with elements
 #    'data_df': dataframe with data to plot
@@ -83,16 +286,23 @@ def moving_average(values, window_size):
 #    'color_list': list of Colors to use for markers (same size as a_color_thresh)
 #    'color_thresh': list of y-value thresholds used to select a color
 #    'ma_window_size': Window size used for moving average
+#    'data_trend': (optional) List (or Series) with trend line to plot
+#    'data_trend_x': (optional) x-values of the trend line points (see gen_linear_trend; default: x_column)
+#    'data_trend_ci': (optional) Lists (low, high) with the confidence band of the trend line (see gen_linear_trend)
 #    'chart_title': Title of the chart
 #    'y_label': Label for the y-axis
 #    'x_label': Label for the y-axis
 #    'save_file': Save file for the plot
+#    'rasterized': (optional) If True, draw the markers as an image rather than as vectors
+#    'show': (optional) If False, don't display the plot (just save it)
+# Returns: the figure
 
 def gen_scatter_plot(a_plot_dict):
     
     # Extract the arguments from the a_plot_dict arg
     a_chart_title = a_plot_dict['chart_title']
     a_save_file = a_plot_dict['save_file']
+    a_show = a_plot_dict.get('show', True)
 
     a_data_df = a_plot_dict['data_df']
     a_y_label = a_plot_dict['y_label']
@@ -108,6 +318,11 @@ def gen_scatter_plot(a_plot_dict):
         a_trend_plotflag = True
         a_data_trend = a_plot_dict['data_trend']
 
+        # Optional: x-values of the trend line points, and the confidence band (low, high)
+        #  around the trend line (see gen_linear_trend)
+        a_data_trend_x = a_plot_dict.get('data_trend_x')
+        a_data_trend_ci = a_plot_dict.get('data_trend_ci')
+
         # If a trend_label has been specified then display it
         # Otherwise, no trend label will be displayed
         try:
@@ -152,6 +367,9 @@ def gen_scatter_plot(a_plot_dict):
     else:
         a_ma_plotflag = False        
 
+    # Optional: Draw the markers as an image (keeps vector output small for very large scatter plots)
+    a_rasterized = a_plot_dict.get('rasterized', False)
+
     # Generate Scatter Plots for key metrics vs. 'Total CTA Stops'
     # Add trend lines to each and look for patterns
     # Generate a scatter plot
@@ -163,37 +381,19 @@ def gen_scatter_plot(a_plot_dict):
     # Thresholds for selecting colors
     color_threshold_list = a_color_thresh
 
-    # Initialize array of marker colors
-    marker_colors = []
-
     # The value to plot on the y-axis
     c_plotcolumn = a_y_column
 
     # The value to plot on the x-axis
     c_x_column = a_x_column
 
-    # Create the markers by iterating through zipcode
-    for ci in a_data_df.index:
-        # Set the color of the markers based upon temperature
-        c_plotvalue = a_data_df.loc[ci,c_plotcolumn]
-
-        # If the value is not populated for this bin,
-        #  continue to move to the next value
-        if math.isnan(c_plotvalue):
-            continue
-
-        # Select marker color and add it to the list
-        try:
-            marker_colors.append( color_list[ np.digitize(c_plotvalue, color_threshold_list) ] )
-        except IndexError:
-            # If the thresholds were defined improperly and
-            #  the c_plotvalue is higher than the highest threshold value,
-            # Then just set the color to be high highest color in the list
-            marker_colors.append( color_list[ -1 ] )
-            #print(f"IndexError: ci:{ci}: c_plotvalue:{c_plotvalue} => index for color_list:{np.digitize(c_plotvalue, color_threshold_list)}")
+    # Select the marker colors for all of the points at once
+    # (points without a value are not plotted)
+    has_value, marker_colors = gen_marker_colors(a_data_df[c_plotcolumn], color_list, color_threshold_list)
 
     # Plot a scatter plot
-    plt.scatter(a_data_df[c_x_column], a_data_df[c_plotcolumn], c=marker_colors, alpha=0.5)
+    plt.scatter(a_data_df[c_x_column][has_value], a_data_df[c_plotcolumn][has_value], c=marker_colors, alpha=0.5,
+                rasterized=a_rasterized)
 
     # Add a value for this point if it is the maximum and minimum points
     # Get the index values for value is max and min
@@ -280,7 +480,9 @@ def gen_scatter_plot(a_plot_dict):
         # x-values so that the x-values will be monotonically increasing
         
         # Pair up the x and y values the represent the trend line
-        trend_points = zip(a_data_df[c_x_column], a_data_trend )
+        if a_data_trend_x is None:
+            a_data_trend_x = a_data_df[c_x_column]
+        trend_points = zip(a_data_trend_x, a_data_trend )
         
         # Sort the (x,y) pairs based upon the x-values in the pairs
         sorted_trend_points = sorted( trend_points, key=lambda p: p[0])
@@ -289,6 +491,15 @@ def gen_scatter_plot(a_plot_dict):
         plt.plot([x for (x,y) in sorted_trend_points ],
                  [y for (x,y) in sorted_trend_points ],
                  color='k', linestyle='dashed')
+
+        # Shade the confidence band around the trend line if it has been specified
+        if a_data_trend_ci is not None:
+            ci_x = np.asarray(a_data_trend_x, dtype=np.float64)[:len(a_data_trend_ci[0])]
+            ci_order = np.argsort(ci_x, kind='stable')
+            plt.fill_between(ci_x[ci_order],
+                             np.asarray(a_data_trend_ci[0])[ci_order],
+                             np.asarray(a_data_trend_ci[1])[ci_order],
+                             color='k', alpha=0.15, linewidth=0)
         
         # Add a key for the trend line if it has been specified
         if a_data_trend_label != None:
@@ -314,11 +525,23 @@ def gen_scatter_plot(a_plot_dict):
     # plt.hlines(y=0, xmin=-90, xmax=+90, alpha=0.5)
 
     plt.tight_layout()
-    plt.show()
+    if a_show:
+        plt.show()
     
     # Save the plot
     fig.savefig(a_save_file)
 
+    return fig
+
+# Function to generate a template for drawing a series of bar plots (see gen_bar_plot)
+# The figure and axes (including the secondary axis, once one is needed) are created once
+#  and reused by every chart drawn with the template
+# Returns: a dictionary 'bar_template'
+def gen_bar_template():
+    fig, ax = plt.subplots(figsize=(10,5))
+
+    return { 'fig': fig, 'ax': ax, 'ax2': None, 'artists': [] }
+
 # Function to make a bar plot of selected columns
 # Arguments: a dictionary 'a_plot_dict' with elements
 #    'chart_title': Title of the chart
@@ -332,6 +555,9 @@ def gen_scatter_plot(a_plot_dict):
 #    'color_thresh': list of y-value thresholds used to select a color
 
 #    'data_trend': List (or Series) with trend line to plot on primary axis
+#    'data_trend_x': (optional) x-values (bar positions) of the trend line points (see gen_linear_trend;
+#                    default: 0, 1, 2, ...)
+#    'data_trend_ci': (optional) Lists (low, high) with the confidence band of the trend line (see gen_linear_trend)
 
 #    'y2_label': Label for the secondary y-axis
 #    'y2_column': Column to be plotted on secondary y-axis
@@ -339,12 +565,20 @@ def gen_scatter_plot(a_plot_dict):
 #    'x_label': Label for the x-axis
 #    'x_column': Column to be plotted on x-axis of scatter plot
 
-def gen_bar_plot(a_plot_dict):
+#    'show': (optional) If False, don't display the plot (just save it)
+
+# a_template: (optional) template generated by gen_bar_template()
+#    The chart is drawn on the template's figure, replacing the chart that was drawn on it before
+#    (much faster than creating a new figure when drawing many charts with the same layout)
+# Returns: the figure
+
+def gen_bar_plot(a_plot_dict, a_template=None):
     
     # Extract the arguments from the a_plot_dict arg
     # Chart level parameters
     a_chart_title = a_plot_dict['chart_title']
     a_save_file = a_plot_dict['save_file']
+    a_show = a_plot_dict.get('show', True)
 
     # X-axis parameters
     a_x_label = a_plot_dict['x_label']
@@ -363,6 +597,11 @@ def gen_bar_plot(a_plot_dict):
         a_trend_plotflag = True
         a_data_trend = a_plot_dict['data_trend']
 
+        # Optional: x-values of the trend line points, and the confidence band (low, high)
+        #  around the trend line (see gen_linear_trend)
+        a_data_trend_x = a_plot_dict.get('data_trend_x')
+        a_data_trend_ci = a_plot_dict.get('data_trend_ci')
+
         # If a trend_label has been specified then display it
         # Otherwise, no trend label will be displayed
         try:
@@ -390,8 +629,18 @@ def gen_bar_plot(a_plot_dict):
     else:
         a_y2_plotflag = False        
 
-    # Generate the plot
-    fig, ax = plt.subplots(figsize=(10,5))
+    # Generate the plot (or reuse the figure and axes of a template)
+    if a_template is None:
+        fig, ax = plt.subplots(figsize=(10,5))
+        ax2 = None
+        artists = []
+    else:
+        fig, ax, ax2 = a_template['fig'], a_template['ax'], a_template['ax2']
+
+        # Remove the data from the previous chart drawn with the template
+        for artist in a_template['artists']:
+            artist.remove()
+        artists = a_template['artists'] = []
 
     # Color scheme for markers
     color_list = a_color_list
@@ -399,43 +648,29 @@ def gen_bar_plot(a_plot_dict):
     # Thresholds for selecting colors
     color_threshold_list = a_color_thresh
 
-    # Generate bars by iterating through each bin
-    for ci in a_data_df.index:
-
-        # Set color bars based upon temperature
-        c_plotvalue = a_data_df.loc[ci,a_y_column]
-
-        # If temperature is not populated for this bin,
-        #  continue to move to the next bin
-        if math.isnan(c_plotvalue):
-            continue
-
-        # Set the error bars using the standard deviation of the mean (sem)
-        c_sem = a_data_sem_df.loc[ci,a_y_column]
-
-        # Select bar color 
-        try:
-            c_color = color_list[ np.digitize(c_plotvalue, color_threshold_list) ]
-        except IndexError:
-            # If the thresholds were defined improperly and
-            #  the c_plotvalue is higher than the highest threshold value,
-            # Then just set the color to be high highest color in the list
-            c_color = color_list[ -1 ]
-     
-        # Set the placement location for the value text
-        text_offset = 0
-        c_textloc = c_plotvalue + text_offset
+    # Select the bar colors for all of the bins at once
+    # (bins without a value are not plotted)
+    has_value, bar_colors = gen_marker_colors(a_data_df[a_y_column], color_list, color_threshold_list)
+    bar_x = a_data_df.index[has_value]
+    bar_values = a_data_df[a_y_column].to_numpy(dtype=np.float64)[has_value]
 
-        # Get the value associated with this bar
-        c_valuetext = f"{c_plotvalue:.1f}"
+    # Set the error bars using the standard deviation of the mean (sem)
+    bar_sem = a_data_sem_df.loc[bar_x, a_y_column].to_numpy(dtype=np.float64)
 
-        # Plot a bar
-        plt.bar(ci, c_plotvalue, color=c_color, yerr=c_sem, error_kw={'alpha':0.75})
+    # Plot all of the bars
+    # (the error bars are a separate container, so they are removed along with the bars)
+    bars = ax.bar(bar_x, bar_values, color=bar_colors, yerr=bar_sem, error_kw={'alpha':0.75})
+    artists.append(bars)
+    if bars.errorbar is not None:
+        artists.append(bars.errorbar)
 
-        # Place the value on this bar
-        plt.text(ci, c_textloc, c_valuetext , ha='left')
+    # Place the value on each bar
+    text_offset = 0
+    for (ci, c_plotvalue) in zip(bar_x, bar_values):
+        artists.append( ax.text(ci, c_plotvalue + text_offset, f"{c_plotvalue:.1f}", ha='left') )
 
-    plt.xticks(range(len(a_data_df.index)), a_data_df[a_x_column], rotation=45)
+    ax.set_xticks(range(len(a_data_df.index)))
+    ax.set_xticklabels(a_data_df[a_x_column], rotation=45)
 
     # Set the y access limits to add room for the value labels
     y_bot = a_data_df[a_y_column].min()
@@ -444,16 +679,15 @@ def gen_bar_plot(a_plot_dict):
 
     y_bot -= y_range * 0.15
     y_top += y_range * 0.15
-    plt.ylim( bottom=y_bot, top=y_top)
 
     # Adjust the tick marks to be more granular
     #plt.yticks(np.arange(round(y_bot,-1),round(y_top,-1),step=10))
 
-    plt.xlabel(a_x_label)
-    plt.ylabel(a_y_label)
-    plt.title(a_chart_title)
+    ax.set_xlabel(a_x_label)
+    ax.set_ylabel(a_y_label)
+    ax.set_title(a_chart_title)
 
-    plt.grid(True, axis='y', color='0.75', alpha=0.5)
+    ax.grid(True, axis='y', color='0.75', alpha=0.5)
     # plt.legend(loc="best")
 
     # Add a key for the color coding used on the plot
@@ -463,42 +697,67 @@ def gen_bar_plot(a_plot_dict):
         box_fmt = {'boxstyle':'square', 'facecolor':color_list[i], 'alpha':0.75}
 
         # Plot this
-        plt.text(0.99, 0.97 -((len(color_threshold_list)-i-1)*0.08),
-                 box_text, transform=ax.transAxes, fontsize=11,
-                 verticalalignment='top', horizontalalignment='right', bbox=box_fmt)
+        artists.append( ax.text(0.99, 0.97 -((len(color_threshold_list)-i-1)*0.08),
+                                box_text, transform=ax.transAxes, fontsize=11,
+                                verticalalignment='top', horizontalalignment='right', bbox=box_fmt) )
 
     # Add a horizontal line at the y = 0% level
     # plt.hlines(y=0, xmin=-1, xmax=len(a_data_df.index), alpha='0.5')
 
     # Add a trend line on the primary axis if it has been specified
     if a_trend_plotflag:
-        plt.plot(range(len(a_data_trend)), a_data_trend,
-                 color='k', linestyle='dashed')
+        if a_data_trend_x is None:
+            a_data_trend_x = range(len(a_data_trend))
+        artists.extend( ax.plot(a_data_trend_x, a_data_trend,
+                                color='k', linestyle='dashed') )
+
+        # Shade the confidence band around the trend line if it has been specified
+        if a_data_trend_ci is not None:
+            artists.append( ax.fill_between(a_data_trend_x, a_data_trend_ci[0], a_data_trend_ci[1],
+                                            color='k', alpha=0.15, linewidth=0) )
         
         
         # Add a key for the trend line if it has been specified
         if a_data_trend_label != None:
             box_text = a_data_trend_label
             box_fmt = {'boxstyle':'square', 'facecolor':"gray", 'alpha':0.75}
-            plt.text(a_data_trend_label_loc_h, a_data_trend_label_loc_v,
-                     box_text, transform=ax.transAxes,
-                     fontsize=9, verticalalignment='top', horizontalalignment='center', bbox=box_fmt)
+            artists.append( ax.text(a_data_trend_label_loc_h, a_data_trend_label_loc_v,
+                                    box_text, transform=ax.transAxes,
+                                    fontsize=9, verticalalignment='top', horizontalalignment='center', bbox=box_fmt) )
+
+    ax.set_ylim( bottom=y_bot, top=y_top)
 
     # Add plot on secondary axis if it has been specified
     if a_y2_plotflag:
         # Align the x-axis of the secondary plot with the primary plot
-        ax2 = ax.twinx()
+        if ax2 is None:
+            ax2 = ax.twinx()
+            if a_template is not None:
+                a_template['ax2'] = ax2
         
         # Create the line plot using same x-axis as primary plot
-        ax2.plot(range(len(a_data_df.index)), a_data_df[a_y2_column],
-                 color='brown', marker='o', linestyle='solid')
+        artists.extend( ax2.plot(range(len(a_data_df.index)), a_data_df[a_y2_column],
+                                 color='brown', marker='o', linestyle='solid') )
         
         # Set the label for the y2 secondary axis
         ax2.set_ylabel(a_y2_label, color="brown")
+        ax2.set_visible(True)
+        ax2.relim()
+        ax2.autoscale_view(scalex=False)
+
+    elif ax2 is not None:
+        ax2.set_visible(False)
+
+    # Fit the x-axis to this chart's bins
+    # (set explicitly, so a template doesn't keep the range of the charts drawn on it before)
+    ax.set_xlim( -0.5 - 0.1 * len(a_data_df.index), len(a_data_df.index) - 0.5 + 0.1 * len(a_data_df.index) )
     
-    plt.tight_layout()
-    plt.show()
+    fig.tight_layout()
+    if a_show:
+        plt.show()
         
     # Save the plot
     fig.savefig(a_save_file)
 
+    return fig
+
@@ -0,0 +1,359 @@
+# yelp_helper_functions.py
+# AUTHOR: Jeff Brown
+#
+# A collection of functions used to harvest restaurant data
+# from the Yelp Fusion API (via yelpapi: https://github.com/gfairchild/yelpapi)
+# in support of the Yelp Data collection with Project 1
+
+# Dependencies
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from Help.spatial_helper_functions import haversine_meters
+
+# Columns in the Yelp restaurant datasets (e.g. Data/Yelp_Restaurants_Chicago.csv)
+# plus the Yelp business id, which is used to remove duplicates
+YELP_COLUMNS = ["zip","city","state","name","price","rating","review_count","type","latitude","longitude","id"]
+
+# Token bucket rate limiter, shared by all of the worker threads
+# Up to 'burst' requests can be made at once, then requests are
+#  limited to 'rate' requests per second on average
+class TokenBucket:
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Wait until a token is available, then take it
+    def take(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+
+                wait = (1.0 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+# Function to convert the businesses in a Yelp search response into restaurant rows
+# Only businesses that are in the zipcode searched and that have
+#  the category searched are kept (same rules as Restaurants_By_City_and_Type)
+# a_task: dictionary describing the search (see yelp_search_tasks)
+# a_businesses: list of businesses from the Yelp search response
+def yelp_restaurant_rows(a_task, a_businesses):
+    rows = []
+    for restaurant in a_businesses:
+        # Filter out all the searched restaurants that do not match the search criteria
+        restaurant_type = None
+        for category in restaurant.get("categories", []):
+            if category["alias"] == a_task["category"]:
+                restaurant_type = category["title"]
+                break
+
+        if restaurant_type is None:
+            continue
+
+        if str(restaurant["location"]["zip_code"]) != str(a_task["zip"]):
+            continue
+
+        rows.append({"zip":a_task["zip"],
+                     "city":a_task["city"],
+                     "state":a_task["state"],
+                     "name":restaurant["name"],
+                     "price":restaurant.get("price", "$$"),
+                     "rating":restaurant["rating"],
+                     "review_count":restaurant["review_count"],
+                     "type":restaurant_type,
+                     "latitude":restaurant["coordinates"]["latitude"],
+                     "longitude":restaurant["coordinates"]["longitude"],
+                     "id":restaurant["id"]})
+
+    return rows
+
+# Function to generate the list of Yelp searches (tasks) for a city:
+#  one search per zipcode (centroid) and restaurant category
+# a_zipcode_df: dataframe of zipcodes with columns "zip","primary_city","state","latitude","longitude"
+# a_type_dict: dictionary of restaurant type => Yelp category alias (e.g. Yelp_Type_Dict)
+# Returns: a list of dictionaries, each with a unique 'key' used in the journal
+def yelp_search_tasks(a_zipcode_df, a_type_dict, radius=8000, limit=30):
+    tasks = []
+    for category in a_type_dict.values():
+        for row in a_zipcode_df.itertuples():
+            tasks.append({"key": f"{row.zip}|{category}",
+                          "zip": row.zip,
+                          "city": row.primary_city,
+                          "state": row.state,
+                          "category": category,
+                          "latitude": float(row.latitude),
+                          "longitude": float(row.longitude),
+                          "radius": radius,
+                          "limit": limit})
+
+    return tasks
+
+# Function to read the journal of a previous (possibly interrupted) harvest
+# Returns: a dictionary of task key => journal record for each completed task
+def read_yelp_journal(a_journal_file):
+    completed = {}
+    if not os.path.exists(a_journal_file):
+        return completed
+
+    with open(a_journal_file, encoding="utf-8") as journal:
+        for line in journal:
+            # An interrupted run may have left a partial last line
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            completed[record["key"]] = record
+
+    return completed
+
+# Function to run a list of Yelp searches with a bounded pool of worker threads
+# Each completed search is appended to the journal (one JSON line per search) as soon as it finishes,
+#  so an interrupted harvest can be resumed by calling this function again with the same journal
+# Arguments:
+#    a_search: function that runs one Yelp search, e.g. yelp_api.search_query
+#    a_tasks: list of searches (see yelp_search_tasks)
+#    a_journal_file: location of the journal (JSONL)
+#    rate: maximum number of Yelp requests per second
+#    max_workers: maximum number of requests in flight at the same time
+#    retries: number of times a failed search is retried (with backoff) before giving up
+#    task_rows: function converting (task, businesses) into rows
+# Returns: a dictionary of task key => journal record for all of the completed searches
+#  Each record has the task 'key', the restaurant 'rows', and 'total' / 'returned' business counts
+# Note: Searches that still fail after all retries are not journaled,
+#        so they are retried the next time the harvest is run
+def run_yelp_searches(a_search, a_tasks, a_journal_file, rate=5.0, max_workers=4, retries=3,
+                      task_rows=yelp_restaurant_rows):
+    completed = read_yelp_journal(a_journal_file)
+    pending = [ t for t in a_tasks if t["key"] not in completed ]
+
+    bucket = TokenBucket(rate, burst=max_workers)
+    journal_lock = threading.Lock()
+
+    # End a partial last line left by an interrupted run, so the first new record starts on its own line
+    partial_line = False
+    if os.path.exists(a_journal_file) and os.path.getsize(a_journal_file) > 0:
+        with open(a_journal_file, "rb") as journal:
+            journal.seek(-1, os.SEEK_END)
+            partial_line = journal.read(1) != b"\n"
+
+    with open(a_journal_file, "a", encoding="utf-8") as journal:
+        if partial_line:
+            journal.write("\n")
+
+        # Function run by the worker threads for each search
+        def run_task(a_task):
+            for attempt in range(retries + 1):
+                bucket.take()
+                try:
+                    response = a_search(categories=a_task["category"],
+                                        latitude=a_task["latitude"], longitude=a_task["longitude"],
+                                        radius=int(a_task["radius"]), limit=a_task["limit"])
+                    break
+                except Exception as e:
+                    if attempt == retries:
+                        print(f"Search Fail: {a_task['key']}: {e}")
+                        return None
+                    time.sleep(2 ** attempt)
+
+            businesses = response.get("businesses", [])
+            record = {"key": a_task["key"],
+                      "rows": task_rows(a_task, businesses),
+                      "total": response.get("total", len(businesses)),
+                      "returned": len(businesses)}
+
+            # Stream the result to the journal
+            with journal_lock:
+                journal.write(json.dumps(record) + "\n")
+                journal.flush()
+
+            return record
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for record in executor.map(run_task, pending):
+                if record is not None:
+                    completed[record["key"]] = record
+
+    return completed
+
+# Function to harvest Yelp restaurants for a list of zipcodes and restaurant types
+# (replacement for calling Restaurants_By_City_and_Type for each type)
+# Arguments:
+#    a_search: function that runs one Yelp search, e.g. yelp_api.search_query
+#    a_zipcode_df: dataframe of zipcodes (see yelp_search_tasks)
+#    a_type_dict: dictionary of restaurant type => Yelp category alias
+#    a_journal_file: location of the journal used to resume an interrupted harvest
+#    output_file: if provided, the restaurants are also saved to this CSV file
+#    rate, max_workers, retries: see run_yelp_searches()
+#    radius, limit: Yelp search radius (meters) and number of results per search
+# Returns: a dataframe of restaurants (YELP_COLUMNS), in task order, with
+#  businesses found by more than one search (overlapping radii) included only once per type
+def harvest_yelp_restaurants(a_search, a_zipcode_df, a_type_dict, a_journal_file, output_file=None,
+                             rate=5.0, max_workers=4, retries=3, radius=8000, limit=30):
+    tasks = yelp_search_tasks(a_zipcode_df, a_type_dict, radius=radius, limit=limit)
+    completed = run_yelp_searches(a_search, tasks, a_journal_file,
+                                  rate=rate, max_workers=max_workers, retries=retries)
+
+    rows = [ r for t in tasks if t["key"] in completed for r in completed[t["key"]]["rows"] ]
+
+    restaurants_df = pd.DataFrame(rows, columns=YELP_COLUMNS)
+    restaurants_df = restaurants_df.drop_duplicates(subset=["id", "type"]).reset_index(drop=True)
+
+    if output_file is not None:
+        restaurants_df.to_csv(output_file, index=False)
+
+    return restaurants_df
+
+# Maximum search radius (meters) allowed by the Yelp search API
+YELP_MAX_RADIUS = 40000
+
+# Function to generate the search (task) for one tile of the adaptive quadtree
+# The search is centered on the tile, with a radius that covers the whole tile
+# a_city: dictionary with "city", "state" and "zips" (list of zipcodes in the city)
+# a_bbox: tile bounding box (lat_min, lat_max, lon_min, lon_max)
+# a_tile_id: path of the tile in the quadtree, e.g. "0" (root) or "0-2-1"
+def yelp_tile_task(a_city, a_category, a_bbox, a_tile_id, limit=50):
+    (lat_min, lat_max, lon_min, lon_max) = a_bbox
+    lat = (lat_min + lat_max) / 2
+    lon = (lon_min + lon_max) / 2
+
+    return {"key": f"{a_city['city']}|{a_city['state']}|{a_category}|{a_tile_id}",
+            "tile": a_tile_id,
+            "bbox": list(a_bbox),
+            "city": a_city["city"],
+            "state": a_city["state"],
+            "zips": a_city["zips"],
+            "category": a_category,
+            "latitude": lat,
+            "longitude": lon,
+            "radius": float(np.ceil( haversine_meters(lat, lon, lat_max, lon_max) )),
+            "limit": limit}
+
+# Function to split a tile task into the tasks for its 4 quadrants
+def split_yelp_tile(a_task):
+    (lat_min, lat_max, lon_min, lon_max) = a_task["bbox"]
+    lat = (lat_min + lat_max) / 2
+    lon = (lon_min + lon_max) / 2
+    city = {"city": a_task["city"], "state": a_task["state"], "zips": a_task["zips"]}
+
+    quadrants = [ (lat_min, lat, lon_min, lon), (lat_min, lat, lon, lon_max),
+                  (lat, lat_max, lon_min, lon), (lat, lat_max, lon, lon_max) ]
+
+    return [ yelp_tile_task(city, a_task["category"], q, f"{a_task['tile']}-{i}", a_task["limit"])
+             for (i, q) in enumerate(quadrants) ]
+
+# Function to convert the businesses found by a tile search into restaurant rows
+# Businesses are kept if they have the category searched and are in one of the city's zipcodes
+#  (the zipcode of the business is used, since a tile may cover several zipcodes)
+def yelp_tile_rows(a_task, a_businesses):
+    city_zips = set( str(z) for z in a_task["zips"] )
+
+    rows = []
+    for restaurant in a_businesses:
+        zipcode = str(restaurant["location"]["zip_code"])
+        if zipcode in city_zips:
+            rows.extend( yelp_restaurant_rows(dict(a_task, zip=zipcode), [restaurant]) )
+
+    return rows
+
+# Function to check whether a tile is close enough to the city to be worth searching:
+#  i.e. at least one of the city's zipcode centroids is within the tile's search radius (plus a margin)
+def yelp_tile_in_city(a_task, a_zip_lat, a_zip_lon, margin=3000):
+    dist = haversine_meters(a_task["latitude"], a_task["longitude"], a_zip_lat, a_zip_lon)
+
+    return bool( (dist <= a_task["radius"] + margin).any() )
+
+# Function to harvest Yelp restaurants using an adaptive quadtree of search tiles
+# Each (city, restaurant type) starts with one tile covering all of the city's zipcodes:
+#  - A tile that returns a full page of results (i.e. Yelp has more) is split into 4 tiles
+#  - A tile that returns all of its results (including none) is not split
+#  - Tiles that are too big for the Yelp radius limit are split without being searched
+#  - Tiles that are away from all of the city's zipcodes are pruned
+# Arguments:
+#    a_search: function that runs one Yelp search, e.g. yelp_api.search_query
+#    a_zipcode_df: dataframe of zipcodes with columns "zip","primary_city","state","latitude","longitude"
+#    a_city_list: list of dictionaries with "city" and "state" (e.g. city_list)
+#    a_type_dict: dictionary of restaurant type => Yelp category alias
+#    a_journal_file: location of the journal used to resume an interrupted harvest
+#    limit: number of results per search (Yelp maximum is 50)
+#    min_radius: tiles with a smaller search radius than this are not split further
+#    rate, max_workers, retries: see run_yelp_searches()
+# Returns: a tuple of dataframes
+#    (restaurants (YELP_COLUMNS),
+#     report per city: 'API Calls', 'Unique Businesses', 'Businesses per Call', 'Truncated Tiles')
+def adaptive_yelp_harvest(a_search, a_zipcode_df, a_city_list, a_type_dict, a_journal_file,
+                          limit=50, min_radius=250, rate=5.0, max_workers=4, retries=3):
+    rows = []
+    report = []
+
+    for c in a_city_list:
+        city_zip_df = a_zipcode_df.loc[ (a_zipcode_df["primary_city"] == c["city"]) &
+                                        (a_zipcode_df["state"] == c["state"]) ]
+        zip_lat = city_zip_df["latitude"].to_numpy(dtype=np.float64)
+        zip_lon = city_zip_df["longitude"].to_numpy(dtype=np.float64)
+        city = {"city": c["city"], "state": c["state"], "zips": [ str(z) for z in city_zip_df["zip"] ]}
+
+        if len(city_zip_df) == 0:
+            continue
+
+        # Root tile: bounding box of the zipcode centroids, plus a margin
+        bbox = (zip_lat.min() - 0.02, zip_lat.max() + 0.02, zip_lon.min() - 0.02, zip_lon.max() + 0.02)
+        level = [ yelp_tile_task(city, category, bbox, "0", limit) for category in a_type_dict.values() ]
+
+        city_rows = []
+        calls = 0
+        truncated = 0
+
+        # Search the quadtree one level at a time (the searches in a level run concurrently)
+        while len(level) > 0:
+            # Tiles too big for a single search are split right away
+            too_big = [ t for t in level if t["radius"] > YELP_MAX_RADIUS ]
+            level = [ t for t in level if t["radius"] <= YELP_MAX_RADIUS ]
+            next_level = [ q for t in too_big for q in split_yelp_tile(t) ]
+
+            completed = run_yelp_searches(a_search, level, a_journal_file, rate=rate,
+                                          max_workers=max_workers, retries=retries, task_rows=yelp_tile_rows)
+
+            for t in level:
+                if t["key"] not in completed:
+                    continue
+                record = completed[t["key"]]
+                calls += 1
+                city_rows.extend(record["rows"])
+
+                # Split tiles that returned a full page of results
+                if record["returned"] >= t["limit"] and record["total"] > record["returned"]:
+                    if t["radius"] / 2 < min_radius:
+                        truncated += 1
+                    else:
+                        next_level.extend( split_yelp_tile(t) )
+
+            level = [ t for t in next_level if yelp_tile_in_city(t, zip_lat, zip_lon) ]
+
+        city_df = pd.DataFrame(city_rows, columns=YELP_COLUMNS).drop_duplicates(subset=["id", "type"])
+        rows.append(city_df)
+
+        unique_businesses = city_df["id"].nunique()
+        report.append({"city": c["city"], "state": c["state"],
+                       "API Calls": calls,
+                       "Unique Businesses": unique_businesses,
+                       "Businesses per Call": unique_businesses / calls if calls else np.nan,
+                       "Truncated Tiles": truncated})
+
+    restaurants_df = pd.concat(rows, ignore_index=True) if rows else pd.DataFrame(columns=YELP_COLUMNS)
+
+    return restaurants_df, pd.DataFrame(report)
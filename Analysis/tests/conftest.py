@@ -0,0 +1,14 @@
+# conftest.py
+# AUTHOR: Jeff Brown
+#
+# Test configuration: the tests import the helper modules as Help.xxx (as the notebooks do),
+# so the Analysis directory is put on the import path and made the working directory
+# (the helpers locate the data files relative to it, e.g. "../Data")
+
+import os
+import sys
+
+ANALYSIS_DIR = os.path.dirname( os.path.dirname( os.path.abspath(__file__) ) )
+
+sys.path.insert( 0, ANALYSIS_DIR )
+os.chdir( ANALYSIS_DIR )
@@ -0,0 +1,61 @@
+# replay_server.py
+# AUTHOR: Jeff Brown
+#
+# A local HTTP server used by the tests in place of the Census and Yelp APIs
+# Each request is answered by a handler function, and every request (and when it arrived) is recorded
+# so the tests can check what was (and wasn't) sent
+
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, urlencode
+from urllib.request import urlopen
+
+# Class for a local server running in a background thread
+# a_handler: function (path, query dict) => (status, JSON-serializable body)
+class ReplayServer:
+    def __init__(self, a_handler):
+        self.handler = a_handler
+        self.requests = []
+        self.times = []
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                query = { k: v[0] for (k, v) in parse_qs(parts.query).items() }
+                with server.lock:
+                    server.requests.append( (parts.path, query) )
+                    server.times.append( time.monotonic() )
+
+                status, body = server.handler(parts.path, query)
+                data = json.dumps(body).encode()
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer( ("127.0.0.1", 0), Handler )
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+# Function to send a GET request to the server and decode the JSON response
+def get_json(a_url, a_params):
+    with urlopen( a_url + "?" + urlencode(a_params) ) as response:
+        return json.loads( response.read() )
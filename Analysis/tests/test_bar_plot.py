@@ -0,0 +1,45 @@
+# test_bar_plot.py
+# AUTHOR: Jeff Brown
+#
+# Tests of the bar charts of the transport analysis (transport_helper_functions)
+
+import matplotlib
+matplotlib.use("Agg")
+
+import matplotlib.image as mpimg
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from Help.transport_helper_functions import gen_bar_plot, gen_bar_template
+
+# Function to build the plot_dict of a bar chart with n bins
+def bar_plot_dict(a_n, a_save_file, a_scale=1.0, y2=False):
+    data_df = pd.DataFrame( { 'Bin': [ f"{i}-{i+1}" for i in range(a_n) ],
+                              'Rating': a_scale * (1 + np.arange(a_n) % 4) } )
+    sem_df = pd.DataFrame( { 'Bin': data_df['Bin'], 'Rating': 0.1 * a_scale * (1 + np.arange(a_n) % 3) } )
+
+    plot_dict = { 'chart_title': f"{a_n} bins", 'save_file': a_save_file, 'show': False,
+                  'x_label': "Bin", 'x_column': 'Bin',
+                  'data_df': data_df, 'data_sem_df': sem_df, 'y_label': "Rating", 'y_column': 'Rating',
+                  'color_list': ['red', 'orange', 'green'], 'color_thresh': [2, 3],
+                  'data_trend': list( a_scale * (1 + 0.3 * np.arange(a_n)) ), 'data_trend_label': "Trend" }
+    if y2:
+        plot_dict.update( { 'y2_column': 'Rating', 'y2_label': "Rating" } )
+
+    return plot_dict
+
+def test_template_matches_a_fresh_render(tmp_path):
+    template = gen_bar_template()
+    gen_bar_plot( bar_plot_dict(12, str(tmp_path / "first.png"), 3.0, y2=True), template )
+    gen_bar_plot( bar_plot_dict(5, str(tmp_path / "template.png")), template )
+
+    plt.close('all')
+    gen_bar_plot( bar_plot_dict(5, str(tmp_path / "fresh.png")) )
+
+    ax = template['ax']
+    assert len(ax.containers) == 2
+    assert len(ax.lines) == 1
+    assert len(ax.collections) == 1
+    assert ax.get_xlim() == plt.gcf().axes[0].get_xlim()
+    assert ( mpimg.imread(tmp_path / "template.png") == mpimg.imread(tmp_path / "fresh.png") ).all()
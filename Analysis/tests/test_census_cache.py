@@ -0,0 +1,147 @@
+# test_census_cache.py
+# AUTHOR: Jeff Brown
+#
+# Tests of the local cache of Census API results (census_helper_functions),
+# run against a local server that replays recorded ACS5 responses
+
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from Help.census_helper_functions import cached_census_get
+from replay_server import ReplayServer, get_json
+
+# Recorded response of the 2017 ACS5 API for a few Chicago ZCTAs (general and race variables)
+RECORDED_FILE = os.path.join( os.path.dirname(__file__), "data", "census_acs5_2017_zcta.json" )
+
+ZCTA = 'zip code tabulation area:*'
+
+# Class used in place of the census library's ACS5 client: the same get() call and result format,
+# sent to the replay server
+class ReplayACS5Client:
+    def __init__(self, a_url, a_year=2017):
+        self.url = a_url
+        self.default_year = a_year
+
+    def get(self, a_fields, a_geo, year=None):
+        year = self.default_year if year is None else year
+        data = get_json( f"{self.url}/data/{year}/acs/acs5", { 'get': ",".join(a_fields), 'for': a_geo['for'] } )
+
+        return [ dict( zip(data[0], row) ) for row in data[1:] ]
+
+# Function to build a replay handler that answers from a recorded table (header row + data rows)
+def table_handler(a_table):
+    header = a_table[0]
+
+    def handler(a_path, a_query):
+        fields = a_query['get'].split(",")
+        geo_field = a_query['for'].split(":")[0]
+        if any( f not in header for f in fields ):
+            return 400, { 'error': "unknown variable" }
+
+        idx = [ header.index(f) for f in fields + [geo_field] ]
+        return 200, [ fields + [geo_field] ] + [ [ row[i] for i in idx ] for row in a_table[1:] ]
+
+    return handler
+
+# Function to get the variables requested from the server
+def requested_variables(a_server):
+    return [ q['get'].split(",") for (_, q) in a_server.requests ]
+
+@pytest.fixture
+def recorded():
+    with open(RECORDED_FILE) as f:
+        return json.load(f)
+
+@pytest.fixture
+def cache_file(tmp_path):
+    return str(tmp_path / "census_cache.sqlite")
+
+def test_repeat_pull_is_served_from_cache(recorded, cache_file):
+    fields = ("NAME", "B19013_001E", "B01003_001E")
+
+    with ReplayServer( table_handler(recorded) ) as server:
+        c = SimpleNamespace( acs5=ReplayACS5Client(server.url) )
+
+        first = cached_census_get(c, fields, ZCTA, cache_file=cache_file)
+        second = cached_census_get(c, fields, ZCTA, cache_file=cache_file)
+
+    assert len(server.requests) == 1
+    assert first == second
+    assert len(first) == len(recorded) - 1
+    assert first[0] == { 'NAME': "ZCTA5 60601", 'B19013_001E': "110215", 'B01003_001E': "13887",
+                         'zip code tabulation area': "60601" }
+
+def test_cached_result_matches_the_api(recorded, cache_file):
+    fields = ("B02001_001E", "B02001_002E", "NAME")
+
+    with ReplayServer( table_handler(recorded) ) as server:
+        c = SimpleNamespace( acs5=ReplayACS5Client(server.url) )
+
+        direct = c.acs5.get(fields, {'for': ZCTA})
+        cached_census_get(c, fields, ZCTA, cache_file=cache_file)
+        cached = cached_census_get(c, fields, ZCTA, cache_file=cache_file)
+
+    assert sorted( direct, key=lambda r: r['zip code tabulation area'] ) == cached
+
+def test_new_variables_fetch_only_the_missing_columns(recorded, cache_file):
+    with ReplayServer( table_handler(recorded) ) as server:
+        c = SimpleNamespace( acs5=ReplayACS5Client(server.url) )
+
+        cached_census_get(c, ("B19013_001E", "B01003_001E"), ZCTA, cache_file=cache_file)
+        rows = cached_census_get(c, ("B01003_001E", "B02001_003E", "B19013_001E"), ZCTA, cache_file=cache_file)
+
+    assert requested_variables(server) == [ ["B19013_001E", "B01003_001E"], ["B02001_003E"] ]
+    assert list(rows[0].keys()) == ["B01003_001E", "B02001_003E", "B19013_001E", 'zip code tabulation area']
+    assert rows[0]['B02001_003E'] == "1148"
+
+def test_years_are_cached_separately(recorded, cache_file):
+    with ReplayServer( table_handler(recorded) ) as server:
+        c = SimpleNamespace( acs5=ReplayACS5Client(server.url) )
+
+        cached_census_get(c, ("B19013_001E",), ZCTA, cache_file=cache_file)
+        cached_census_get(c, ("B19013_001E",), ZCTA, year=2016, cache_file=cache_file)
+        cached_census_get(c, ("B19013_001E",), ZCTA, year=2016, cache_file=cache_file)
+
+    assert [ p for (p, _) in server.requests ] == [ "/data/2017/acs/acs5", "/data/2016/acs/acs5" ]
+
+def test_cache_hit_for_all_zctas_is_fast(cache_file):
+    # ~33k ZCTAs x 8 variables, as in one topic of demographic_data_analysis.ipynb
+    fields = [ f"B01001_{i:03d}E" for i in range(1, 9) ]
+    table = [ fields + ['zip code tabulation area'] ] + \
+            [ [ str(z * 10 + i) for i in range(8) ] + [f"{z:05d}"] for z in range(600, 33720) ]
+
+    with ReplayServer( table_handler(table) ) as server:
+        c = SimpleNamespace( acs5=ReplayACS5Client(server.url) )
+        cached_census_get(c, fields, ZCTA, cache_file=cache_file)
+
+        start = time.perf_counter()
+        rows = cached_census_get(c, fields, ZCTA, cache_file=cache_file)
+        elapsed = time.perf_counter() - start
+
+    assert len(server.requests) == 1
+    assert len(rows) == len(table) - 1
+    assert rows[-1]['B01001_008E'] == str(33719 * 10 + 7)
+    assert elapsed < 1.0
+
+def test_concurrent_pulls_share_the_cache(cache_file):
+    # Requests run concurrently (as in fetch_census_aliases) all write to the same cache
+    fields = [ f"B01001_{i:03d}E" for i in range(1, 41) ]
+    table = [ fields + ['zip code tabulation area'] ] + \
+            [ [ str(z + i) for i in range(40) ] + [f"{z:05d}"] for z in range(600, 10600) ]
+
+    with ReplayServer( table_handler(table) ) as server:
+        c = SimpleNamespace( acs5=ReplayACS5Client(server.url) )
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list( executor.map( lambda i: cached_census_get(c, fields[i:i+5], ZCTA, cache_file=cache_file),
+                                          range(0, 40, 5) ) )
+        cached = cached_census_get(c, fields, ZCTA, cache_file=cache_file)
+
+    assert len(server.requests) == 8
+    assert all( len(r) == len(table) - 1 for r in results )
+    assert cached[0] == dict( zip( fields + ['zip code tabulation area'], table[1] ) )
@@ -0,0 +1,46 @@
+# test_chart_render.py
+# AUTHOR: Jeff Brown
+#
+# Tests of rendering a manifest of charts (chart_helper_functions)
+
+import subprocess
+import sys
+
+import matplotlib
+matplotlib.use("Agg")
+
+import matplotlib.image as mpimg
+import matplotlib.pyplot as plt
+import pytest
+
+from Help import chart_helper_functions
+from Help.chart_helper_functions import render_chart
+from Help.transport_helper_functions import gen_bar_plot
+from test_bar_plot import bar_plot_dict
+from conftest import ANALYSIS_DIR
+
+@pytest.fixture
+def fresh_worker(monkeypatch):
+    monkeypatch.setattr(chart_helper_functions, 'worker_bar_template', None)
+
+def test_bar_charts_of_one_worker_match_fresh_renders(tmp_path, fresh_worker):
+    specs = [ { 'plot': 'bar', 'plot_dict': bar_plot_dict(n, str(tmp_path / f"worker_{i}.png"), scale, y2=(i == 0)) }
+              for (i, (n, scale)) in enumerate( [ (12, 3.0), (5, 1.0), (8, 0.5) ] ) ]
+
+    for spec in specs:
+        render_chart(spec)
+
+    for (i, spec) in enumerate(specs):
+        plt.close('all')
+        gen_bar_plot( dict(spec['plot_dict'], save_file=str(tmp_path / f"fresh_{i}.png")) )
+
+        assert ( mpimg.imread(tmp_path / f"worker_{i}.png") == mpimg.imread(tmp_path / f"fresh_{i}.png") ).all()
+
+def test_renderer_does_not_import_the_pipeline():
+    # The render worker processes import the renderer, so it stays clear of the pipeline's stage modules
+    code = "import sys, Help.chart_helper_functions; print(','.join(sorted(sys.modules)))"
+    modules = subprocess.run( [sys.executable, "-c", code], cwd=ANALYSIS_DIR, capture_output=True, text=True,
+                              check=True ).stdout.strip().split(",")
+
+    assert 'Help.pipeline_helper_functions' not in modules
+    assert 'Help.license_helper_functions' not in modules
@@ -0,0 +1,45 @@
+# test_dataset_store.py
+# AUTHOR: Jeff Brown
+#
+# Tests of the typed Parquet dataset layer (dataset_helper_functions)
+
+import shutil
+
+import pandas as pd
+import pytest
+
+from Help.dataset_helper_functions import (dataset_files, convert_csv_datasets, load_dataset, save_dataset,
+                                           read_csv_dataset)
+from Help.grid_helper_functions import GRID_CELL_COLUMN, grid_cells
+
+@pytest.fixture
+def data_dir(tmp_path):
+    # Copy of the Yelp restaurants CSV, so the Parquet file is built from scratch
+    csv_file, _ = dataset_files('yelp_chicago')
+    shutil.copy( csv_file, dataset_files('yelp_chicago', str(tmp_path))[0] )
+
+    return str(tmp_path)
+
+def test_price_tiers_survive_the_round_trip(data_dir):
+    csv_df = pd.read_csv( dataset_files('yelp_chicago', data_dir)[0] )
+    expected = csv_df['price'].fillna("").str.count(r"\$")
+
+    convert_csv_datasets(['yelp_chicago'], data_dir)
+    loaded_df = load_dataset('yelp_chicago', data_dir=data_dir)
+
+    assert set( csv_df['price'].dropna() ) == { "$", "$$", "$$$", "$$$$" }
+    assert ( loaded_df['price'].to_numpy() == expected.to_numpy() ).all()
+    assert loaded_df['price'].max() == 4
+
+    # Saving a loaded (already typed) dataframe again doesn't change it
+    save_dataset(loaded_df, 'yelp_chicago', data_dir)
+    pd.testing.assert_frame_equal( load_dataset('yelp_chicago', data_dir=data_dir), loaded_df )
+
+def test_dataset_matches_the_csv(data_dir):
+    convert_csv_datasets(['yelp_chicago'], data_dir)
+    loaded_df = load_dataset('yelp_chicago', data_dir=data_dir)
+    typed_df = read_csv_dataset('yelp_chicago', data_dir)
+
+    pd.testing.assert_frame_equal( loaded_df, typed_df, check_dtype=False, check_categorical=False )
+    assert ( loaded_df[GRID_CELL_COLUMN].to_numpy() ==
+             grid_cells(loaded_df['latitude'], loaded_df['longitude']) ).all()
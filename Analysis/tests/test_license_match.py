@@ -0,0 +1,30 @@
+# test_license_match.py
+# AUTHOR: Jeff Brown
+#
+# Tests of matching the Yelp restaurants to business licenses (license_match_helper_functions)
+
+import numpy as np
+import pandas as pd
+
+from Help.license_match_helper_functions import (build_license_index, match_yelp_to_licenses,
+                                                 match_yelp_to_licenses_parallel)
+
+LICENSES = pd.DataFrame( { 'DOING BUSINESS AS NAME': ["TACO PLACE", "NOODLE BAR", "PIZZA SPOT"],
+                           'LATITUDE': [41.8800, 41.9000, 41.9200],
+                           'LONGITUDE': [-87.6300, -87.6500, -87.6700],
+                           'DATE ISSUED': pd.to_datetime(["2019-03-01", "2019-03-05", "2020-03-10"]) } )
+
+# Restaurants next to each license; the last one has no zipcode
+YELP = pd.DataFrame( { 'name': ["Taco Place", "Noodle Bar", "Pizza Spot"],
+                       'latitude': [41.88001, 41.90001, 41.92001],
+                       'longitude': [-87.63001, -87.65001, -87.67001],
+                       'zip': ["60601", "60602", np.nan] } )
+
+def test_parallel_matches_equal_the_serial_matches():
+    index = build_license_index(LICENSES)
+
+    serial_df = match_yelp_to_licenses(YELP, index)
+    parallel_df = match_yelp_to_licenses_parallel(YELP, index, workers=2)
+
+    assert serial_df['Date_Issued'].notna().all()
+    pd.testing.assert_frame_equal(parallel_df, serial_df)
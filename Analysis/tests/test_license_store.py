@@ -0,0 +1,92 @@
+# test_license_store.py
+# AUTHOR: Jeff Brown
+#
+# Tests of the incremental updates of the restaurant license store (license_helper_functions)
+
+import pandas as pd
+import pytest
+
+from Help.license_helper_functions import (LICENSE_EXPORT_COLUMNS, LICENSE_HASH_COLUMN, update_license_store,
+                                           load_licenses, load_license_aggregates, license_aggregates,
+                                           license_hashes)
+
+# Licenses in the first export: (license id, license number, name, ward, zip, date issued)
+FIRST_EXPORT = [ (501, 1001, "TACO PLACE", 1, "60601", "03/01/2019"),
+                 (502, 1002, "NOODLE BAR", 2, "60602", "03/05/2019"),
+                 (503, 1001, "TACO PLACE", 1, "60601", "03/01/2020"),
+                 (504, 1003, "PIZZA SPOT", 3, "60603", "03/10/2020") ]
+
+# Function to write a license export (CSV) with the given licenses
+def write_export(a_file, a_licenses):
+    rows = [ { 'LICENSE ID': license_id, 'LICENSE NUMBER': number, 'LEGAL NAME': name + " LLC", 'DOING BUSINESS AS NAME': name,
+               'LICENSE CODE': 1006, 'CITY': "CHICAGO", 'WARD': ward, 'ZIP CODE': zipcode, 'DATE ISSUED': issued,
+               'LATITUDE': 41.88 + number % 100 / 1000, 'LONGITUDE': -87.63 }
+             for (license_id, number, name, ward, zipcode, issued) in a_licenses ]
+    pd.DataFrame(rows, columns=LICENSE_EXPORT_COLUMNS).to_csv(a_file, index=False)
+
+@pytest.fixture
+def store(tmp_path):
+    files = { 'export': str(tmp_path / "licenses.csv"),
+              'store': str(tmp_path / "store.parquet"),
+              'unique': str(tmp_path / "unique.parquet"),
+              'aggregates': str(tmp_path / "counts.json"),
+              'watermark': str(tmp_path / "watermark.json") }
+
+    write_export(files['export'], FIRST_EXPORT)
+    assert update_license_store(*files.values())['mode'] == 'full'
+
+    return files
+
+def test_corrections_replace_stored_licenses(store):
+    # The 2019 NOODLE BAR license moved to ward 4, a license was issued on the watermark day
+    #  (with a lower license number), and the 2020 TACO PLACE license is unchanged
+    write_export( store['export'], [ (502, 1002, "NOODLE BAR", 4, "60602", "03/05/2019"),
+                                     (503, 1001, "TACO PLACE", 1, "60601", "03/01/2020"),
+                                     (505, 1000, "BAGEL SHOP", 5, "60605", "03/10/2020"),
+                                     (505, 1000, "BAGEL SHOP", 5, "60605", "03/10/2020") ] )
+
+    result = update_license_store(*store.values())
+
+    assert result == { 'mode': 'delta', 'inserted': 1, 'replaced': 1 }
+
+    store_df = load_licenses(store['store'])
+    assert len(store_df) == 5
+    assert store_df.loc[ store_df['LICENSE NUMBER'] == 1002, 'WARD' ].tolist() == [4]
+
+    # The counts match a full recalculation
+    aggregates = load_license_aggregates(store['aggregates'])
+    expected = license_aggregates(store_df)
+    for name in ['ward', 'zip', 'year']:
+        assert aggregates[name].sort_index().to_dict() == expected[name].sort_index().to_dict()
+
+    unique_df = load_licenses(store['unique']).set_index('DOING BUSINESS AS NAME')
+    assert unique_df.loc["NOODLE BAR", 'WARD'] == 4
+    assert sorted(unique_df.index) == ["BAGEL SHOP", "NOODLE BAR", "PIZZA SPOT", "TACO PLACE"]
+
+def test_unchanged_export_is_a_no_op(store):
+    assert update_license_store(*store.values()) == { 'mode': 'delta', 'inserted': 0, 'replaced': 0 }
+
+def test_records_with_the_same_license_number_and_date(tmp_path):
+    # Two different records for one license number and issue date, and a repeated license id
+    files = { 'export': str(tmp_path / "licenses.csv"),
+              'store': str(tmp_path / "store.parquet"),
+              'unique': str(tmp_path / "unique.parquet"),
+              'aggregates': str(tmp_path / "counts.json"),
+              'watermark': str(tmp_path / "watermark.json") }
+    write_export( files['export'], FIRST_EXPORT + [ (506, 1003, "PIZZA SPOT", 5, "60603", "03/10/2020"),
+                                                    (506, 1003, "PIZZA SPOT", 6, "60603", "03/10/2020") ] )
+
+    assert update_license_store(*files.values()) == { 'mode': 'full', 'inserted': 5, 'replaced': 0 }
+    counts = load_license_aggregates(files['aggregates'])['ward'].to_dict()
+
+    for _ in range(2):
+        assert update_license_store(*files.values()) == { 'mode': 'delta', 'inserted': 0, 'replaced': 0 }
+        assert len( load_licenses(files['store']) ) == 5
+        assert load_license_aggregates(files['aggregates'])['ward'].to_dict() == counts
+
+    assert counts == { '1': 2, '2': 1, '3': 1, '5': 1 }
+
+def test_record_hashes_survive_the_round_trip(store):
+    store_df = load_licenses(store['store'])
+
+    assert ( license_hashes(store_df) == store_df[LICENSE_HASH_COLUMN].to_numpy() ).all()
@@ -0,0 +1,34 @@
+# test_linear_trend.py
+# AUTHOR: Jeff Brown
+#
+# Tests of the trend lines of the transport analysis charts (transport_helper_functions)
+
+import matplotlib
+matplotlib.use("Agg")
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from Help.transport_helper_functions import gen_linear_trend
+
+X = [ 0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0 ]
+Y = [ 5.0, 1.2, 2.1, np.nan, 3.8, 5.2, 5.9, np.nan, 8.1, 9.0 ]
+
+def test_missing_values_are_left_out_of_the_regression():
+    trend = gen_linear_trend( pd.Series(X), pd.Series(Y), a_start=1, n_boot=200, n_perm=200, seed=3 )
+
+    x = np.array(X[1:])
+    y = np.array(Y[1:])
+    has_value = ~np.isnan(y)
+    lr = stats.linregress(x[has_value], y[has_value])
+
+    assert np.allclose( trend['trend_line'], lr.slope * x + lr.intercept )
+    assert np.isfinite( trend['trend_ci'] ).all()
+    assert "nan" not in trend['trend_label']
+
+def test_trend_points_start_at_a_start():
+    trend = gen_linear_trend( X, Y, a_start=2, a_stop=9, n_boot=200, seed=3 )
+
+    assert trend['trend_x'] == X[2:9]
+    assert len(trend['trend_line']) == len(trend['trend_ci'][0]) == len(trend['trend_x'])
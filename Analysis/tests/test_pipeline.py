@@ -0,0 +1,31 @@
+# test_pipeline.py
+# AUTHOR: Jeff Brown
+#
+# Tests of the pipeline stage fingerprints (pipeline_helper_functions)
+
+from Help import pipeline_helper_functions as pipeline
+from Help.pipeline_helper_functions import PIPELINE_STAGES, stage_fingerprint, stage_modules
+
+def test_stage_modules_follow_helper_imports():
+    modules = stage_modules( PIPELINE_STAGES['parquet_yelp_chicago']['func'] )
+
+    assert 'Help.dataset_helper_functions' in modules
+    assert 'Help.geography_helper_functions' in modules
+    assert 'Help.spatial_helper_functions' in modules
+
+def test_stage_version_changes_the_fingerprint():
+    stage = dict( PIPELINE_STAGES['grid_rollups'] )
+    before = stage_fingerprint(stage)
+
+    assert stage_fingerprint(stage) == before
+    assert stage_fingerprint( dict(stage, version=2) ) != before
+
+def test_helper_source_changes_the_fingerprint(monkeypatch):
+    stage = PIPELINE_STAGES['grid_rollups']
+    before = stage_fingerprint(stage)
+
+    file_hash = pipeline.file_hash
+    monkeypatch.setattr( pipeline, 'file_hash',
+                         lambda f, c=None: file_hash(f, c) + ("x" if f.endswith("grid_helper_functions.py") else "") )
+
+    assert stage_fingerprint(stage) != before
@@ -0,0 +1,30 @@
+# test_polygon_index.py
+# AUTHOR: Jeff Brown
+#
+# Tests of the point-in-polygon index (polygon_helper_functions)
+
+import numpy as np
+
+from Help.polygon_helper_functions import build_polygon_index, locate_points, locate_points_exact
+
+# L-shaped polygon whose inner corner is a long horizontal edge across the middle of the grid,
+# next to a square that shares part of its boundary
+L_SHAPE = np.array( [ (0.0, 0.0), (10.0, 0.0), (10.0, 3.3), (3.3, 3.3), (3.3, 10.0), (0.0, 10.0), (0.0, 0.0) ] )
+SQUARE = np.array( [ (3.3, 3.3), (10.0, 3.3), (10.0, 10.0), (3.3, 10.0), (3.3, 3.3) ] )
+
+def test_grid_matches_exact_containment():
+    index = build_polygon_index( ['L', 'square'], [ [L_SHAPE], [SQUARE] ], grid_size=16 )
+
+    rng = np.random.default_rng(11)
+    x = rng.uniform(-1, 11, 200000)
+    y = rng.uniform(-1, 11, 200000)
+
+    assert ( locate_points(index, y, x) == locate_points_exact(index, x, y) ).all()
+
+def test_points_near_a_horizontal_edge():
+    index = build_polygon_index( ['L'], [ [L_SHAPE] ], grid_size=16 )
+
+    x = np.linspace(3.5, 9.9, 50)
+
+    assert ( locate_points(index, np.full(50, 3.2), x) == 0 ).all()
+    assert ( locate_points(index, np.full(50, 3.4), x) == -1 ).all()
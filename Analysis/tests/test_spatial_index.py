@@ -0,0 +1,19 @@
+# test_spatial_index.py
+# AUTHOR: Jeff Brown
+#
+# Tests of the spatial index of lat/long coordinates (spatial_helper_functions)
+
+import numpy as np
+
+from Help.spatial_helper_functions import build_spatial_index, nearest, haversine_meters
+
+def test_missing_neighbors_have_an_infinite_distance():
+    index = build_spatial_index( [41.88, 41.90], [-87.63, -87.65] )
+
+    dist, idx = nearest( index, [ (41.89, -87.64) ], k=3 )
+
+    assert np.isfinite( dist[0, :2] ).all()
+    assert np.allclose( np.sort(dist[0, :2]),
+                        np.sort( haversine_meters(41.89, -87.64, np.array([41.88, 41.90]), np.array([-87.63, -87.65])) ) )
+    assert np.isinf( dist[0, 2] )
+    assert idx[0, 2] == index['size']
@@ -0,0 +1,137 @@
+# test_yelp_harvest.py
+# AUTHOR: Jeff Brown
+#
+# Tests of the resumable, rate-limited Yelp harvester (yelp_helper_functions),
+# run against a local mock of the Yelp search endpoint
+
+import time
+from urllib.error import HTTPError
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from Help.yelp_helper_functions import (TokenBucket, yelp_search_tasks, read_yelp_journal, harvest_yelp_restaurants)
+from replay_server import ReplayServer, get_json
+
+# Restaurant types searched (restaurant type => Yelp category alias)
+TYPE_DICT = { 'Pizza': 'pizza', 'Mexican': 'mexican', 'Thai': 'thai' }
+
+# Zipcodes searched
+ZIPCODE_DF = pd.DataFrame({ 'zip': [60601, 60602, 60603, 60604],
+                            'primary_city': "Chicago", 'state': "IL",
+                            'latitude': [41.886, 41.883, 41.880, 41.878],
+                            'longitude': [-87.622, -87.629, -87.626, -87.629] })
+
+SEARCH_PATH = "/v3/businesses/search"
+
+# Function to generate the mock search response: 2 restaurants of the category in every zipcode
+#  (so each search also returns the restaurants of the neighboring zipcodes, as the 8 km radii overlap)
+def mock_businesses(a_category):
+    businesses = []
+    for z in ZIPCODE_DF['zip']:
+        for i in range(2):
+            businesses.append({ 'id': f"{a_category}-{z}-{i}",
+                                'name': f"{a_category.title()} Place {z} {i}",
+                                'categories': [ { 'alias': a_category, 'title': a_category.title() } ],
+                                'location': { 'zip_code': str(z) },
+                                'price': "$" * (i + 1),
+                                'rating': 3.5 + i / 2,
+                                'review_count': 10 * (i + 1),
+                                'coordinates': { 'latitude': 41.88, 'longitude': -87.63 } })
+
+    return { 'total': len(businesses), 'businesses': businesses }
+
+# Function to build a mock Yelp handler, failing the searches for the categories in a_failing
+def yelp_handler(a_failing=()):
+    def handler(a_path, a_query):
+        if a_path != SEARCH_PATH:
+            return 404, { 'error': "not found" }
+        if a_query['categories'] in a_failing:
+            return 503, { 'error': "unavailable" }
+
+        return 200, mock_businesses(a_query['categories'])
+
+    return handler
+
+# Function to build the search function passed to the harvester (in place of yelp_api.search_query)
+def yelp_search(a_server):
+    return lambda **kwargs: get_json(a_server.url + SEARCH_PATH, kwargs)
+
+def test_token_bucket_limits_the_rate():
+    bucket = TokenBucket(rate=50, burst=5)
+
+    start = time.monotonic()
+    for _ in range(30):
+        bucket.take()
+    elapsed = time.monotonic() - start
+
+    # The first 5 tokens are available at once, the other 25 at 50 per second
+    assert elapsed >= 25 / 50 * 0.95
+
+def test_harvest_is_rate_limited(tmp_path):
+    rate = 20.0
+    workers = 4
+
+    with ReplayServer( yelp_handler() ) as server:
+        harvest_yelp_restaurants( yelp_search(server), ZIPCODE_DF, TYPE_DICT, str(tmp_path / "journal.jsonl"),
+                                  rate=rate, max_workers=workers, retries=0 )
+
+    # One request per zipcode and category, never more than burst + rate * t requests in any t seconds
+    times = np.sort( np.array(server.times) ) - min(server.times)
+    assert len(times) == len(ZIPCODE_DF) * len(TYPE_DICT)
+    assert np.all( np.arange(1, len(times) + 1) <= workers + rate * times + 1 )
+
+def test_harvest_deduplicates_and_filters(tmp_path):
+    with ReplayServer( yelp_handler() ) as server:
+        restaurants_df = harvest_yelp_restaurants( yelp_search(server), ZIPCODE_DF, TYPE_DICT,
+                                                   str(tmp_path / "journal.jsonl"), rate=100, retries=0 )
+
+    # Every search returns the restaurants of all 4 zipcodes, but each is kept once, in its own zipcode
+    assert len(restaurants_df) == len(ZIPCODE_DF) * len(TYPE_DICT) * 2
+    assert restaurants_df['id'].is_unique
+    assert ( restaurants_df['id'].str.split("-").str[1].astype(int) == restaurants_df['zip'] ).all()
+
+def test_interrupted_harvest_resumes_from_journal(tmp_path):
+    journal_file = str(tmp_path / "journal.jsonl")
+    output_file = str(tmp_path / "restaurants.csv")
+    tasks = yelp_search_tasks(ZIPCODE_DF, TYPE_DICT)
+
+    # First run: the 'thai' searches fail, so they are not journaled
+    with ReplayServer( yelp_handler(a_failing=('thai',)) ) as server:
+        partial_df = harvest_yelp_restaurants( yelp_search(server), ZIPCODE_DF, TYPE_DICT, journal_file,
+                                               rate=100, retries=0 )
+
+    assert set( read_yelp_journal(journal_file) ) == { t['key'] for t in tasks if t['category'] != 'thai' }
+    assert set( partial_df['type'] ) == { 'Pizza', 'Mexican' }
+
+    # The run was killed while writing a line
+    with open(journal_file, "a", encoding="utf-8") as journal:
+        journal.write('{"key": "60601|thai", "rows": [')
+
+    # Second run: only the searches missing from the journal are sent
+    with ReplayServer( yelp_handler() ) as server:
+        resumed_df = harvest_yelp_restaurants( yelp_search(server), ZIPCODE_DF, TYPE_DICT, journal_file,
+                                               output_file=output_file, rate=100, retries=0 )
+
+    assert sorted( f"{q['latitude']}|{q['categories']}" for (_, q) in server.requests ) == \
+           sorted( f"{t['latitude']}|thai" for t in tasks if t['category'] == 'thai' )
+
+    # Every search is now in the journal, so a third run sends nothing
+    with ReplayServer( yelp_handler() ) as server:
+        harvest_yelp_restaurants( yelp_search(server), ZIPCODE_DF, TYPE_DICT, journal_file, rate=100, retries=0 )
+
+    assert len(server.requests) == 0
+
+    # Same result as a harvest that was never interrupted
+    with ReplayServer( yelp_handler() ) as server:
+        full_df = harvest_yelp_restaurants( yelp_search(server), ZIPCODE_DF, TYPE_DICT,
+                                            str(tmp_path / "full_journal.jsonl"), rate=100, retries=0 )
+
+    pd.testing.assert_frame_equal(resumed_df, full_df)
+    assert len( pd.read_csv(output_file) ) == len(full_df)
+
+def test_mock_search_errors_raise():
+    with ReplayServer( yelp_handler(a_failing=('pizza',)) ) as server:
+        with pytest.raises(HTTPError):
+            yelp_search(server)(categories='pizza', latitude=41.88, longitude=-87.63, radius=8000, limit=30)